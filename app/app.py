@@ -1,37 +1,76 @@
+import asyncio
 import os
 import uuid
 import secrets
 import string
 import hashlib
+import hmac
+import math
+import re
 import json
 import base64
+import bisect
+import collections
+import contextlib
+import contextvars
+import cProfile
+import functools
+import gzip
+import ipaddress
+import logging
+import random
+import shutil
+import signal
+import sys
+import threading
+import time
+import traceback
+import tracemalloc
+import pathlib
 from datetime import datetime, timedelta
 
 from aiohttp import web
-import aiohttp_jinja2
-import jinja2
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from aiohttp.abc import AbstractAccessLogger
+from aiohttp.log import access_logger as aiohttp_access_logger
+import markupsafe
 import sqlite3
 import aiosqlite
 
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
-from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.backends import default_backend
-from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+# cryptography, jinja2/aiohttp_jinja2 and APScheduler are imported where they are first
+# used, so importing this module (tests, tools, the CLI) stays fast and side-effect free.
+
+try:
+    import brotli
+except ImportError:  # Optional: responses fall back to gzip
+    brotli = None
+
+try:
+    import orjson
+except ImportError:  # Optional: the stdlib json module is used instead
+    orjson = None
 
-# Determine VERSION from file
 VERSION_FILE_PATH = os.path.join(os.path.dirname(__file__), "VERSION")
-VERSION = "unknown"
-if os.path.isfile(VERSION_FILE_PATH):
-    with open(VERSION_FILE_PATH, "r") as version_file:
-        VERSION = version_file.read().strip() or "unknown"
-else:
+
+
+@functools.lru_cache(maxsize=None)
+def read_version():
+    """Read VERSION from the file next to app.py, or from the repository root in development."""
+    if os.path.isfile(VERSION_FILE_PATH):
+        with open(VERSION_FILE_PATH, "r") as version_file:
+            return version_file.read().strip() or "unknown"
     parent_dir_version_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "VERSION")
     if os.path.isfile(parent_dir_version_path):
         with open(parent_dir_version_path, "r") as version_file:
-            VERSION = version_file.read().strip() + "-development"
-    else:
-        VERSION = "unknown"
+            return version_file.read().strip() + "-development"
+    return "unknown"
+
+
+def __getattr__(name):
+    # VERSION is read on first access instead of at import
+    if name == "VERSION":
+        return read_version()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 # Load configuration from environment variables
 HTTPS_ONLY = os.getenv("HTTPS_ONLY", "false").lower() == "true"  # Default to False
@@ -42,18 +81,439 @@ PURGE_INTERVAL_MINUTES = int(os.getenv("PURGE_INTERVAL_MINUTES", 5))
 MAX_ATTEMPTS = int(os.getenv("MAX_ATTEMPTS", 5))
 ANALYTICS_SCRIPT = os.getenv("ANALYTICS_SCRIPT", "")
 ANALYTICS_SCRIPT_CSP = os.getenv("ANALYTICS_SCRIPT_CSP", "")
+# Structured (JSON lines) access log, written by a background thread
+ACCESS_LOG = os.getenv("ACCESS_LOG", "true").lower() == "true"
+ACCESS_LOG_FILE = os.getenv("ACCESS_LOG_FILE", "")  # Default: stdout
+# Sample rates per route prefix, e.g. "/static=0.01,/check-limit=0.1"
+ACCESS_LOG_SAMPLE_RATES = os.getenv("ACCESS_LOG_SAMPLE_RATES", "")
+ACCESS_LOG_QUEUE_SIZE = int(os.getenv("ACCESS_LOG_QUEUE_SIZE", 10000))
+ACCESS_LOG_FLUSH_SECONDS = float(os.getenv("ACCESS_LOG_FLUSH_SECONDS", 1))
+# Log the span tree of requests slower than this many milliseconds (0 disables tracing)
+TRACE_SLOW_REQUEST_MS = float(os.getenv("TRACE_SLOW_REQUEST_MS", 1000))
+# Append traces as OTLP JSON lines to this file (default: no export)
+TRACE_EXPORT_FILE = os.getenv("TRACE_EXPORT_FILE", "")
+# Fraction of traces under the slow threshold that are exported as well
+TRACE_EXPORT_SAMPLE_RATE = float(os.getenv("TRACE_EXPORT_SAMPLE_RATE", 0))
+# Prometheus-format /metrics endpoint
+METRICS = os.getenv("METRICS", "true").lower() == "true"
+# Serve /metrics on a separate port instead of the main one (default: main port)
+METRICS_PORT = int(os.getenv("METRICS_PORT", 0))
+# Client addresses or networks allowed to scrape /metrics
+METRICS_ALLOWED_IPS = os.getenv("METRICS_ALLOWED_IPS", "127.0.0.1,::1")
+# Timeout for each readiness check in seconds
+READINESS_TIMEOUT_SECONDS = float(os.getenv("READINESS_TIMEOUT_SECONDS", 1))
+# Measure event loop lag and log what blocks the loop
+LOOP_MONITOR = os.getenv("LOOP_MONITOR", "true").lower() == "true"
+# How often the loop is probed, in milliseconds
+LOOP_MONITOR_INTERVAL_MS = float(os.getenv("LOOP_MONITOR_INTERVAL_MS", 100))
+# Log a stack sample when the loop is blocked longer than this many milliseconds
+LOOP_LAG_THRESHOLD_MS = float(os.getenv("LOOP_LAG_THRESHOLD_MS", 200))
+# Enable the on-demand profiler (/admin/profile and SIGUSR1/SIGUSR2)
+PROFILING = os.getenv("PROFILING", "false").lower() == "true"
+# Directory profiles and allocation snapshots are written to
+PROFILE_DIR = os.getenv("PROFILE_DIR", "./profiles")
+# Default and maximum profile duration in seconds
+PROFILE_SECONDS = int(os.getenv("PROFILE_SECONDS", 30))
+PROFILE_MAX_SECONDS = 300
+# Client addresses or networks allowed to use the admin endpoints
+ADMIN_ALLOWED_IPS = os.getenv("ADMIN_ALLOWED_IPS", "127.0.0.1,::1")
+# Expected number of live secrets, used to size the download code filter
+CODE_FILTER_CAPACITY = int(os.getenv("CODE_FILTER_CAPACITY", 100000))
+# Reload templates on change and skip the rendered-page cache (default: on for development)
+TEMPLATE_AUTO_RELOAD = os.getenv("TEMPLATE_AUTO_RELOAD", "")
+# Directory for compiled templates (default: a per-user directory in the system temp dir)
+TEMPLATE_BYTECODE_CACHE_DIR = os.getenv("TEMPLATE_BYTECODE_CACHE_DIR") or None
+
+STORAGE_FULL_ERROR = "Storage is full. Please try again later."
+IDEMPOTENCY_CONFLICT_ERROR = "This Idempotency-Key was already used for a different secret."
+# HTTP status of store_secret errors other than validation errors (400)
+STORE_ERROR_STATUS = {STORAGE_FULL_ERROR: 503, IDEMPOTENCY_CONFLICT_ERROR: 422}
 
 # Constants to avoid abuse
 MAX_CLIENT_SIZE = 1024 * 768  # 0.75MB
 MAX_SECRET_SIZE = 1024 * 512  # 0.5MB
 MAX_KEY_LENGTH = 1024  # Maximum key length in characters
+# Where secrets and quota counters live: "sqlite" (default) or "memory" (nothing on disk)
+STORAGE = os.getenv("STORAGE", "sqlite").lower()
+# Memory storage: total size of stored secrets in bytes (default: 256 MB)
+MEMORY_STORE_MAX_BYTES = int(os.getenv("MEMORY_STORE_MAX_BYTES", 256 * 1024 * 1024))
+# Memory storage: "reject" new secrets when full, or "evict" the ones expiring soonest
+MEMORY_STORE_WHEN_FULL = os.getenv("MEMORY_STORE_WHEN_FULL", "reject").lower()
+# Failed unlock attempts: "batched" counts them in memory and writes them every
+# ATTEMPTS_FLUSH_SECONDS, "sync" commits every attempt. Deletion at MAX_ATTEMPTS is always
+# committed immediately.
+ATTEMPTS_DURABILITY = os.getenv("ATTEMPTS_DURABILITY", "batched").lower()
+ATTEMPTS_FLUSH_SECONDS = float(os.getenv("ATTEMPTS_FLUSH_SECONDS", 5))
+# How often the admin stats are reconciled against the database, in minutes
+STATS_RECONCILE_MINUTES = int(os.getenv("STATS_RECONCILE_MINUTES", 60))
+# Load shedding: concurrency limits per priority class ("critical", "normal", "low"),
+# and the latency and in-flight thresholds past which low (then normal) requests are shed
+LOAD_SHEDDING = os.getenv("LOAD_SHEDDING", "true").lower() == "true"
+PRIORITY_LIMITS = os.getenv("PRIORITY_LIMITS", "normal=256,low=64")
+OVERLOAD_LATENCY_MS = float(os.getenv("OVERLOAD_LATENCY_MS", 1000))
+OVERLOAD_QUEUE_DEPTH = int(os.getenv("OVERLOAD_QUEUE_DEPTH", 256))
+# Idempotency-Key on /lock and /api/lock: how long a key replays its download code, and
+# how many keys are remembered at most
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", 3600))
+IDEMPOTENCY_MAX_KEYS = int(os.getenv("IDEMPOTENCY_MAX_KEYS", 10000))
+# 404 responses: "auto" sends the page to browsers (Accept: text/html) and a short plain
+# text body to other clients, "html" always sends the page, "plain" never does
+NOT_FOUND_RESPONSE = os.getenv("NOT_FOUND_RESPONSE", "auto").lower()
+# Per-route request body limits, checked against Content-Length before anything is read
+MAX_LOCK_BODY_SIZE = MAX_SECRET_SIZE + 16 * 1024  # the secret plus form/JSON framing
+MAX_UNLOCK_BODY_SIZE = 16 * 1024  # download code and key, even fully \u-escaped
+# Multipart fields are read in chunks of this size
+MULTIPART_CHUNK_SIZE = 64 * 1024
+
+# Responses smaller than this are sent uncompressed
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", 1024))
+# Larger bodies are compressed in a worker thread to keep the event loop free
+COMPRESSION_EXECUTOR_SIZE = 64 * 1024
+COMPRESSIBLE_CONTENT_TYPES = frozenset({"text/html", "text/plain", "application/json"})
+
+# Cache lifetimes for /time-left responses
+TIME_LEFT_MAX_AGE_SECONDS = 60
+TIME_LEFT_GONE_MAX_AGE_SECONDS = 300  # expired or unknown codes never come back
+
+STATIC_DIR = "./static"
+# Written by build-assets.js, maps "css/main.css" to its content-hashed copy
+ASSET_MANIFEST_FILE = os.path.join("dist", "manifest.json")
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
 
 DATABASE_DIR = "/app/database"
 DATABASE_PATH = os.path.join(DATABASE_DIR, "secrets.db")
+# Bumped whenever the tables change; stored as PRAGMA user_version and checked on restore
+SCHEMA_VERSION = 1
+# Online backups: written to BACKUP_DIR every BACKUP_INTERVAL_MINUTES (0: only on demand)
+BACKUP_DIR = os.getenv("BACKUP_DIR", os.path.join(DATABASE_DIR, "backups"))
+BACKUP_INTERVAL_MINUTES = int(os.getenv("BACKUP_INTERVAL_MINUTES", 0))
+BACKUP_KEEP = int(os.getenv("BACKUP_KEEP", 7))
+# Pages copied per backup step, and the pause between steps in which writers can commit
+BACKUP_PAGES_PER_STEP = int(os.getenv("BACKUP_PAGES_PER_STEP", 256))
+BACKUP_STEP_SLEEP = float(os.getenv("BACKUP_STEP_SLEEP", 0.05))
+# Restarts (caused by writes during the copy) before the copy is abandoned and retried
+# after BACKUP_RETRY_SECONDS, at most BACKUP_MAX_ATTEMPTS times in all
+BACKUP_MAX_RESTARTS = 5
+BACKUP_RETRY_SECONDS = 30
+BACKUP_MAX_ATTEMPTS = 3
 APP_KEY = "aiohttp_jinja2_environment"
 
-# Ensure the database directory exists
-os.makedirs(DATABASE_DIR, exist_ok=True)
+# --- JSON Codec ---
+# One codec for request bodies, stored envelopes and JSON responses. Uses orjson when
+# it is installed and falls back to the stdlib json module otherwise.
+
+if orjson is not None:
+    JSON_CODEC = "orjson"
+    json_loads = orjson.loads
+
+    def json_dumps(obj):
+        return orjson.dumps(obj).decode()
+
+else:
+    JSON_CODEC = "json"
+    json_loads = json.loads
+    json_dumps = json.dumps
+
+
+def json_response(data, **kwargs):
+    """web.json_response using the app's JSON codec."""
+    return web.json_response(data, dumps=json_dumps, **kwargs)
+
+
+# --- Metrics ---
+# Minimal in-process Prometheus metrics. Recording is a dict update (and a bisect for
+# histograms), so the instrumentation stays on in production.
+
+# Latency buckets in seconds, from sub-millisecond DB calls up to slow KDF runs
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+METRICS_REGISTRY = []
+
+
+def format_labels(labelnames, labelvalues):
+    if not labelnames:
+        return ""
+    pairs = []
+    for name, value in zip(labelnames, labelvalues):
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = collections.defaultdict(float)
+        METRICS_REGISTRY.append(self)
+
+    def inc(self, *labelvalues, amount=1):
+        self.values[labelvalues] += amount
+
+    def collect(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} counter"
+        for labelvalues, value in list(self.values.items()):
+            yield f"{self.name}{format_labels(self.labelnames, labelvalues)} {value:g}"
+
+
+class Gauge:
+    """Gauge whose value is read from a callback at scrape time."""
+
+    type = "gauge"
+
+    def __init__(self, name, documentation, callback):
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+        METRICS_REGISTRY.append(self)
+
+    def collect(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.type}"
+        yield f"{self.name} {self.callback():g}"
+
+
+class CallbackCounter(Gauge):
+    """Counter whose value is read at scrape time from a count kept elsewhere."""
+
+    type = "counter"
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labelvalues -> [count per bucket..., +Inf count, sum]
+        self.values = {}
+        METRICS_REGISTRY.append(self)
+
+    def observe(self, value, *labelvalues):
+        series = self.values.get(labelvalues)
+        if series is None:
+            series = self.values[labelvalues] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    @contextlib.contextmanager
+    def time(self, *labelvalues):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labelvalues)
+
+    def collect(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        for labelvalues, series in list(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series):
+                cumulative += count
+                labels = format_labels(self.labelnames + ("le",), labelvalues + (bound,))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = format_labels(self.labelnames, labelvalues)
+            yield f"{self.name}_sum{labels} {series[-1]:g}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+def render_metrics():
+    lines = []
+    for metric in METRICS_REGISTRY:
+        lines.extend(metric.collect())
+    return "\n".join(lines) + "\n"
+
+
+HTTP_REQUESTS = Counter(
+    "sharepass_http_requests_total", "HTTP requests by route.", ("route", "method", "status")
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "sharepass_http_request_duration_seconds", "HTTP request latency by route.", ("route",)
+)
+KDF_SECONDS = Histogram("sharepass_kdf_duration_seconds", "PBKDF2 key derivation time.")
+DECRYPT_SECONDS = Histogram("sharepass_decrypt_duration_seconds", "AES-GCM decryption time.")
+DB_CONNECT_SECONDS = Histogram("sharepass_db_connect_duration_seconds", "SQLite connect time.")
+DB_QUERY_SECONDS = Histogram(
+    "sharepass_db_query_duration_seconds", "SQLite statement time by verb.", ("statement",)
+)
+DB_COMMIT_SECONDS = Histogram("sharepass_db_commit_duration_seconds", "SQLite commit time.")
+PURGE_SECONDS = Histogram(
+    "sharepass_purge_duration_seconds",
+    "purge_expired run time.",
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60),
+)
+PURGED_ROWS = Counter("sharepass_purged_rows_total", "Rows deleted by purge_expired.", ("table",))
+BACKUP_SECONDS = Histogram(
+    "sharepass_backup_duration_seconds",
+    "Online database backup run time.",
+    buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 300),
+)
+SHED_REQUESTS = Counter(
+    "sharepass_shed_requests_total", "Requests refused by load shedding.", ("priority",)
+)
+QUOTA_REJECTIONS = Counter("sharepass_quota_rejections_total", "Locks rejected by the IP quota.")
+LOOP_LAG_SECONDS = Histogram(
+    "sharepass_event_loop_lag_seconds", "Delay of event loop wakeups beyond their schedule."
+)
+LOOP_BLOCKED = Counter(
+    "sharepass_event_loop_blocked_total", "Times the loop was blocked beyond the threshold."
+)
+FAILED_ATTEMPTS = Counter(
+    "sharepass_failed_attempts_total", "Unlocks with a wrong key.", ("outcome",)
+)
+
+
+# --- Tracing ---
+# Request-scoped spans kept in a context variable. Spans are only recorded below a root
+# span opened by tracing_middleware or trace(), so helpers called elsewhere pay nothing.
+
+trace_logger = logging.getLogger("sharepass.trace")
+current_span = contextvars.ContextVar("current_span", default=None)
+trace_export_lock = threading.Lock()
+
+
+class Span:
+    __slots__ = ("name", "attributes", "parent", "children", "start", "end", "start_ns")
+
+    def __init__(self, name, attributes=None, parent=None):
+        self.name = name
+        self.attributes = attributes or {}
+        self.parent = parent
+        self.children = []
+        self.start_ns = time.time_ns()
+        self.start = time.perf_counter()
+        self.end = None
+
+    @property
+    def duration_ms(self):
+        end = self.end if self.end is not None else time.perf_counter()
+        return (end - self.start) * 1000
+
+    def iter_spans(self, depth=0):
+        yield depth, self
+        for child in self.children:
+            yield from child.iter_spans(depth + 1)
+
+    def format_tree(self):
+        lines = []
+        for depth, node in self.iter_spans():
+            attributes = "".join(f" {key}={value}" for key, value in node.attributes.items())
+            lines.append(f"{'  ' * depth}{node.name} {node.duration_ms:.2f} ms{attributes}")
+        return "\n".join(lines)
+
+
+@contextlib.contextmanager
+def span(name, **attributes):
+    """Record a child span of the current span, if a trace is active."""
+    parent = current_span.get()
+    if parent is None:
+        yield None
+        return
+    child = Span(name, attributes, parent)
+    parent.children.append(child)
+    token = current_span.set(child)
+    try:
+        yield child
+    finally:
+        child.end = time.perf_counter()
+        current_span.reset(token)
+
+
+def traced(name):
+    """Decorator recording each call of a coroutine function as a span."""
+
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with span(name):
+                return await func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+@contextlib.contextmanager
+def trace(name, **attributes):
+    """Open a root span and log or export the finished trace."""
+    if not TRACE_SLOW_REQUEST_MS and not TRACE_EXPORT_FILE:
+        yield None
+        return
+    root = Span(name, attributes)
+    token = current_span.set(root)
+    try:
+        yield root
+    finally:
+        root.end = time.perf_counter()
+        current_span.reset(token)
+        finish_trace(root)
+
+
+def finish_trace(root):
+    slow = bool(TRACE_SLOW_REQUEST_MS) and root.duration_ms >= TRACE_SLOW_REQUEST_MS
+    if slow:
+        trace_logger.warning(
+            "Slow %s (%.0f ms):\n%s", root.name, root.duration_ms, root.format_tree()
+        )
+    if TRACE_EXPORT_FILE and (slow or random.random() < TRACE_EXPORT_SAMPLE_RATE):  # nosec B311
+        line = json_dumps(otlp_trace(root))
+        try:
+            asyncio.get_running_loop().run_in_executor(None, write_trace, line)
+        except RuntimeError:
+            write_trace(line)
+
+
+def otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def otlp_trace(root):
+    """The trace as an OTLP/JSON ExportTraceServiceRequest."""
+    trace_id = secrets.token_hex(16)
+    # IDs are only needed for export, so they are generated here rather than per span
+    span_ids = {}
+    spans = []
+    for _, node in root.iter_spans():
+        span_ids[node] = secrets.token_hex(8)
+        end_ns = node.start_ns + int(node.duration_ms * 1e6)
+        spans.append(
+            {
+                "traceId": trace_id,
+                "spanId": span_ids[node],
+                "parentSpanId": span_ids[node.parent] if node.parent is not None else "",
+                "name": node.name,
+                "kind": 2 if node is root else 1,
+                "startTimeUnixNano": str(node.start_ns),
+                "endTimeUnixNano": str(end_ns),
+                "attributes": [
+                    {"key": key, "value": otlp_value(value)}
+                    for key, value in node.attributes.items()
+                ],
+            }
+        )
+    resource = {"attributes": [{"key": "service.name", "value": {"stringValue": "sharepass"}}]}
+    return {
+        "resourceSpans": [
+            {"resource": resource, "scopeSpans": [{"scope": {"name": "sharepass"}, "spans": spans}]}
+        ]
+    }
+
+
+def write_trace(line):
+    with trace_export_lock:
+        with open(TRACE_EXPORT_FILE, "a", encoding="utf-8") as stream:
+            stream.write(line + "\n")
+
 
 # --- Date Adapter and Converter (kept as in your example) ---
 
@@ -63,20 +523,21 @@ def adapt_datetime_iso(val):
     return val.isoformat()
 
 
-sqlite3.register_adapter(datetime, adapt_datetime_iso)
-
-
 def convert_datetime(val):
     """Convert ISO 8601 datetime to datetime.datetime object."""
     return datetime.fromisoformat(val.decode())
 
 
-sqlite3.register_converter("DATETIME", convert_datetime)
+@functools.lru_cache(maxsize=None)
+def register_sqlite_adapters():
+    """Register the datetime adapter and converter (once, on first connect)."""
+    sqlite3.register_adapter(datetime, adapt_datetime_iso)
+    sqlite3.register_converter("DATETIME", convert_datetime)
 
 
 # --- Context Processor for Templates ---
-async def version_context_processor(request):
-    # Generate a nonce for CSP (Content Security Policy)
+def set_csp_nonce(request):
+    """Generate a nonce for CSP (Content Security Policy) and store it on the request."""
     nonce = secrets.token_urlsafe(16)
     # Store nonce in request for use in middleware (aiohttp requests support dict-like access)
     try:
@@ -84,14 +545,131 @@ async def version_context_processor(request):
     except (TypeError, AttributeError):
         # Fallback for requests that don't support dict-like access (shouldn't happen with aiohttp)
         pass
-    return {"VERSION": VERSION, "ANALYTICS_SCRIPT": ANALYTICS_SCRIPT, "CSP_NONCE": nonce}
+    return nonce
+
+
+# --- Rendered Page Cache ---
+
+# Per-request values are rendered as placeholders and substituted into the cached page.
+# The marker survives HTML escaping unchanged and never appears in the templates.
+PAGE_PLACEHOLDER_RE = re.compile(r"\[\[sharepass:(\w+)\]\]")
+PAGE_CACHE_KEY = web.AppKey("page_cache", dict)
+
+
+def page_placeholder(name):
+    return f"[[sharepass:{name}]]"
+
+
+def render_page_parts(env, template_name, context, placeholder_names):
+    """
+    Render a template with placeholders for the per-request values.
+    Returns the page split into alternating (literal bytes, placeholder name) parts.
+    """
+    render_context = {"VERSION": read_version(), "ANALYTICS_SCRIPT": ANALYTICS_SCRIPT}
+    render_context.update(context)
+    for name in placeholder_names:
+        render_context[name] = page_placeholder(name)
+    text = env.get_template(template_name).render(render_context)
+    parts = PAGE_PLACEHOLDER_RE.split(text)
+    # Literals are at even positions, placeholder names at odd positions
+    return tuple(part.encode() if i % 2 == 0 else part for i, part in enumerate(parts))
+
+
+async def render_page(request, template_name, context=None, status=200, per_request=None):
+    """
+    Render a page through the rendered-page cache.
+    The page is rendered once per (template, context) with placeholders for the CSP nonce
+    and the per_request values, so serving it is a substitution of HTML-escaped values.
+    Without a cache on the app (auto_reload or tests), the page is rendered every time.
+    """
+    context = context or {}
+    values = {"CSP_NONCE": set_csp_nonce(request)}
+    if per_request:
+        for name, value in per_request.items():
+            values[name] = str(markupsafe.escape(value))
+
+    cache = request.config_dict.get(PAGE_CACHE_KEY)
+    cache_key = (template_name, tuple(sorted(context.items())), tuple(values))
+    parts = cache.get(cache_key) if cache is not None else None
+    if parts is None:
+        env = request.config_dict.get(APP_KEY)
+        with span("render_template", template=template_name):
+            parts = render_page_parts(env, template_name, context, values)
+        if cache is not None:
+            cache[cache_key] = parts
+
+    body = b"".join(part if i % 2 == 0 else values[part].encode() for i, part in enumerate(parts))
+    return web.Response(body=body, status=status, content_type="text/html", charset="utf-8")
 
 
 # --- Helper Functions ---
 
 
+class QueryResult:
+    """
+    Cursor of MeteredConnection.execute(), usable like aiosqlite's: awaited for the
+    cursor, or with `async with` to close the cursor afterwards.
+    """
+
+    def __init__(self, coro):
+        self._coro = coro
+        self._cursor = None
+
+    def __await__(self):
+        return self._coro.__await__()
+
+    async def __aenter__(self):
+        self._cursor = await self._coro
+        return self._cursor
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self._cursor.close()
+
+
+class MeteredConnection:
+    """aiosqlite connection proxy that records statement and commit times."""
+
+    def __init__(self, db):
+        self._db = db
+
+    def __getattr__(self, name):
+        return getattr(self._db, name)
+
+    def execute(self, sql, parameters=None):
+        return QueryResult(self._execute(sql, parameters))
+
+    async def _execute(self, sql, parameters):
+        verb = sql.lstrip().split(None, 1)[0].lower()
+        with span("db." + verb), DB_QUERY_SECONDS.time(verb):
+            return await self._db.execute(sql, parameters)
+
+    async def executemany(self, sql, parameters):
+        verb = sql.lstrip().split(None, 1)[0].lower()
+        with span("db." + verb), DB_QUERY_SECONDS.time(verb):
+            return await self._db.executemany(sql, parameters)
+
+    async def commit(self):
+        with span("db.commit"), DB_COMMIT_SECONDS.time():
+            await self._db.commit()
+
+
+@contextlib.asynccontextmanager
+async def connect_db():
+    """Open a connection to the secrets database."""
+    register_sqlite_adapters()
+    with span("db.connect"), DB_CONNECT_SECONDS.time():
+        db = await aiosqlite.connect(DATABASE_PATH, detect_types=sqlite3.PARSE_DECLTYPES)
+    try:
+        yield MeteredConnection(db)
+    finally:
+        await db.close()
+
+
 async def init_db():
-    async with aiosqlite.connect(DATABASE_PATH, detect_types=sqlite3.PARSE_DECLTYPES) as db:
+    if STORAGE == "memory":
+        return
+    os.makedirs(os.path.dirname(DATABASE_PATH), exist_ok=True)
+    async with connect_db() as db:
         await db.execute(
             """
             CREATE TABLE IF NOT EXISTS secrets (
@@ -103,6 +681,11 @@ async def init_db():
             )
         """
         )
+        # Covering index, so existence and expiry checks never read the ciphertext
+        await db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_secrets_download_code "
+            "ON secrets (download_code, upload_time)"
+        )
         await db.execute(
             """
             CREATE TABLE IF NOT EXISTS ip_usage (
@@ -112,6 +695,7 @@ async def init_db():
             )
         """
         )
+        await db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
         await db.commit()
 
 
@@ -131,19 +715,98 @@ def get_client_ip(request):
 
 async def ip_reached_quota(ip):
     """Check the IP usage and reset if the quota renewal period has passed."""
-    async with aiosqlite.connect(DATABASE_PATH, detect_types=sqlite3.PARSE_DECLTYPES) as db:
+    row = await get_ip_usage(ip)
+    current_time = datetime.now()
+    if row:
+        uses, last_access = row
+        if last_access < (current_time - timedelta(minutes=QUOTA_RENEWAL_MINUTES)):
+            await delete_ip_usage(ip)
+            return False
+        elif int(uses) >= MAX_USES_QUOTA:
+            return True
+    return False
+
+
+async def get_ip_usage(ip):
+    """(uses, last_access) of a hashed IP, or None."""
+    if STORAGE == "memory":
+        usage = memory_store.ip_usage.get(ip)
+        return tuple(usage) if usage is not None else None
+    async with connect_db() as db:
         async with db.execute("SELECT uses, last_access FROM ip_usage WHERE ip=?", (ip,)) as cursor:
+            return await cursor.fetchone()
+
+
+async def delete_ip_usage(ip):
+    if STORAGE == "memory":
+        removed = memory_store.ip_usage.pop(ip, None) is not None
+    else:
+        async with connect_db() as db:
+            cursor = await db.execute("DELETE FROM ip_usage WHERE ip=?", (ip,))
+            await db.commit()
+        removed = cursor.rowcount > 0
+    if removed:
+        storage_stats.ip_usage_rows -= 1
+
+
+async def get_upload_time(download_code):
+    """
+    Metadata-only lookup of a secret's upload time; None if it does not exist.
+    Served from the covering index, the ciphertext is never read.
+    """
+    if STORAGE == "memory":
+        return memory_store.upload_time(download_code)
+    async with connect_db() as db:
+        async with db.execute(
+            "SELECT upload_time FROM secrets WHERE download_code=?", (download_code,)
+        ) as cursor:
             row = await cursor.fetchone()
-        current_time = datetime.now()
-        if row:
-            uses, last_access = row
-            if last_access < (current_time - timedelta(minutes=QUOTA_RENEWAL_MINUTES)):
-                await db.execute("DELETE FROM ip_usage WHERE ip=?", (ip,))
-                await db.commit()
-                return False
-            elif int(uses) >= MAX_USES_QUOTA:
-                return True
-    return False
+    if row is None:
+        code_filter.record_miss(download_code)
+        return None
+    return row[0]
+
+
+async def fetch_secret(download_code):
+    """(encrypted secret, attempts, upload time) of a secret, or None."""
+    if STORAGE == "memory":
+        return memory_store.get(download_code)
+    async with connect_db() as db:
+        async with db.execute(
+            "SELECT secret, attempts, upload_time FROM secrets WHERE download_code=?",
+            (download_code,),
+        ) as cursor:
+            return await cursor.fetchone()
+
+
+async def delete_secret(download_code):
+    """Delete a secret; False if it was already gone (claimed or purged concurrently)."""
+    if STORAGE == "memory":
+        deleted = memory_store.delete(download_code)
+    else:
+        async with connect_db() as db:
+            cursor = await db.execute("DELETE FROM secrets WHERE download_code=?", (download_code,))
+            await db.commit()
+        deleted = cursor.rowcount > 0
+    attempt_counter.forget(download_code)
+    if deleted:
+        code_filter.remove(download_code)
+    return deleted
+
+
+async def set_attempts(download_code, attempts):
+    if STORAGE == "memory":
+        memory_store.set_attempts(download_code, attempts)
+        return
+    if ATTEMPTS_DURABILITY != "sync":
+        attempt_counter.record(download_code, attempts)
+        return
+    async with connect_db() as db:
+        await db.execute(
+            "UPDATE secrets SET attempts=? WHERE download_code=?",
+            (attempts, download_code),
+        )
+        await db.commit()
 
 
 def generate_download_code(length=12):
@@ -175,9 +838,842 @@ def validate_json_content_type(request):
     return "application/json" in content_type.lower()
 
 
+def parse_allowed_networks(value):
+    """Parse "127.0.0.1,10.0.0.0/8" into a list of networks."""
+    return [ipaddress.ip_network(item.strip()) for item in value.split(",") if item.strip()]
+
+
+def client_allowed(request, networks):
+    """Only direct connections from allowed addresses pass, never proxied requests."""
+    if "X-Forwarded-For" in request.headers or not request.remote:
+        return False
+    try:
+        address = ipaddress.ip_address(request.remote)
+    except ValueError:
+        return False
+    return any(address in network for network in networks)
+
+
+# --- Static Assets ---
+
+ASSET_MANIFEST_KEY = web.AppKey("asset_manifest", dict)
+STATIC_FILES_KEY = web.AppKey("static_files", dict)
+
+
+def load_asset_manifest(static_dir):
+    """Load the asset manifest, or return an empty one if the assets have not been built."""
+    manifest_path = os.path.join(static_dir, ASSET_MANIFEST_FILE)
+    if not os.path.isfile(manifest_path):
+        return {}
+    with open(manifest_path, "r") as manifest_file:
+        return json.load(manifest_file)
+
+
+def index_static_files(static_dir, manifest):
+    """
+    Map every file below static_dir to its absolute path and Cache-Control value.
+    Content-hashed files from the manifest never change and are cached as immutable,
+    everything else has to be revalidated with its ETag.
+    """
+    hashed_files = set(manifest.values())
+    static_root = os.path.abspath(static_dir)
+    static_files = {}
+    for dirpath, _, filenames in os.walk(static_root):
+        for filename in filenames:
+            file_path = os.path.join(dirpath, filename)
+            rel_path = os.path.relpath(file_path, static_root).replace(os.sep, "/")
+            cache_control = (
+                IMMUTABLE_CACHE_CONTROL if rel_path in hashed_files else REVALIDATE_CACHE_CONTROL
+            )
+            static_files[rel_path] = (pathlib.Path(file_path), cache_control)
+    return static_files
+
+
+def asset_url(manifest, rel_path):
+    """Resolve a static asset to its content-hashed URL, falling back to the plain path."""
+    return "/static/" + manifest.get(rel_path, rel_path)
+
+
+async def serve_static(request):
+    """
+    Serve a file from the static index built at startup.
+    FileResponse picks a precompressed .br or .gz variant matching Accept-Encoding
+    and handles ETag/If-None-Match revalidation.
+    """
+    entry = request.app[STATIC_FILES_KEY].get(request.match_info["filename"])
+    if entry is None:
+        raise web.HTTPNotFound()
+    file_path, cache_control = entry
+    return web.FileResponse(file_path, headers={"Cache-Control": cache_control})
+
+
+def setup_static_assets(app, static_dir=STATIC_DIR):
+    """Index the static files and register the static route on the app."""
+    manifest = load_asset_manifest(static_dir)
+    app[ASSET_MANIFEST_KEY] = manifest
+    app[STATIC_FILES_KEY] = index_static_files(static_dir, manifest)
+    app.router.add_get("/static/{filename:.+}", serve_static, name="static")
+    return manifest
+
+
+# --- Download Code Filter ---
+
+
+class CodeFilter:
+    """
+    Counting Bloom filter over the download codes of live secrets.
+
+    Answers "definitely not present" for unknown codes without touching SQLite, so
+    scanners probing random /unlock/<code> URLs cost no database query. Counters
+    (instead of bits) allow codes to be removed again on claim, max-attempts and purge.
+    The filter is rebuilt from the database after startup and only answers for the
+    database it was built from. Until then every lookup goes to the database.
+    """
+
+    FALSE_POSITIVE_RATE = 0.01
+
+    def __init__(self):
+        # Sized by rebuild(); until then every lookup passes through to the database
+        self.database_path = None
+        self.size = self.num_hashes = self.capacity = self.count = 0
+        self.counters = bytearray()
+        # Codes added (True) or removed (False) while rebuild() reads the database
+        self.pending = None
+        # Lookups answered without a query, lookups passed on, and passes with no row
+        self.hits = 0
+        self.passes = 0
+        self.false_positives = 0
+
+    def _resize(self, capacity):
+        capacity = max(capacity, 1)
+        size = int(-capacity * math.log(self.FALSE_POSITIVE_RATE) / (math.log(2) ** 2))
+        self.size = max(size, 64)
+        self.num_hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.capacity = capacity
+        self.count = 0
+        self.counters = bytearray(self.size)
+
+    def _positions(self, code):
+        # Double hashing: two 64-bit halves of one digest give all k positions
+        digest = hashlib.blake2b(code.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.num_hashes)]
+
+    def is_ready(self):
+        return self.database_path == DATABASE_PATH
+
+    def add(self, code):
+        if self.pending is not None:
+            self.pending.append((True, code))
+            return
+        if not self.is_ready():
+            return
+        counters = self.counters
+        for position in self._positions(code):
+            # Saturated counters are never decremented again
+            if counters[position] < 255:
+                counters[position] += 1
+        self.count += 1
+
+    def remove(self, code):
+        if self.pending is not None:
+            self.pending.append((False, code))
+            return
+        if not self.is_ready():
+            return
+        counters = self.counters
+        for position in self._positions(code):
+            if 0 < counters[position] < 255:
+                counters[position] -= 1
+        self.count = max(self.count - 1, 0)
+
+    def might_contain(self, code):
+        """False means the code is definitely not stored; True means look it up."""
+        if not self.is_ready():
+            return True
+        counters = self.counters
+        if all(counters[position] for position in self._positions(code)):
+            self.passes += 1
+            return True
+        self.hits += 1
+        return False
+
+    def record_miss(self, code):
+        """Called when a code that passed the filter had no row in the database."""
+        if self.is_ready():
+            self.false_positives += 1
+
+    def as_dict(self):
+        # Share of unknown codes that got past the filter, to compare with the target rate
+        unknown = self.hits + self.false_positives
+        return {
+            "ready": self.is_ready(),
+            "capacity": self.capacity,
+            "codes": self.count,
+            "hits": self.hits,
+            "passes": self.passes,
+            "false_positives": self.false_positives,
+            "false_positive_rate": self.false_positives / unknown if unknown else 0.0,
+        }
+
+    async def rebuild(self):
+        """Rebuild the filter from the download codes in the database."""
+        if STORAGE == "memory":
+            # Memory storage answers lookups from a dict; the filter stays detached
+            return
+        self.database_path = None
+        self.pending = []
+        try:
+            async with connect_db() as db:
+                async with db.execute("SELECT download_code FROM secrets") as cursor:
+                    codes = {row[0] for row in await cursor.fetchall()}
+            # Secrets stored or deleted during the query may or may not be in its result,
+            # so the changes are applied as set operations rather than counter updates
+            for added, code in self.pending:
+                if added:
+                    codes.add(code)
+                else:
+                    codes.discard(code)
+        finally:
+            self.pending = None
+        self._resize(max(CODE_FILTER_CAPACITY, 2 * len(codes)))
+        self.database_path = DATABASE_PATH
+        for code in codes:
+            self.add(code)
+
+
+code_filter = CodeFilter()
+
+
+# --- Memory Storage ---
+
+
+class MemoryStore:
+    """
+    In-process storage for STORAGE=memory: secrets by download code and quota counters
+    by hashed IP, with nothing written to disk.
+
+    All secrets share one lifetime, so insertion order is expiry order. Both tables are
+    OrderedDicts (ip_usage is moved to the end on every use), which makes lookups O(1)
+    and lets purges and evictions pop expired entries from the front.
+    """
+
+    # Rough per-secret cost of the entry, its code and its datetime beyond the ciphertext
+    ENTRY_OVERHEAD = 256
+
+    def __init__(self, max_bytes=MEMORY_STORE_MAX_BYTES, when_full=MEMORY_STORE_WHEN_FULL):
+        self.max_bytes = max_bytes
+        self.evict_when_full = when_full == "evict"
+        # download_code -> [secret, attempts, upload_time]
+        self.secrets = collections.OrderedDict()
+        # hashed ip -> [uses, last_access]
+        self.ip_usage = collections.OrderedDict()
+        self.bytes = 0
+        self.evicted = 0
+        self.rejected = 0
+
+    def entry_size(self, secret):
+        return len(secret) + self.ENTRY_OVERHEAD
+
+    def insert(self, secret, download_code, upload_time, ip):
+        """Store a secret and count it against the IP's quota; False if the budget is spent."""
+        size = self.entry_size(secret)
+        if self.bytes + size > self.max_bytes:
+            if not self.evict_when_full or size > self.max_bytes:
+                self.rejected += 1
+                return False
+            while self.bytes + size > self.max_bytes:
+                oldest_code, (oldest, _, oldest_time) = next(iter(self.secrets.items()))
+                self.delete(oldest_code)
+                self.evicted += 1
+                storage_stats.removed(len(oldest), oldest_time, "evicted")
+        self.secrets[download_code] = [secret, 0, upload_time]
+        self.bytes += size
+        usage = self.ip_usage.get(ip)
+        if usage is None:
+            self.ip_usage[ip] = [1, upload_time]
+        else:
+            usage[0] += 1
+            usage[1] = upload_time
+            self.ip_usage.move_to_end(ip)
+        return True
+
+    def get(self, download_code):
+        entry = self.secrets.get(download_code)
+        return None if entry is None else tuple(entry)
+
+    def upload_time(self, download_code):
+        entry = self.secrets.get(download_code)
+        return None if entry is None else entry[2]
+
+    def set_attempts(self, download_code, attempts):
+        entry = self.secrets.get(download_code)
+        if entry is not None:
+            entry[1] = attempts
+
+    def delete(self, download_code):
+        entry = self.secrets.pop(download_code, None)
+        if entry is None:
+            return False
+        self.bytes -= self.entry_size(entry[0])
+        return True
+
+    def purge(self, expiry_time, cutoff_time):
+        """
+        Remove secrets uploaded before expiry_time and quota entries idle since cutoff_time.
+        Returns ([(download_code, size, upload_time)], number of quota entries removed).
+        """
+        purged = []
+        secrets_by_age = self.secrets
+        while secrets_by_age:
+            download_code, entry = next(iter(secrets_by_age.items()))
+            if entry[2] >= expiry_time:
+                break
+            self.delete(download_code)
+            purged.append((download_code, len(entry[0]), entry[2]))
+        ip_rows = 0
+        ip_usage = self.ip_usage
+        while ip_usage and next(iter(ip_usage.values()))[1] < cutoff_time:
+            ip_usage.popitem(last=False)
+            ip_rows += 1
+        return purged, ip_rows
+
+
+memory_store = MemoryStore()
+
+
+# --- Failed Attempt Counters ---
+
+
+class AttemptCounter:
+    """
+    Write-behind failed-attempt counts for SQLite storage.
+
+    A wrong key used to cost an UPDATE and a commit (an fsync) each, so brute-force
+    traffic became disk write load. Counts are now kept here, authoritative over the
+    attempts column, and written in one batch every ATTEMPTS_FLUSH_SECONDS. Deleting a
+    secret at MAX_ATTEMPTS is still committed right away.
+
+    Crash bound: counts recorded since the last flush are lost, so after a crash a
+    secret may accept up to ATTEMPTS_FLUSH_SECONDS worth of extra wrong keys, and never
+    more than MAX_ATTEMPTS - 1. Set ATTEMPTS_DURABILITY=sync to commit every attempt.
+    """
+
+    def __init__(self):
+        # download_code -> attempts not yet known to be in the database
+        self.counts = {}
+        self.dirty = set()
+        self.flushed = 0
+
+    def current(self, download_code, stored):
+        return self.counts.get(download_code, stored)
+
+    def record(self, download_code, attempts):
+        self.counts[download_code] = attempts
+        self.dirty.add(download_code)
+
+    def forget(self, download_code):
+        self.counts.pop(download_code, None)
+        self.dirty.discard(download_code)
+
+    async def flush(self):
+        """Write the pending counts in one transaction."""
+        if not self.dirty:
+            return
+        pending, self.dirty = self.dirty, set()
+        rows = [(self.counts[code], code) for code in pending if code in self.counts]
+        try:
+            async with connect_db() as db:
+                await db.executemany("UPDATE secrets SET attempts=? WHERE download_code=?", rows)
+                await db.commit()
+        except Exception:
+            # Keep them pending for the next flush
+            self.dirty |= pending
+            raise
+        self.flushed += len(rows)
+        for code in pending:
+            # The row is now current, unless another attempt came in during the flush
+            if code not in self.dirty:
+                self.counts.pop(code, None)
+
+
+attempt_counter = AttemptCounter()
+
+
+# --- Storage Statistics ---
+
+# Width of the expiry histogram buckets, by upload time
+STATS_BUCKET_SECONDS = max(SECRET_EXPIRY_MINUTES * 60 // 12, 60)
+STATS_EPOCH = datetime(2000, 1, 1)
+DELETION_REASONS = ("claimed", "max_attempts", "expired", "evicted")
+
+
+class StorageStats:
+    """
+    Live secret count, stored bytes, expiry histogram, ip_usage size and deletions by
+    reason, maintained as secrets are stored, claimed and purged.
+
+    COUNT(*) and SUM(length(secret)) scan the whole secrets table, so they are only run
+    by reconcile() every STATS_RECONCILE_MINUTES (and at startup) to correct drift,
+    e.g. from rows changed by another process. Deletions are counted since startup.
+    """
+
+    def __init__(self):
+        self.live_secrets = 0
+        self.stored_bytes = 0
+        self.ip_usage_rows = 0
+        # Upload time bucket -> live secrets; all secrets share one lifetime
+        self.buckets = collections.Counter()
+        self.deleted = dict.fromkeys(DELETION_REASONS, 0)
+        self.reconciled_at = None
+        self.drift = {}
+
+    @staticmethod
+    def bucket(upload_time):
+        return int((upload_time - STATS_EPOCH).total_seconds() // STATS_BUCKET_SECONDS)
+
+    def added(self, size, upload_time, new_ip):
+        self.live_secrets += 1
+        self.stored_bytes += size
+        self.buckets[self.bucket(upload_time)] += 1
+        if new_ip:
+            self.ip_usage_rows += 1
+
+    def removed(self, size, upload_time, reason):
+        self.live_secrets -= 1
+        self.stored_bytes -= size
+        bucket = self.bucket(upload_time)
+        self.buckets[bucket] -= 1
+        if self.buckets[bucket] <= 0:
+            del self.buckets[bucket]
+        self.deleted[reason] += 1
+
+    async def reconcile(self):
+        """Recount everything from the storage and record how far the counters were off."""
+        if STORAGE == "memory":
+            buckets = collections.Counter(
+                self.bucket(entry[2]) for entry in memory_store.secrets.values()
+            )
+            live, size = len(memory_store.secrets), memory_store.bytes
+            size -= live * MemoryStore.ENTRY_OVERHEAD
+            ip_rows = len(memory_store.ip_usage)
+            before = None
+        else:
+            async with connect_db() as db:
+                # Stores, claims and purges keep updating the counters while the query
+                # runs; they are added to its result below instead of being overwritten
+                before = self.live_secrets, self.stored_bytes, self.ip_usage_rows
+                before_buckets = self.buckets.copy()
+                async with db.execute(
+                    "SELECT CAST((julianday(upload_time) - julianday(?)) * 86400 / ? AS INTEGER), "
+                    "COUNT(*), TOTAL(length(secret)) FROM secrets GROUP BY 1",
+                    (STATS_EPOCH, STATS_BUCKET_SECONDS),
+                ) as cursor:
+                    rows = await cursor.fetchall()
+                async with db.execute("SELECT COUNT(*) FROM ip_usage") as cursor:
+                    (ip_rows,) = await cursor.fetchone()
+            buckets = collections.Counter({bucket: count for bucket, count, _ in rows})
+            live = sum(count for _, count, _ in rows)
+            size = int(sum(total for _, _, total in rows))
+        if before is not None:
+            live += self.live_secrets - before[0]
+            size += self.stored_bytes - before[1]
+            ip_rows += self.ip_usage_rows - before[2]
+            buckets.update(self.buckets)
+            buckets.subtract(before_buckets)
+            buckets = +buckets
+        if self.reconciled_at is not None:
+            self.drift = {
+                "live_secrets": live - self.live_secrets,
+                "stored_bytes": size - self.stored_bytes,
+                "ip_usage_rows": ip_rows - self.ip_usage_rows,
+            }
+        self.live_secrets, self.stored_bytes, self.ip_usage_rows = live, size, ip_rows
+        self.buckets = buckets
+        self.reconciled_at = datetime.now()
+
+    def expiry_histogram(self, now=None):
+        """Live secrets by the number of minutes (at most) until they expire."""
+        now = now or datetime.now()
+        histogram = []
+        for bucket in sorted(self.buckets):
+            expires = STATS_EPOCH + timedelta(
+                seconds=(bucket + 1) * STATS_BUCKET_SECONDS, minutes=SECRET_EXPIRY_MINUTES
+            )
+            minutes = max(math.ceil((expires - now).total_seconds() / 60), 0)
+            histogram.append({"expires_within_minutes": minutes, "secrets": self.buckets[bucket]})
+        return histogram
+
+    def as_dict(self):
+        return {
+            "storage": STORAGE,
+            "live_secrets": self.live_secrets,
+            "stored_bytes": self.stored_bytes,
+            "ip_usage_rows": self.ip_usage_rows,
+            "expiry_histogram": self.expiry_histogram(),
+            "deleted": dict(self.deleted),
+            "reconciled_at": self.reconciled_at.isoformat() if self.reconciled_at else None,
+            "reconcile_drift": self.drift,
+        }
+
+
+storage_stats = StorageStats()
+
+
+async def admin_stats(request):
+    """Storage statistics from the maintained counters: GET /admin/stats (loopback only)."""
+    if not client_allowed(request, parse_allowed_networks(ADMIN_ALLOWED_IPS)):
+        return await handle_404(request)
+    data = storage_stats.as_dict()
+    data["code_filter"] = code_filter.as_dict()
+    return json_response(data, headers={"Cache-Control": "no-store"})
+
+
+# --- Idempotency Keys ---
+
+IDEMPOTENCY_KEY_PATTERN = re.compile(r"[\x21-\x7e]{1,255}")
+
+
+class IdempotencyCache:
+    """
+    Download codes by (hashed client IP, Idempotency-Key), so a client retrying a lock
+    gets the original download code back instead of a second secret and a second quota
+    charge.
+
+    Entries live in memory only (a lost entry just means a retry stores a new secret),
+    for IDEMPOTENCY_TTL_SECONDS and at most IDEMPOTENCY_MAX_KEYS of them. All entries
+    share the TTL, so the OrderedDict is in expiry order and is trimmed from the front.
+    A replay must carry the same secret; a request arriving while the first one is
+    still storing waits for its result.
+    """
+
+    def __init__(self, ttl=IDEMPOTENCY_TTL_SECONDS, max_keys=IDEMPOTENCY_MAX_KEYS):
+        self.ttl = ttl
+        self.max_keys = max_keys
+        # (ip, key) -> [fingerprint of the secret, future of the download code, created]
+        self.entries = collections.OrderedDict()
+        self.replays = 0
+
+    def expire(self, now):
+        entries = self.entries
+        while entries and (
+            len(entries) > self.max_keys or next(iter(entries.values()))[2] <= now - self.ttl
+        ):
+            entries.popitem(last=False)
+
+    def lookup(self, ip, key):
+        self.expire(time.monotonic())
+        return self.entries.get((ip, key))
+
+    async def store(self, secret, ip, key):
+        """store_secret(secret, ip), or the result of an earlier request with this key."""
+        fingerprint = hashlib.sha256(secret.encode()).hexdigest()
+        entry = self.lookup(ip, key)
+        if entry is not None:
+            if not secrets.compare_digest(entry[0], fingerprint):
+                return None, IDEMPOTENCY_CONFLICT_ERROR
+            download_code = await asyncio.shield(entry[1])
+            if download_code is not None:
+                self.replays += 1
+                return download_code, None
+            # The first request failed, so this one stores the secret instead
+
+        result = asyncio.get_running_loop().create_future()
+        entry = [fingerprint, result, time.monotonic()]
+        self.entries[(ip, key)] = entry
+        self.expire(entry[2])
+        download_code = error = None
+        try:
+            download_code, error = await store_secret(secret, ip)
+        finally:
+            result.set_result(download_code)
+            if download_code is None and self.entries.get((ip, key)) is entry:
+                del self.entries[(ip, key)]
+        return download_code, error
+
+
+idempotency_cache = IdempotencyCache()
+
+
+def idempotency_key(request):
+    """The request's Idempotency-Key, None without one; ValueError if it is malformed."""
+    key = request.headers.get("Idempotency-Key")
+    if key is not None and not IDEMPOTENCY_KEY_PATTERN.fullmatch(key):
+        raise ValueError("Invalid Idempotency-Key header.")
+    return key
+
+
+async def store_secret_once(secret, ip, key):
+    if key is None:
+        return await store_secret(secret, ip)
+    return await idempotency_cache.store(secret, ip, key)
+
+
+# --- Request Body Limits ---
+
+
+def body_limit(max_size):
+    """Limit the request body of a handler to max_size bytes (see body_limit_middleware)."""
+
+    def decorator(handler):
+        handler.max_body_size = max_size
+        return handler
+
+    return decorator
+
+
+def body_too_large(request, max_size):
+    message = f"Request body too large. Maximum size is {max_size} bytes."
+    if validate_json_content_type(request):
+        return json_response({"error": message}, status=413)
+    return web.Response(text=message, status=413)
+
+
+async def read_field_limited(field, max_size):
+    """Read a multipart field in chunks; returns None as soon as it exceeds max_size bytes."""
+    chunks = []
+    size = 0
+    while True:
+        chunk = await field.read_chunk(MULTIPART_CHUNK_SIZE)
+        if not chunk:
+            break
+        size += len(chunk)
+        if size > max_size:
+            return None
+        chunks.append(chunk)
+    return b"".join(chunks).decode(field.get_charset(default="utf-8"))
+
+
+# --- Response Compression ---
+
+
+def no_compression(handler):
+    """
+    Mark a handler whose responses must never be compressed.
+    Used for responses carrying decrypted secrets, so their compressed length cannot
+    leak anything about the plaintext.
+    """
+    handler.no_compression = True
+    return handler
+
+
+def negotiate_encoding(accept_encoding):
+    """Pick "br" or "gzip" from an Accept-Encoding header, or None for identity."""
+    accepted = set()
+    for item in accept_encoding.lower().split(","):
+        coding, _, params = item.partition(";")
+        params = params.replace(" ", "")
+        # Codings explicitly refused with q=0 are skipped
+        if params.startswith("q="):
+            try:
+                if float(params[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(coding.strip())
+    if brotli is not None and ("br" in accepted or "*" in accepted):
+        return "br"
+    if "gzip" in accepted or "*" in accepted:
+        return "gzip"
+    return None
+
+
+def compress_body(body, encoding):
+    if encoding == "br":
+        # Low quality keeps on-the-fly compression fast while still beating gzip
+        return brotli.compress(body, quality=4)
+    return gzip.compress(body, compresslevel=6, mtime=0)
+
+
+# --- Not Found Responses ---
+
+NOT_FOUND_KEY = web.AppKey("not_found", object)
+PLAIN_NOT_FOUND = b"404 Not Found\n"
+INLINE_SCRIPT_RE = re.compile(rb"<script>(.*?)</script>", re.S)
+
+
+class NotFoundResponses:
+    """
+    Pre-built 404 responses for the catch-all route, which mostly answers scanners
+    probing /wp-login.php, /.env and the like.
+
+    The page is rendered once at startup, with its inline scripts allowed by hash
+    instead of a per-response nonce, and compressed once per encoding. Serving it only
+    picks bytes and headers; the security headers middleware keeps responses that
+    bring their own Content-Security-Policy.
+    """
+
+    def __init__(self, html, security_headers, mode=NOT_FOUND_RESPONSE):
+        self.mode = mode
+        hashes = " ".join(
+            f"'sha256-{base64.b64encode(hashlib.sha256(script).digest()).decode()}'"
+            for script in INLINE_SCRIPT_RE.findall(html)
+        )
+        csp = security_headers["csp_template"].replace(f"'nonce-{CSP_NONCE_MARKER}'", hashes)
+        vary = "Accept, Accept-Encoding" if mode == "auto" else "Accept-Encoding"
+        html_headers = dict(security_headers["page"])
+        html_headers.update(
+            {"Content-Security-Policy": csp, "Content-Type": "text/html; charset=utf-8"}
+        )
+        encodings = ("br", "gzip") if brotli is not None else ("gzip",)
+        # Body and headers by negotiated encoding (None for identity)
+        self.pages = {None: (html, {**html_headers, "Vary": vary})}
+        for encoding in encodings:
+            self.pages[encoding] = (
+                compress_body(html, encoding),
+                {**html_headers, "Vary": vary, "Content-Encoding": encoding},
+            )
+        self.plain_headers = dict(security_headers["asset"])
+        self.plain_headers["Content-Type"] = "text/plain; charset=utf-8"
+        if mode == "auto":
+            self.plain_headers["Vary"] = "Accept"
+
+    @classmethod
+    def render(cls, env, security_headers, mode=NOT_FOUND_RESPONSE):
+        parts = render_page_parts(env, "404.html", {}, ("CSP_NONCE",))
+        html = b"".join(part for i, part in enumerate(parts) if i % 2 == 0)
+        return cls(html.replace(b' nonce=""', b""), security_headers, mode)
+
+    def response(self, request):
+        if self.mode == "plain" or (
+            self.mode == "auto" and "text/html" not in request.headers.get("Accept", "")
+        ):
+            return web.Response(body=PLAIN_NOT_FOUND, status=404, headers=self.plain_headers)
+        encoding = negotiate_encoding(request.headers.get("Accept-Encoding", ""))
+        body, headers = self.pages[encoding]
+        return web.Response(body=body, status=404, headers=headers)
+
+
+# --- Load Shedding ---
+
+PRIORITIES = ("critical", "normal", "low")
+
+
+def priority(name):
+    """
+    Put a handler in a priority class for load_shedding_middleware. Handlers without a
+    class (health checks, metrics, admin, static files) are never shed.
+    """
+
+    def decorator(handler):
+        handler.priority = name
+        return handler
+
+    return decorator
+
+
+def parse_priority_limits(value):
+    """Parse "normal=256,low=64" into {priority: limit}; 0 or a missing class is unlimited."""
+    limits = dict.fromkeys(PRIORITIES, 0)
+    for item in value.split(","):
+        name, _, limit = item.partition("=")
+        if name.strip() in limits and limit.strip():
+            limits[name.strip()] = int(limit)
+    return limits
+
+
+class LoadShedder:
+    """
+    Per-priority concurrency limits plus overload shedding.
+
+    Overload is an exponentially weighted moving average of the latency of classified
+    requests above OVERLOAD_LATENCY_MS, or more than OVERLOAD_QUEUE_DEPTH of them in
+    flight. Past either threshold "low" requests are refused, past twice the threshold
+    "normal" ones too, so lock and unlock keep the event loop and the database. The
+    average decays while no request completes, so shedding cannot keep itself going.
+
+    Both only count a request once its body has been received (see body_received()),
+    so clients sending their body slowly are not mistaken for server load.
+    """
+
+    LATENCY_WEIGHT = 0.1
+    DECAY_HALF_LIFE = 1.0
+
+    def __init__(
+        self,
+        limits=PRIORITY_LIMITS,
+        latency_ms=OVERLOAD_LATENCY_MS,
+        queue_depth=OVERLOAD_QUEUE_DEPTH,
+    ):
+        self.limits = parse_priority_limits(limits)
+        self.latency_threshold = latency_ms / 1000
+        self.queue_threshold = queue_depth
+        self.in_flight = dict.fromkeys(PRIORITIES, 0)
+        self.total_in_flight = 0
+        self.average_latency = 0.0
+        self.updated = time.monotonic()
+
+    def latency(self, now=None):
+        now = time.monotonic() if now is None else now
+        idle = now - self.updated
+        if idle <= self.DECAY_HALF_LIFE:
+            return self.average_latency
+        return self.average_latency * 0.5 ** (idle / self.DECAY_HALF_LIFE)
+
+    def overload_level(self):
+        """0 when healthy, 1 past a threshold, 2 past twice a threshold."""
+        latency_ratio = self.latency() / self.latency_threshold if self.latency_threshold else 0
+        queue_ratio = self.total_in_flight / self.queue_threshold if self.queue_threshold else 0
+        ratio = max(latency_ratio, queue_ratio)
+        return 2 if ratio >= 2 else 1 if ratio >= 1 else 0
+
+    def admit(self, name):
+        """True if a request of this class may start now."""
+        limit = self.limits[name]
+        if limit and self.in_flight[name] >= limit:
+            return False
+        if name == "low":
+            return self.overload_level() == 0
+        if name == "normal":
+            return self.overload_level() < 2
+        return True
+
+    def started(self, name):
+        self.in_flight[name] += 1
+
+    def processing(self):
+        self.total_in_flight += 1
+
+    def finished(self, name, seconds=None):
+        """seconds is the time since processing(), or None if the body never arrived."""
+        self.in_flight[name] -= 1
+        if seconds is None:
+            return
+        self.total_in_flight -= 1
+        now = time.monotonic()
+        self.average_latency = self.latency(now)
+        self.average_latency += self.LATENCY_WEIGHT * (seconds - self.average_latency)
+        self.updated = now
+
+
+load_shedder = LoadShedder()
+
+# Start of the server-side time of the current classified request, or None while its
+# body is still being received
+request_clock = contextvars.ContextVar("request_clock", default=None)
+
+
+def body_received():
+    """Called by handlers once they have read the request body; starts the load clock."""
+    clock = request_clock.get()
+    if clock is not None and clock[0] is None:
+        clock[0] = time.perf_counter()
+        load_shedder.processing()
+
+
+def server_busy(request):
+    message = "Server busy. Please try again shortly."
+    headers = {"Retry-After": "1", "Cache-Control": "no-store"}
+    if validate_json_content_type(request):
+        return json_response({"error": message}, status=503, headers=headers)
+    return web.Response(text=message, status=503, headers=headers)
+
+
 # --- Request Handlers ---
 
 
+@priority("normal")
 async def index(request):
     secret_expiry_hours = SECRET_EXPIRY_MINUTES // 60
     secret_expiry_minutes = SECRET_EXPIRY_MINUTES % 60
@@ -187,9 +1683,10 @@ async def index(request):
         "secret_expiry_minutes": secret_expiry_minutes,
         "max_attempts": MAX_ATTEMPTS,
     }
-    return aiohttp_jinja2.render_template("index.html", request, context, app_key=APP_KEY)
+    return await render_page(request, "index.html", context)
 
 
+@traced("store_secret")
 async def store_secret(encrypted_secret, ip):
     """Common function to store a secret in the database."""
     if len(encrypted_secret) > MAX_SECRET_SIZE:
@@ -199,7 +1696,14 @@ async def store_secret(encrypted_secret, ip):
     download_code = generate_download_code()
     upload_time = datetime.now()
 
-    async with aiosqlite.connect(DATABASE_PATH, detect_types=sqlite3.PARSE_DECLTYPES) as db:
+    if STORAGE == "memory":
+        new_ip = ip not in memory_store.ip_usage
+        if not memory_store.insert(encrypted_secret, download_code, upload_time, ip):
+            return None, STORAGE_FULL_ERROR
+        storage_stats.added(len(encrypted_secret), upload_time, new_ip)
+        return download_code, None
+
+    async with connect_db() as db:
         await db.execute(
             "INSERT INTO secrets (id, secret, attempts, download_code, upload_time) VALUES (?, ?, ?, ?, ?)",
             (secret_id, encrypted_secret, 0, download_code, upload_time),
@@ -217,13 +1721,24 @@ async def store_secret(encrypted_secret, ip):
                 (ip, upload_time),
             )
         await db.commit()
+    code_filter.add(download_code)
+    storage_stats.added(len(encrypted_secret), upload_time, not exists)
 
     return download_code, None
 
 
+@priority("critical")
+@body_limit(MAX_LOCK_BODY_SIZE)
 async def upload_secret(request):
     ip = get_client_ip(request)
-    if await ip_reached_quota(ip):
+    try:
+        key = idempotency_key(request)
+    except ValueError as e:
+        return web.Response(text=str(e), status=400)
+    # A replay of a stored secret is not charged again, so it is not refused by the quota
+    replay = key is not None and idempotency_cache.lookup(ip, key) is not None
+    if not replay and await ip_reached_quota(ip):
+        QUOTA_REJECTIONS.inc()
         return web.Response(
             text="You have exceeded the maximum number of shares for today.", status=429
         )
@@ -233,31 +1748,34 @@ async def upload_secret(request):
     if field is None or field.name != "encryptedsecret":
         return web.Response(text="No secret field in form.", status=400)
 
-    secret = await field.text()
+    secret = await read_field_limited(field, MAX_SECRET_SIZE)
+    if secret is None:
+        return web.Response(
+            text=f"Secret too large. Maximum size is {MAX_SECRET_SIZE} bytes.", status=413
+        )
+    body_received()
 
-    download_code, error = await store_secret(secret, ip)
+    download_code, error = await store_secret_once(secret, ip, key)
     if error:
-        return web.Response(text=error, status=400)
+        return web.Response(text=error, status=STORE_ERROR_STATUS.get(error, 400))
 
     download_url = f"/unlock/{download_code}"
     return web.Response(text=download_url)
 
 
+@priority("normal")
 async def unlock_secret_landing(request):
     download_code = request.match_info["download_code"]
     # Validate download code format
-    if not validate_download_code(download_code):
-        response = aiohttp_jinja2.render_template("404.html", request, {}, app_key=APP_KEY)
-        response.set_status(404)
-        return response
-
-    async with aiosqlite.connect(DATABASE_PATH, detect_types=sqlite3.PARSE_DECLTYPES) as db:
-        async with db.execute(
-            "SELECT secret FROM secrets WHERE download_code=?", (download_code,)
-        ) as cursor:
-            row = await cursor.fetchone()
-
-    if row:
+    if not validate_download_code(download_code) or not code_filter.might_contain(download_code):
+        return await render_page(request, "404.html", status=404)
+
+    upload_time = await get_upload_time(download_code)
+    expiry_time = upload_time and upload_time + timedelta(minutes=SECRET_EXPIRY_MINUTES)
+    # Expired secrets that have not been purged yet are treated as gone
+    if expiry_time and expiry_time > datetime.now():
+        # The page counts down locally from the absolute expiry time, the server time
+        # lets the browser correct for clock skew.
         download_link = f"/unlock/{download_code}"
         # Get base URL for CLI examples
         # Prefer HTTPS - check X-Forwarded-Proto header first (if behind proxy),
@@ -274,19 +1792,55 @@ async def unlock_secret_landing(request):
             scheme = "https"
         host = request.host
         base_url = f"{scheme}://{host}"
-        context = {
+        context = {"max_attempts": MAX_ATTEMPTS}
+        per_request = {
             "download_link": download_link,
             "download_code": download_code,
-            "max_attempts": MAX_ATTEMPTS,
             "base_url": base_url,
+            "expires_at": int(expiry_time.timestamp() * 1000),
+            "server_time": int(time.time() * 1000),
         }
-        return aiohttp_jinja2.render_template("download.html", request, context, app_key=APP_KEY)
+        return await render_page(request, "download.html", context, per_request=per_request)
 
-    response = aiohttp_jinja2.render_template("404.html", request, {}, app_key=APP_KEY)
-    response.set_status(404)
-    return response
+    return await render_page(request, "404.html", status=404)
+
+
+def parse_envelope(envelope):
+    """(salt, iv, ciphertext) of a stored secret's JSON envelope."""
+    encrypted_data = json_loads(envelope)
+    salt = base64.b64decode(encrypted_data["salt"])
+    iv = base64.b64decode(encrypted_data["iv"])
+    ciphertext = base64.b64decode(encrypted_data["ciphertext"])
+    return salt, iv, ciphertext
+
+
+def decrypt_envelope(envelope, key):
+    """
+    Decrypt a stored secret's JSON envelope with the user-supplied key.
+    Raises on a malformed envelope or a wrong key.
+    """
+    from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.backends import default_backend
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+    salt, iv, ciphertext = parse_envelope(envelope)
+    kdf = PBKDF2HMAC(
+        algorithm=hashes.SHA256(),
+        length=32,  # 256-bit key
+        salt=salt,
+        iterations=100000,
+        backend=default_backend(),
+    )
+    with span("kdf"), KDF_SECONDS.time():
+        aes_key = kdf.derive(key.encode())
+    aesgcm = AESGCM(aes_key)
+    with span("decrypt", bytes=len(ciphertext)), DECRYPT_SECONDS.time():
+        decrypted_bytes = aesgcm.decrypt(iv, ciphertext, None)
+    return decrypted_bytes.decode()
 
 
+@traced("unlock_secret_logic")
 async def unlock_secret_logic(download_code, key):
     """
     Common logic for unlocking secrets.
@@ -308,66 +1862,58 @@ async def unlock_secret_logic(download_code, key):
             "status": 400,
         }
 
-    async with aiosqlite.connect(DATABASE_PATH, detect_types=sqlite3.PARSE_DECLTYPES) as db:
-        async with db.execute(
-            "SELECT secret, attempts FROM secrets WHERE download_code=?",
-            (download_code,),
-        ) as cursor:
-            row = await cursor.fetchone()
-        if not row:
+    if not code_filter.might_contain(download_code):
+        return False, {
+            "error": "Invalid download code or key.",
+            "status": 404,
+        }
+
+    row = await fetch_secret(download_code)
+    if not row:
+        code_filter.record_miss(download_code)
+        return False, {
+            "error": "Invalid download code or key.",
+            "status": 404,
+        }
+    encrypted_secret_json, attempts, upload_time = row
+
+    try:
+        decrypted_secret = decrypt_envelope(encrypted_secret_json, key)
+    except Exception:
+        # Increase the failure count. Pending in-memory counts are newer than the row.
+        attempts = attempt_counter.current(download_code, attempts) + 1
+        FAILED_ATTEMPTS.inc("deleted" if attempts >= MAX_ATTEMPTS else "retry")
+        if attempts >= MAX_ATTEMPTS:
+            if await delete_secret(download_code):
+                storage_stats.removed(len(encrypted_secret_json), upload_time, "max_attempts")
+            return False, {
+                "error": "Incorrect key. Maximum attempts reached. Secret deleted.",
+                "status": 400,
+            }
+        else:
+            await set_attempts(download_code, attempts)
+            remaining = MAX_ATTEMPTS - attempts
             return False, {
-                "error": "Invalid download code or key.",
-                "status": 404,
+                "error": "Incorrect key.",
+                "status": 400,
+                "attempts_remaining": remaining,
             }
-        encrypted_secret_json, attempts = row
 
-        try:
-            encrypted_data = json.loads(encrypted_secret_json)
-            salt = base64.b64decode(encrypted_data["salt"])
-            iv = base64.b64decode(encrypted_data["iv"])
-            ciphertext = base64.b64decode(encrypted_data["ciphertext"])
-
-            kdf = PBKDF2HMAC(
-                algorithm=hashes.SHA256(),
-                length=32,  # 256-bit key
-                salt=salt,
-                iterations=100000,
-                backend=default_backend(),
-            )
-            aes_key = kdf.derive(key.encode())
-            aesgcm = AESGCM(aes_key)
-            decrypted_bytes = aesgcm.decrypt(iv, ciphertext, None)
-            decrypted_secret = decrypted_bytes.decode()
-        except Exception:
-            # Increase the failure count.
-            attempts += 1
-            if attempts >= MAX_ATTEMPTS:
-                await db.execute("DELETE FROM secrets WHERE download_code=?", (download_code,))
-                await db.commit()
-                return False, {
-                    "error": "Incorrect key. Maximum attempts reached. Secret deleted.",
-                    "status": 400,
-                }
-            else:
-                await db.execute(
-                    "UPDATE secrets SET attempts=? WHERE download_code=?",
-                    (attempts, download_code),
-                )
-                await db.commit()
-                remaining = MAX_ATTEMPTS - attempts
-                return False, {
-                    "error": "Incorrect key.",
-                    "status": 400,
-                    "attempts_remaining": remaining,
-                }
-
-        # On success, delete the secret.
-        await db.execute("DELETE FROM secrets WHERE download_code=?", (download_code,))
-        await db.commit()
+    # On success, delete the secret.
+    if not await delete_secret(download_code):
+        # A concurrent request claimed the secret first; it is only handed out once
+        return False, {
+            "error": "Invalid download code or key.",
+            "status": 404,
+        }
+    storage_stats.removed(len(encrypted_secret_json), upload_time, "claimed")
 
     return True, {"secret": decrypted_secret}
 
 
+@priority("critical")
+@no_compression
+@body_limit(MAX_UNLOCK_BODY_SIZE)
 async def unlock_secret(request):
     """
     Web endpoint for unlocking secrets.
@@ -378,12 +1924,16 @@ async def unlock_secret(request):
     """
     # Validate Content-Type header
     if not validate_json_content_type(request):
-        return web.json_response({"error": "Content-Type must be application/json."}, status=400)
+        return json_response({"error": "Content-Type must be application/json."}, status=400)
 
     try:
-        data = await request.json()
+        data = await request.json(loads=json_loads)
+    except web.HTTPException:
+        # Body over the limit; body_limit_middleware answers with 413
+        raise
     except Exception:
-        return web.json_response({"error": "Invalid JSON."}, status=400)
+        return json_response({"error": "Invalid JSON."}, status=400)
+    body_received()
 
     download_code = data.get("download_code")
     key = data.get("key")
@@ -391,49 +1941,64 @@ async def unlock_secret(request):
     success, result = await unlock_secret_logic(download_code, key)
 
     if success:
-        return web.json_response({"secret": result["secret"]})
+        return json_response({"secret": result["secret"]})
     else:
         status = result.get("status", 400)
         response_data = {"error": result["error"]}
         if "attempts_remaining" in result:
             response_data["attempts_remaining"] = result["attempts_remaining"]
-        return web.json_response(response_data, status=status)
+        return json_response(response_data, status=status)
 
 
+@priority("critical")
+@body_limit(MAX_LOCK_BODY_SIZE)
 async def api_lock_secret(request):
     """
     API endpoint for creating secrets via curl.
-    Accepts JSON: {"encrypted_secret": "..."}
+    Accepts JSON: {"encrypted_secret": "..."}, and an optional Idempotency-Key header
     Returns JSON: {"download_code": "...", "url": "..."}
     """
     ip = get_client_ip(request)
-    if await ip_reached_quota(ip):
-        return web.json_response(
+    try:
+        key = idempotency_key(request)
+    except ValueError as e:
+        return json_response({"error": str(e)}, status=400)
+    replay = key is not None and idempotency_cache.lookup(ip, key) is not None
+    if not replay and await ip_reached_quota(ip):
+        QUOTA_REJECTIONS.inc()
+        return json_response(
             {"error": "You have exceeded the maximum number of shares for today."},
             status=429,
         )
 
     # Validate Content-Type header
     if not validate_json_content_type(request):
-        return web.json_response({"error": "Content-Type must be application/json."}, status=400)
+        return json_response({"error": "Content-Type must be application/json."}, status=400)
 
     try:
-        data = await request.json()
+        data = await request.json(loads=json_loads)
+    except web.HTTPException:
+        # Body over the limit; body_limit_middleware answers with 413
+        raise
     except Exception:
-        return web.json_response({"error": "Invalid JSON."}, status=400)
+        return json_response({"error": "Invalid JSON."}, status=400)
+    body_received()
 
     encrypted_secret = data.get("encrypted_secret")
     if not encrypted_secret:
-        return web.json_response({"error": "Missing encrypted_secret field."}, status=400)
+        return json_response({"error": "Missing encrypted_secret field."}, status=400)
 
-    download_code, error = await store_secret(encrypted_secret, ip)
+    download_code, error = await store_secret_once(encrypted_secret, ip, key)
     if error:
-        return web.json_response({"error": error}, status=400)
+        return json_response({"error": error}, status=STORE_ERROR_STATUS.get(error, 400))
 
     download_url = f"/unlock/{download_code}"
-    return web.json_response({"download_code": download_code, "url": download_url})
+    return json_response({"download_code": download_code, "url": download_url})
 
 
+@priority("critical")
+@no_compression
+@body_limit(MAX_UNLOCK_BODY_SIZE)
 async def api_unlock_secret(request):
     """
     API endpoint for retrieving secrets via curl.
@@ -442,12 +2007,16 @@ async def api_unlock_secret(request):
     """
     # Validate Content-Type header
     if not validate_json_content_type(request):
-        return web.json_response({"error": "Content-Type must be application/json."}, status=400)
+        return json_response({"error": "Content-Type must be application/json."}, status=400)
 
     try:
-        data = await request.json()
+        data = await request.json(loads=json_loads)
+    except web.HTTPException:
+        # Body over the limit; body_limit_middleware answers with 413
+        raise
     except Exception:
-        return web.json_response({"error": "Invalid JSON."}, status=400)
+        return json_response({"error": "Invalid JSON."}, status=400)
+    body_received()
 
     download_code = data.get("download_code")
     key = data.get("key")
@@ -463,15 +2032,21 @@ async def api_unlock_secret(request):
         response_data = {"error": result["error"]}
         if "attempts_remaining" in result:
             response_data["attempts_remaining"] = result["attempts_remaining"]
-        return web.json_response(response_data, status=status)
+        return json_response(response_data, status=status)
 
 
+# NotFoundResponses compresses its pages ahead of time
+@priority("low")
+@no_compression
 async def handle_404(request):
-    response = aiohttp_jinja2.render_template("404.html", request, {}, app_key=APP_KEY)
-    response.set_status(404)
-    return response
+    not_found = request.config_dict.get(NOT_FOUND_KEY)
+    if not_found is not None:
+        return not_found.response(request)
+    return await render_page(request, "404.html", status=404)
 
 
+@priority("low")
+@traced("check_limit")
 async def check_limit(request):
     ip = get_client_ip(request)
     # Clean up expired records if needed.
@@ -480,19 +2055,17 @@ async def check_limit(request):
     current_time = datetime.now()
     next_quota_renewal = timedelta(minutes=QUOTA_RENEWAL_MINUTES)
 
-    async with aiosqlite.connect(DATABASE_PATH, detect_types=sqlite3.PARSE_DECLTYPES) as db:
-        async with db.execute("SELECT uses, last_access FROM ip_usage WHERE ip=?", (ip,)) as cursor:
-            row = await cursor.fetchone()
-        if row:
-            uses, last_access = row
-            if last_access >= (current_time - timedelta(minutes=QUOTA_RENEWAL_MINUTES)):
-                quota_left = MAX_USES_QUOTA - uses
-                next_quota_renewal = (
-                    last_access + timedelta(minutes=QUOTA_RENEWAL_MINUTES)
-                ) - current_time
+    row = await get_ip_usage(ip)
+    if row:
+        uses, last_access = row
+        if last_access >= (current_time - timedelta(minutes=QUOTA_RENEWAL_MINUTES)):
+            quota_left = MAX_USES_QUOTA - uses
+            next_quota_renewal = (
+                last_access + timedelta(minutes=QUOTA_RENEWAL_MINUTES)
+            ) - current_time
 
     if await ip_reached_quota(ip):
-        return web.json_response(
+        return json_response(
             {
                 "limit_reached": True,
                 "quota_left": quota_left,
@@ -501,7 +2074,7 @@ async def check_limit(request):
             }
         )
     else:
-        return web.json_response(
+        return json_response(
             {
                 "limit_reached": False,
                 "quota_left": quota_left,
@@ -511,155 +2084,964 @@ async def check_limit(request):
         )
 
 
+@priority("low")
 async def time_left(request):
+    """
+    Remaining time for a secret, for API clients. The download page counts down
+    locally and only calls this at expiry or after a failed unlock.
+    """
     download_code = request.match_info["download_code"]
     # Validate download code format
     if not validate_download_code(download_code):
-        return web.json_response({"message": "Invalid download code format."}, status=400)
+        return json_response({"message": "Invalid download code format."}, status=400)
 
-    async with aiosqlite.connect(DATABASE_PATH, detect_types=sqlite3.PARSE_DECLTYPES) as db:
-        async with db.execute(
-            "SELECT upload_time FROM secrets WHERE download_code=?", (download_code,)
-        ) as cursor:
-            row = await cursor.fetchone()
-    if row:
-        upload_time = row[0]
+    upload_time = None
+    if code_filter.might_contain(download_code):
+        upload_time = await get_upload_time(download_code)
+    if upload_time:
         expiry_time = upload_time + timedelta(minutes=SECRET_EXPIRY_MINUTES)
         current_time = datetime.now()
         remaining = expiry_time - current_time
         if remaining.total_seconds() > 0:
             hours_left = int(remaining.total_seconds() // 3600)
             minutes_left = int((remaining.total_seconds() % 3600) // 60)
-            return web.json_response(
+            # The answer only changes when the minute rolls over (or the secret is claimed)
+            max_age = min(TIME_LEFT_MAX_AGE_SECONDS, int(remaining.total_seconds() % 60) + 1)
+            return json_response(
                 {
                     "hours_left": hours_left,
                     "minutes_left": minutes_left,
+                    "expires_at": int(expiry_time.timestamp()),
                     "message": "The secret is available",
-                }
+                },
+                headers={"Cache-Control": f"private, max-age={max_age}"},
             )
         else:
-            return web.json_response({"message": "The secret has already expired."}, status=410)
+            return json_response(
+                {"message": "The secret has already expired."},
+                status=410,
+                headers={"Cache-Control": f"private, max-age={TIME_LEFT_GONE_MAX_AGE_SECONDS}"},
+            )
     else:
-        return web.json_response({"message": "Download code not found."}, status=404)
+        return json_response(
+            {"message": "Download code not found."},
+            status=404,
+            headers={"Cache-Control": f"private, max-age={TIME_LEFT_GONE_MAX_AGE_SECONDS}"},
+        )
 
 
 async def purge_expired():
     """Delete secrets older than the expiry time and clean up the ip_usage table."""
     expiry_time = datetime.now() - timedelta(minutes=SECRET_EXPIRY_MINUTES)
-    async with aiosqlite.connect(DATABASE_PATH, detect_types=sqlite3.PARSE_DECLTYPES) as db:
-        await db.execute("DELETE FROM secrets WHERE upload_time < ?", (expiry_time,))
-        cutoff_time = datetime.now() - timedelta(minutes=QUOTA_RENEWAL_MINUTES)
-        await db.execute("DELETE FROM ip_usage WHERE last_access < ?", (cutoff_time,))
-        await db.commit()
+    cutoff_time = datetime.now() - timedelta(minutes=QUOTA_RENEWAL_MINUTES)
+    with trace("purge_expired"), PURGE_SECONDS.time():
+        if STORAGE == "memory":
+            purged, ip_rows = memory_store.purge(expiry_time, cutoff_time)
+        else:
+            async with connect_db() as db:
+                async with db.execute(
+                    "DELETE FROM secrets WHERE upload_time < ? "
+                    "RETURNING download_code, length(secret), upload_time",
+                    (expiry_time,),
+                ) as cursor:
+                    purged = await cursor.fetchall()
+                cursor = await db.execute(
+                    "DELETE FROM ip_usage WHERE last_access < ?", (cutoff_time,)
+                )
+                await db.commit()
+            ip_rows = max(cursor.rowcount, 0)
+    PURGED_ROWS.inc("secrets", amount=len(purged))
+    PURGED_ROWS.inc("ip_usage", amount=ip_rows)
+    storage_stats.ip_usage_rows -= ip_rows
+    for code, size, upload_time in purged:
+        code_filter.remove(code)
+        attempt_counter.forget(code)
+        storage_stats.removed(size, upload_time, "expired")
+
+
+# --- Database Backup ---
+
+backup_logger = logging.getLogger("sharepass.backup")
+BACKUP_PATTERN = re.compile(r"^secrets-\d{8}-\d{6}\.db$")
+# Path, size and duration of the last backup this process wrote
+last_backup = {}
+
+
+class BackupRestarted(Exception):
+    """Writes restarted the copy more than BACKUP_MAX_RESTARTS times."""
+
+
+def copy_database(source_path, target_path):
+    """
+    Copy a live database with SQLite's online backup API, BACKUP_PAGES_PER_STEP pages at a
+    time with a pause of BACKUP_STEP_SLEEP after each step. The read lock is released
+    between steps, so requests keep writing. A write restarts the copy; after
+    BACKUP_MAX_RESTARTS restarts BackupRestarted is raised. The copy is never finished in
+    one step, which would hold back writers for as long as it takes.
+    """
+    partial_path = target_path + ".partial"
+    restarts = 0
+    last_remaining = None
+
+    def progress(status, remaining, total):
+        nonlocal restarts, last_remaining
+        if last_remaining is not None and remaining > last_remaining:
+            restarts += 1
+            if restarts > BACKUP_MAX_RESTARTS:
+                raise BackupRestarted(f"Backup restarted {restarts} times by writes.")
+        last_remaining = remaining
+        # sqlite3 only sleeps when a step is busy; runs on the executor thread, not the loop
+        if remaining:
+            time.sleep(BACKUP_STEP_SLEEP)
+
+    source = sqlite3.connect(pathlib.Path(source_path).resolve().as_uri() + "?mode=ro", uri=True)
+    try:
+        target = sqlite3.connect(partial_path)
+        try:
+            source.backup(
+                target, pages=BACKUP_PAGES_PER_STEP, progress=progress, sleep=BACKUP_STEP_SLEEP
+            )
+        finally:
+            target.close()
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(partial_path)
+        raise
+    finally:
+        source.close()
+    os.replace(partial_path, target_path)
+    return restarts
+
+
+def rotate_backups(directory, keep):
+    """Delete all but the newest `keep` backups; returns the deleted file names."""
+    backups = sorted(name for name in os.listdir(directory) if BACKUP_PATTERN.match(name))
+    expired = backups[:-keep] if keep > 0 else []
+    for name in expired:
+        os.remove(os.path.join(directory, name))
+    return expired
+
+
+async def backup_database():
+    """Back up the database to BACKUP_DIR without blocking requests; returns last_backup."""
+    if STORAGE == "memory":
+        return None
+    os.makedirs(BACKUP_DIR, exist_ok=True)
+    path = os.path.join(BACKUP_DIR, f"secrets-{datetime.now():%Y%m%d-%H%M%S}.db")
+    loop = asyncio.get_running_loop()
+    start = time.perf_counter()
+    with trace("backup_database"), BACKUP_SECONDS.time():
+        for attempt in range(1, BACKUP_MAX_ATTEMPTS + 1):
+            try:
+                restarts = await loop.run_in_executor(None, copy_database, DATABASE_PATH, path)
+                break
+            except BackupRestarted as e:
+                if attempt == BACKUP_MAX_ATTEMPTS:
+                    raise
+                backup_logger.warning(
+                    "%s Retrying in %d s (attempt %d of %d)",
+                    e,
+                    BACKUP_RETRY_SECONDS,
+                    attempt + 1,
+                    BACKUP_MAX_ATTEMPTS,
+                )
+                await asyncio.sleep(BACKUP_RETRY_SECONDS)
+        await loop.run_in_executor(None, rotate_backups, BACKUP_DIR, BACKUP_KEEP)
+    last_backup.update(
+        path=path,
+        bytes=os.path.getsize(path),
+        seconds=round(time.perf_counter() - start, 3),
+        restarts=restarts,
+        finished=datetime.now().isoformat(),
+    )
+    backup_logger.info(
+        "Backed up %s to %s: %d bytes in %.3f s (%d restarts)",
+        DATABASE_PATH,
+        path,
+        last_backup["bytes"],
+        last_backup["seconds"],
+        restarts,
+    )
+    return last_backup
+
+
+def restore_database(backup_path):
+    """
+    Replace the database with a backup. The server must be stopped. The backup is checked
+    for integrity and SCHEMA_VERSION before anything is touched; the replaced database is
+    kept next to it as secrets.db.pre-restore. Returns that path, or None.
+    """
+    for suffix in ("-journal", "-wal"):
+        if os.path.exists(DATABASE_PATH + suffix):
+            raise ValueError(
+                f"{DATABASE_PATH}{suffix} exists; stop the server cleanly before restoring."
+            )
+    if not os.path.isfile(backup_path):
+        raise ValueError(f"No such backup: {backup_path}")
+    backup = sqlite3.connect(pathlib.Path(backup_path).resolve().as_uri() + "?mode=ro", uri=True)
+    try:
+        (check,) = backup.execute("PRAGMA quick_check").fetchone()
+        (version,) = backup.execute("PRAGMA user_version").fetchone()
+        tables = {row[0] for row in backup.execute("SELECT name FROM sqlite_master")}
+    except sqlite3.DatabaseError as e:
+        raise ValueError(f"{backup_path} is not a readable database: {e}") from e
+    finally:
+        backup.close()
+    if check != "ok":
+        raise ValueError(f"{backup_path} failed the integrity check: {check}")
+    if version != SCHEMA_VERSION:
+        raise ValueError(
+            f"{backup_path} has schema version {version}, this version needs {SCHEMA_VERSION}."
+        )
+    if not {"secrets", "ip_usage"} <= tables:
+        raise ValueError(f"{backup_path} has no secrets and ip_usage tables.")
+
+    os.makedirs(os.path.dirname(DATABASE_PATH), exist_ok=True)
+    restoring_path = DATABASE_PATH + ".restoring"
+    shutil.copyfile(backup_path, restoring_path)
+    with open(restoring_path, "rb") as stream:
+        os.fsync(stream.fileno())
+    previous_path = None
+    if os.path.exists(DATABASE_PATH):
+        previous_path = DATABASE_PATH + ".pre-restore"
+        os.replace(DATABASE_PATH, previous_path)
+    os.replace(restoring_path, DATABASE_PATH)
+    return previous_path
+
+
+# --- Health Checks ---
+
+SCHEDULER_KEY = web.AppKey("scheduler", object)
+# Probes are not access logged or traced
+HEALTH_ROUTES = frozenset(("/healthz", "/readyz"))
+
+
+async def healthz(request):
+    """Liveness: the event loop is serving requests. No template or database access."""
+    return web.Response(text="ok", headers={"Cache-Control": "no-store"})
+
+
+async def check_database():
+    if STORAGE == "memory":
+        return
+    async with connect_db() as db:
+        async with db.execute("SELECT 1") as cursor:
+            await cursor.fetchone()
+
+
+async def readyz(request):
+    """Readiness: the database answers and the purge scheduler is running."""
+    checks = {}
+    try:
+        await asyncio.wait_for(check_database(), READINESS_TIMEOUT_SECONDS)
+        checks["database"] = "ok"
+    except asyncio.TimeoutError:
+        checks["database"] = "timeout"
+    except sqlite3.Error as exc:
+        checks["database"] = f"error: {exc}"
+    scheduler = request.app.get(SCHEDULER_KEY)
+    checks["scheduler"] = "ok" if scheduler is not None and scheduler.running else "stopped"
+    ready = all(result == "ok" for result in checks.values())
+    return json_response(
+        {"status": "ok" if ready else "unavailable", "checks": checks},
+        status=200 if ready else 503,
+        headers={"Cache-Control": "no-store"},
+    )
+
+
+# --- Access Log ---
+
+
+def parse_sample_rates(value):
+    """Parse "/static=0.01,/check-limit=0.1" into [(prefix, rate)], longest prefix first."""
+    rates = []
+    for item in value.split(","):
+        prefix, _, rate = item.partition("=")
+        if prefix.strip() and rate.strip():
+            rates.append((prefix.strip(), min(max(float(rate), 0.0), 1.0)))
+    return sorted(rates, key=lambda entry: len(entry[0]), reverse=True)
+
+
+class AccessLogBuffer:
+    """
+    Bounded in-memory queue of access log records, written as JSON lines by a
+    background thread. Records are dropped (and counted) when the queue is full,
+    so a slow log sink never slows down request handling.
+    """
+
+    def __init__(self, max_size=ACCESS_LOG_QUEUE_SIZE, sample_rates=ACCESS_LOG_SAMPLE_RATES):
+        self.max_size = max_size
+        self.sample_rates = parse_sample_rates(sample_rates)
+        # Clients are logged keyed with a per-process secret: an unkeyed hash of an
+        # IPv4 address is reversed by hashing all 2^32 of them
+        self.client_key = secrets.token_bytes(32)
+        self.records = collections.deque()
+        self.written = 0
+        self.dropped = 0
+        self.sampled_out = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self._stream = None
+
+    def client_id(self, client_ip):
+        """Pseudonym of a (hashed) client IP, stable until the process restarts."""
+        return hmac.new(self.client_key, client_ip.encode(), hashlib.sha256).hexdigest()[:16]
+
+    def should_log(self, route, status):
+        # Server errors are always logged, whatever the sample rate
+        if status >= 500:
+            return True
+        for prefix, rate in self.sample_rates:
+            if route.startswith(prefix):
+                if rate < 1.0 and random.random() >= rate:  # nosec B311 - sampling only
+                    self.sampled_out += 1
+                    return False
+                return True
+        return True
+
+    def append(self, record):
+        if len(self.records) >= self.max_size:
+            self.dropped += 1
+            return
+        self.records.append(record)
+
+    def flush(self):
+        """Write all queued records; runs on the writer thread (or at shutdown)."""
+        records = self.records
+        lines = []
+        while records:
+            lines.append(json_dumps(records.popleft()))
+        if not lines:
+            return
+        stream = self._stream or sys.stdout
+        try:
+            stream.write("\n".join(lines) + "\n")
+            stream.flush()
+            self.written += len(lines)
+        except (OSError, ValueError):
+            self.dropped += len(lines)
+
+    def _run(self, interval):
+        while not self._stop.wait(interval):
+            self.flush()
+        self.flush()
+
+    def start(self, path=ACCESS_LOG_FILE, interval=ACCESS_LOG_FLUSH_SECONDS):
+        if self._thread is not None:
+            return
+        self._stream = open(path, "a", encoding="utf-8") if path else None
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, args=(interval,), name="access-log", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+
+
+access_log_buffer = AccessLogBuffer()
+
+
+def route_name(request):
+    """The route pattern of a request, e.g. "/unlock/{download_code}" (never the code)."""
+    match_info = getattr(request, "match_info", None)
+    route = getattr(match_info, "route", None)
+    resource = getattr(route, "resource", None)
+    return resource.canonical if resource is not None else "-"
+
+
+class BufferedAccessLogger(AbstractAccessLogger):
+    """
+    aiohttp access logger that only builds a small record and queues it.
+    Formatting and writing happen on the access log thread.
+    """
+
+    def log(self, request, response, elapsed):
+        route = route_name(request)
+        status = response.status
+        if route in HEALTH_ROUTES or not access_log_buffer.should_log(route, status):
+            return
+        access_log_buffer.append(
+            {
+                "ts": round(time.time(), 3),
+                "method": request.method,
+                "route": route,
+                "status": status,
+                "latency_ms": round(elapsed * 1000, 3),
+                "bytes": response.body_length,
+                "client": access_log_buffer.client_id(get_client_ip(request)),
+            }
+        )
+
+
+async def start_access_log(app):
+    access_log_buffer.start()
+
+
+async def stop_access_log(app):
+    access_log_buffer.stop()
+
+
+# --- Metrics Endpoint ---
+
+LIVE_SECRETS = Gauge(
+    "sharepass_live_secrets",
+    "Secrets currently stored.",
+    lambda: storage_stats.live_secrets,
+)
+CODE_FILTER_HITS = CallbackCounter(
+    "sharepass_code_filter_hits_total",
+    "Lookups answered by the download code filter without a query.",
+    lambda: code_filter.hits,
+)
+CODE_FILTER_FALSE_POSITIVES = CallbackCounter(
+    "sharepass_code_filter_false_positives_total",
+    "Unknown codes that passed the download code filter and cost a query.",
+    lambda: code_filter.false_positives,
+)
+LAST_BACKUP_BYTES = Gauge(
+    "sharepass_last_backup_bytes",
+    "Size of the last database backup.",
+    lambda: last_backup.get("bytes", 0),
+)
+ACCESS_LOG_DROPPED = CallbackCounter(
+    "sharepass_access_log_dropped_total",
+    "Access log records dropped.",
+    lambda: access_log_buffer.dropped,
+)
+
+PENDING_ATTEMPTS = Gauge(
+    "sharepass_pending_failed_attempts",
+    "Failed-attempt counts not yet written to the database.",
+    lambda: len(attempt_counter.dirty),
+)
+
+METRICS_RUNNER_KEY = web.AppKey("metrics_runner", web.AppRunner)
+
+
+async def metrics(request):
+    if not client_allowed(request, parse_allowed_networks(METRICS_ALLOWED_IPS)):
+        return await handle_404(request)
+    return web.Response(
+        text=render_metrics(),
+        content_type="text/plain",
+        headers={"Cache-Control": "no-store"},
+    )
+
+
+async def start_metrics_server(app):
+    """Serve /metrics on METRICS_PORT, away from the public listener."""
+    metrics_app = web.Application()
+    metrics_app.router.add_get("/metrics", metrics)
+    runner = web.AppRunner(metrics_app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "0.0.0.0", METRICS_PORT).start()  # nosec B104
+    app[METRICS_RUNNER_KEY] = runner
+
+
+async def stop_metrics_server(app):
+    runner = app.get(METRICS_RUNNER_KEY)
+    if runner is not None:
+        await runner.cleanup()
+
+
+# --- Event Loop Monitor ---
+
+loop_logger = logging.getLogger("sharepass.loop")
+
+
+class LoopMonitor:
+    """
+    Measures event loop lag with a task that sleeps for a fixed interval and records
+    how late it wakes up. A watchdog thread notices when the task has not run for
+    longer than the threshold and logs the stack of the loop thread while it is still
+    blocked, which points at the synchronous code responsible.
+    """
+
+    def __init__(self, interval_ms=LOOP_MONITOR_INTERVAL_MS, threshold_ms=LOOP_LAG_THRESHOLD_MS):
+        self.interval = interval_ms / 1000
+        self.threshold = threshold_ms / 1000
+        self.heartbeat = time.monotonic()
+        self.blocked = 0
+        self._reported_heartbeat = None
+        self._loop_thread_id = None
+        self._task = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    async def _probe(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            self.heartbeat = time.monotonic()
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            LOOP_LAG_SECONDS.observe(max(loop.time() - start - self.interval, 0.0))
+
+    def check(self):
+        """Sample the loop thread if it has been blocked past the threshold (once per stall)."""
+        heartbeat = self.heartbeat
+        stalled = time.monotonic() - heartbeat - self.interval
+        if stalled < self.threshold or heartbeat == self._reported_heartbeat:
+            return None
+        self._reported_heartbeat = heartbeat
+        self.blocked += 1
+        LOOP_BLOCKED.inc()
+        frame = sys._current_frames().get(self._loop_thread_id)
+        stack = "".join(traceback.format_stack(frame)) if frame is not None else ""
+        loop_logger.warning("Event loop blocked for %.0f ms:\n%s", stalled * 1000, stack)
+        return stack
+
+    def _watch(self):
+        while not self._stop.wait(max(self.threshold / 4, 0.01)):
+            self.check()
+
+    def start(self):
+        if self._task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._reported_heartbeat = None
+        self.heartbeat = time.monotonic()
+        self._task = asyncio.get_running_loop().create_task(self._probe())
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name="loop-monitor", daemon=True)
+        self._thread.start()
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self._task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await self._task
+        self._task = None
+
+
+loop_monitor = LoopMonitor()
+
+
+async def start_loop_monitor(app):
+    loop_monitor.start()
+
+
+async def stop_loop_monitor(app):
+    await loop_monitor.stop()
+
+
+# --- Profiling ---
+# Opt-in profiling of the running server. A CPU profile (cProfile) or an allocation
+# snapshot (tracemalloc) is taken for a number of seconds and written to PROFILE_DIR.
+
+PROFILE_KINDS = ("cpu", "memory")
+PROFILE_TOP_ALLOCATIONS = 50
+
+
+class Profiler:
+    def __init__(self):
+        self.task = None
+
+    @property
+    def running(self):
+        return self.task is not None and not self.task.done()
+
+    def start(self, kind, seconds):
+        """Start a profile in the background and return the file it will be written to."""
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        extension = "prof" if kind == "cpu" else "txt"
+        path = os.path.join(PROFILE_DIR, f"{kind}-{stamp}.{extension}")
+        run = self.profile_cpu if kind == "cpu" else self.profile_memory
+        self.task = asyncio.get_running_loop().create_task(run(path, seconds))
+        return path
+
+    async def profile_cpu(self, path, seconds):
+        # Everything the app runs is on the event loop thread, which is the one profiled
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profile.disable()
+        await asyncio.get_running_loop().run_in_executor(None, self.write_cpu, profile, path)
+
+    async def profile_memory(self, path, seconds):
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+        try:
+            await asyncio.sleep(seconds)
+            snapshot = tracemalloc.take_snapshot()
+        finally:
+            if started:
+                tracemalloc.stop()
+        await asyncio.get_running_loop().run_in_executor(None, self.write_memory, snapshot, path)
+
+    @staticmethod
+    def write_cpu(profile, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        profile.dump_stats(path)
+
+    @staticmethod
+    def write_memory(snapshot, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        stats = snapshot.statistics("lineno")
+        with open(path, "w", encoding="utf-8") as stream:
+            stream.write(f"Total traced: {sum(stat.size for stat in stats)} bytes\n")
+            for stat in stats[:PROFILE_TOP_ALLOCATIONS]:
+                stream.write(f"{stat}\n")
+
+
+profiler = Profiler()
+
+
+async def admin_profile(request):
+    """Start a profile: POST /admin/profile?kind=cpu|memory&seconds=N (loopback only)."""
+    if not client_allowed(request, parse_allowed_networks(ADMIN_ALLOWED_IPS)):
+        return await handle_404(request)
+    kind = request.query.get("kind", "cpu")
+    if kind not in PROFILE_KINDS:
+        return json_response({"error": "kind must be cpu or memory."}, status=400)
+    try:
+        seconds = int(request.query.get("seconds", PROFILE_SECONDS))
+    except ValueError:
+        return json_response({"error": "seconds must be an integer."}, status=400)
+    if not 1 <= seconds <= PROFILE_MAX_SECONDS:
+        return json_response(
+            {"error": f"seconds must be between 1 and {PROFILE_MAX_SECONDS}."}, status=400
+        )
+    if profiler.running:
+        return json_response({"error": "A profile is already running."}, status=409)
+    path = profiler.start(kind, seconds)
+    return json_response({"kind": kind, "seconds": seconds, "file": path}, status=202)
+
+
+def profile_on_signal(kind):
+    if not profiler.running:
+        # Signals have no request to refuse, so an out-of-range setting is clamped
+        profiler.start(kind, min(max(PROFILE_SECONDS, 1), PROFILE_MAX_SECONDS))
+
+
+async def start_profile_signals(app):
+    """SIGUSR1 takes a CPU profile and SIGUSR2 an allocation snapshot."""
+    loop = asyncio.get_running_loop()
+    loop.add_signal_handler(signal.SIGUSR1, profile_on_signal, "cpu")
+    loop.add_signal_handler(signal.SIGUSR2, profile_on_signal, "memory")
+
+
+async def stop_profile_signals(app):
+    loop = asyncio.get_running_loop()
+    loop.remove_signal_handler(signal.SIGUSR1)
+    loop.remove_signal_handler(signal.SIGUSR2)
+
+
+# --- Security Headers ---
+
+# Headers that reveal details about the server stack. aiohttp adds "Server" itself
+# while preparing the response, so they are stripped in the on_response_prepare hook.
+HIDDEN_HEADERS = ("Server", "X-Powered-By", "X-Runtime", "X-Version")
+
+# Marker replaced with the per-request nonce in the precomputed CSP template
+CSP_NONCE_MARKER = "{csp_nonce}"
+
+# Restrict dangerous browser features
+PERMISSIONS_POLICY = (
+    "geolocation=(), "
+    "microphone=(), "
+    "camera=(), "
+    "payment=(), "
+    "usb=(), "
+    "magnetometer=(), "
+    "gyroscope=(), "
+    "accelerometer=(), "
+    "ambient-light-sensor=(), "
+    "autoplay=(), "
+    "encrypted-media=(), "
+    "fullscreen=(self), "
+    "picture-in-picture=()"
+)
+
+SECURITY_HEADERS_KEY = web.AppKey("security_headers", dict)
+
+
+def build_security_headers(analytics_script_csp="", https_only=False):
+    """
+    Assemble the security headers once, so responses only need a nonce substitution.
+    Returns a dict with:
+      - "page": static headers for HTML and other documents
+      - "csp": the page CSP without a nonce
+      - "csp_template": the page CSP with CSP_NONCE_MARKER in script-src
+      - "asset": a slimmer header set for static assets and JSON responses
+    """
+    # Set Content Security Policy with nonce instead of unsafe-inline for scripts
+    # Note: style-src still uses unsafe-inline as it's less critical and harder to fix
+    extra_src = f" {analytics_script_csp}" if analytics_script_csp else ""
+    csp_tail = "style-src 'self' 'unsafe-inline'; font-src 'self'; img-src 'self' data:;"
+    csp = f"default-src 'self'{extra_src}; script-src 'self'{extra_src}; {csp_tail}"
+    csp_template = (
+        f"default-src 'self'{extra_src}; "
+        f"script-src 'self' 'nonce-{CSP_NONCE_MARKER}'{extra_src}; {csp_tail}"
+    )
+
+    common = {
+        # Prevent MIME type sniffing
+        "X-Content-Type-Options": "nosniff",
+        # Prevent clickjacking
+        "X-Frame-Options": "SAMEORIGIN",
+        # Referrer information policy
+        "Referrer-Policy": "same-origin",
+    }
+    # Use HSTS if serving over HTTPS
+    if https_only:
+        common["Strict-Transport-Security"] = "max-age=31536000; includeSubDomains; preload"
+
+    page = dict(common)
+    page["Permissions-Policy"] = PERMISSIONS_POLICY
+
+    # Assets and JSON are never rendered as documents, so they get a locked-down CSP
+    # and skip the Permissions-Policy.
+    asset = dict(common)
+    asset["Content-Security-Policy"] = "default-src 'none'; frame-ancestors 'self';"
+
+    return {"page": page, "csp": csp, "csp_template": csp_template, "asset": asset}
+
+
+@functools.lru_cache(maxsize=4)
+def _default_security_headers(analytics_script_csp, https_only):
+    """Fallback for apps that use the middleware without going through create_app."""
+    return build_security_headers(analytics_script_csp, https_only)
+
+
+async def strip_server_headers(request, response):
+    """on_response_prepare hook removing headers that reveal server details."""
+    headers = response.headers
+    for header in HIDDEN_HEADERS:
+        headers.popall(header, None)
 
 
 # --- Middleware ---
 
 
+@web.middleware
+async def metrics_middleware(request, handler):
+    """Count requests and record their latency per route pattern and status."""
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await handler(request)
+        status = response.status
+        return response
+    except web.HTTPException as exc:
+        status = exc.status
+        raise
+    finally:
+        route = route_name(request)
+        HTTP_REQUESTS.inc(route, request.method, status)
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, route)
+
+
+@web.middleware
+async def tracing_middleware(request, handler):
+    """Trace each request; the span tree is logged if it is slower than TRACE_SLOW_REQUEST_MS."""
+    route = route_name(request)
+    if route in HEALTH_ROUTES:
+        return await handler(request)
+    with trace(f"{request.method} {route}") as root:
+        response = await handler(request)
+        if root is not None:
+            root.attributes["status"] = response.status
+        return response
+
+
 @web.middleware
 async def security_headers_middleware(request, handler):
     response = await handler(request)
 
-    # Hide server information - remove headers that reveal server details
-    # This makes it harder for attackers to identify the server stack
-    # Note: aiohttp automatically adds Server header, so we remove it here
-    headers_to_remove = [
-        "Server",  # Remove server type/version (aiohttp adds this automatically)
-        "X-Powered-By",  # Remove framework information
-        "X-Runtime",  # Remove runtime information
-        "X-Version",  # Remove version information
-    ]
-    for header in headers_to_remove:
-        # Use del to ensure header is completely removed
-        if header in response.headers:
-            del response.headers[header]
+    security_headers = request.app.get(SECURITY_HEADERS_KEY)
+    if security_headers is None:
+        security_headers = _default_security_headers(ANALYTICS_SCRIPT_CSP, HTTPS_ONLY)
 
-    # Get nonce from request (set by context processor)
-    nonce = request.get("csp_nonce", "")
+    if "Content-Security-Policy" in response.headers:
+        # Pre-built responses carry their complete header set
+        return response
 
-    # Set Content Security Policy with nonce instead of unsafe-inline for scripts
-    # Note: style-src still uses unsafe-inline as it's less critical and harder to fix
-    script_src_parts = ["'self'"]
+    if isinstance(response, web.FileResponse) or response.content_type == "application/json":
+        response.headers.update(security_headers["asset"])
+        return response
+
+    response.headers.update(security_headers["page"])
+    # Get nonce from request (set by context processor)
+    nonce = request.get("csp_nonce")
     if nonce:
-        script_src_parts.append(f"'nonce-{nonce}'")
-    if ANALYTICS_SCRIPT_CSP:
-        script_src_parts.append(ANALYTICS_SCRIPT_CSP)
-
-    default_src_parts = ["'self'"]
-    if ANALYTICS_SCRIPT_CSP:
-        default_src_parts.append(ANALYTICS_SCRIPT_CSP)
-
-    csp_parts = [
-        f"default-src {' '.join(default_src_parts)}",
-        f"script-src {' '.join(script_src_parts)}",
-        "style-src 'self' 'unsafe-inline'",
-        "font-src 'self'",
-        "img-src 'self' data:",
-    ]
-    csp = "; ".join(csp_parts) + ";"
+        csp = security_headers["csp_template"].replace(CSP_NONCE_MARKER, nonce)
+    else:
+        csp = security_headers["csp"]
     response.headers["Content-Security-Policy"] = csp
+    return response
 
-    # Add Permissions-Policy header to restrict dangerous features
-    permissions_policy = (
-        "geolocation=(), "
-        "microphone=(), "
-        "camera=(), "
-        "payment=(), "
-        "usb=(), "
-        "magnetometer=(), "
-        "gyroscope=(), "
-        "accelerometer=(), "
-        "ambient-light-sensor=(), "
-        "autoplay=(), "
-        "encrypted-media=(), "
-        "fullscreen=(self), "
-        "picture-in-picture=()"
-    )
-    response.headers["Permissions-Policy"] = permissions_policy
 
-    # Prevent MIME type sniffing
-    response.headers["X-Content-Type-Options"] = "nosniff"
-    # Prevent clickjacking
-    response.headers["X-Frame-Options"] = "SAMEORIGIN"
-    # Use HSTS if serving over HTTPS
-    if HTTPS_ONLY:
-        response.headers["Strict-Transport-Security"] = (
-            "max-age=31536000; includeSubDomains; preload"
-        )
-    # Referrer information policy
-    response.headers["Referrer-Policy"] = "same-origin"
+@web.middleware
+async def load_shedding_middleware(request, handler):
+    """Refuse requests with a fast 503 when their class is at its limit or overloaded."""
+    name = getattr(request.match_info.handler, "priority", None)
+    if name is None:
+        return await handler(request)
+    if not load_shedder.admit(name):
+        SHED_REQUESTS.inc(name)
+        return server_busy(request)
+    load_shedder.started(name)
+    clock = [None]
+    token = request_clock.set(clock)
+    if not request.body_exists:
+        body_received()
+    try:
+        return await handler(request)
+    finally:
+        request_clock.reset(token)
+        seconds = time.perf_counter() - clock[0] if clock[0] is not None else None
+        load_shedder.finished(name, seconds)
+
+
+@web.middleware
+async def body_limit_middleware(request, handler):
+    """
+    Enforce the handler's @body_limit. Bodies with a larger Content-Length are refused
+    before anything is read; bodies without one (chunked) get the limit as their
+    client_max_size, so reading them stops as soon as it is exceeded.
+    """
+    max_size = getattr(request.match_info.handler, "max_body_size", None)
+    if max_size is None:
+        return await handler(request)
+    if request.content_length is not None:
+        if request.content_length > max_size:
+            return body_too_large(request, max_size)
+        return await handler(request)
+    try:
+        return await handler(request.clone(client_max_size=max_size))
+    except web.HTTPRequestEntityTooLarge:
+        return body_too_large(request, max_size)
+
+
+@web.middleware
+async def compression_middleware(request, handler):
+    """
+    Compress HTML, JSON and text responses above COMPRESSION_MIN_SIZE with brotli or
+    gzip, negotiated from Accept-Encoding. Static files are served precompressed and
+    handlers marked with @no_compression are skipped.
+    """
+    response = await handler(request)
+
+    if type(response) is not web.Response or "Content-Encoding" in response.headers:
+        return response
+    if response.content_type not in COMPRESSIBLE_CONTENT_TYPES:
+        return response
+    if getattr(request.match_info.handler, "no_compression", False):
+        return response
+    body = response.body
+    if not isinstance(body, bytes) or len(body) < COMPRESSION_MIN_SIZE:
+        return response
+
+    response.headers.add("Vary", "Accept-Encoding")
+    encoding = negotiate_encoding(request.headers.get("Accept-Encoding", ""))
+    if encoding is None:
+        return response
+
+    if len(body) > COMPRESSION_EXECUTOR_SIZE:
+        loop = asyncio.get_running_loop()
+        compressed = await loop.run_in_executor(None, compress_body, body, encoding)
+    else:
+        compressed = compress_body(body, encoding)
+    response.body = compressed
+    response.headers["Content-Encoding"] = encoding
     return response
 
 
 # --- Application Factory ---
 
 
+def template_auto_reload():
+    """TEMPLATE_AUTO_RELOAD if set, otherwise on for development versions."""
+    if TEMPLATE_AUTO_RELOAD:
+        return TEMPLATE_AUTO_RELOAD.lower() == "true"
+    return read_version().endswith("-development")
+
+
+async def startup_maintenance():
+    await code_filter.rebuild()
+    # Counters before the purge, so the purge is counted against them
+    await storage_stats.reconcile()
+    await purge_expired()
+
+
+async def background_jobs(app):
+    """
+    Start the purge scheduler on the server's event loop and run the code filter rebuild,
+    initial stats count and purge as a background task, so a large database does not
+    delay binding the port.
+    """
+    scheduler = app[SCHEDULER_KEY]
+    scheduler.start()
+    initial_maintenance = asyncio.get_running_loop().create_task(startup_maintenance())
+    yield
+    initial_maintenance.cancel()
+    await asyncio.gather(initial_maintenance, return_exceptions=True)
+    scheduler.shutdown(wait=False)
+    await attempt_counter.flush()
+
+
 async def create_app(purge_interval_minutes=PURGE_INTERVAL_MINUTES):
     # Limit requests to 0.5MB
-    app = web.Application(
-        client_max_size=MAX_CLIENT_SIZE, middlewares=[security_headers_middleware]
-    )
+    # The security headers middleware is outermost, so it sees the final response
+    # whether or not it was compressed.
+    # The metrics and tracing middlewares wrap everything, so latency includes the other
+    # middlewares.
+    # Load shedding runs before compression and before any body is read, so a shed
+    # request costs as little as possible.
+    middlewares = [security_headers_middleware, compression_middleware, body_limit_middleware]
+    if LOAD_SHEDDING:
+        middlewares.insert(1, load_shedding_middleware)
+    if TRACE_SLOW_REQUEST_MS or TRACE_EXPORT_FILE:
+        middlewares.insert(0, tracing_middleware)
+    if METRICS:
+        middlewares.insert(0, metrics_middleware)
+    app = web.Application(client_max_size=MAX_CLIENT_SIZE, middlewares=middlewares)
+
+    # Security headers only depend on configuration, so build them once per app
+    app[SECURITY_HEADERS_KEY] = build_security_headers(ANALYTICS_SCRIPT_CSP, HTTPS_ONLY)
 
     # Remove Server header using signal handler (aiohttp adds it automatically)
     # This ensures the header is removed even if aiohttp adds it after middleware runs
-    async def on_response_prepare(request, response):
-        # Remove Server header that aiohttp automatically adds
-        if "Server" in response.headers:
-            del response.headers["Server"]
+    app.on_response_prepare.append(strip_server_headers)
 
-    app.on_response_prepare.append(on_response_prepare)
+    import aiohttp_jinja2
+    import jinja2
 
+    # Templates are compiled once into the bytecode cache and, outside development,
+    # rendered pages are cached with placeholders for per-request values.
+    auto_reload = template_auto_reload()
     aiohttp_jinja2.setup(
         app,
         loader=jinja2.FileSystemLoader("./templates"),
         app_key=APP_KEY,
-        context_processors=[version_context_processor],
+        auto_reload=auto_reload,
+        bytecode_cache=jinja2.FileSystemBytecodeCache(TEMPLATE_BYTECODE_CACHE_DIR),
     )
+    if not auto_reload:
+        app[PAGE_CACHE_KEY] = {}
 
-    # Initialize the database
+    # Initialize the database; the code filter is built from it after startup
     await init_db()
 
     # Define routes
+    app.router.add_get("/healthz", healthz)
+    app.router.add_get("/readyz", readyz)
     app.router.add_get("/", index)
     app.router.add_post("/lock", upload_secret)
     app.router.add_get("/unlock/{download_code}", unlock_secret_landing)
@@ -669,23 +3051,94 @@ async def create_app(purge_interval_minutes=PURGE_INTERVAL_MINUTES):
     # API endpoints for CLI/curl usage
     app.router.add_post("/api/lock", api_lock_secret)
     app.router.add_post("/api/unlock", api_unlock_secret)
-    app.router.add_static("/static", "./static")
+    if METRICS and not METRICS_PORT:
+        app.router.add_get("/metrics", metrics)
+    if PROFILING:
+        app.router.add_post("/admin/profile", admin_profile)
+    app.router.add_get("/admin/stats", admin_stats)
+    manifest = setup_static_assets(app, STATIC_DIR)
+    # Templates resolve asset URLs through the manifest
+    aiohttp_jinja2.get_env(app, app_key=APP_KEY).globals["asset_url"] = functools.partial(
+        asset_url, manifest
+    )
     app.router.add_get("/{tail:.*}", handle_404)
+    if not auto_reload:
+        # Templates do not change without auto_reload, so the 404 page is built once
+        app[NOT_FOUND_KEY] = NotFoundResponses.render(
+            aiohttp_jinja2.get_env(app, app_key=APP_KEY), app[SECURITY_HEADERS_KEY]
+        )
 
-    # Run initial cleanup
-    await purge_expired()
+    if ACCESS_LOG:
+        app.on_startup.append(start_access_log)
+        app.on_cleanup.append(stop_access_log)
+    if METRICS and METRICS_PORT:
+        app.on_startup.append(start_metrics_server)
+        app.on_cleanup.append(stop_metrics_server)
+    if LOOP_MONITOR:
+        app.on_startup.append(start_loop_monitor)
+        app.on_cleanup.append(stop_loop_monitor)
+    if PROFILING:
+        app.on_startup.append(start_profile_signals)
+        app.on_cleanup.append(stop_profile_signals)
+
+    # Periodic cleanup, started with the server together with the initial purge
+    from apscheduler.schedulers.asyncio import AsyncIOScheduler
 
-    # Schedule periodic background cleanup
     scheduler = AsyncIOScheduler()
     scheduler.add_job(purge_expired, "interval", minutes=purge_interval_minutes)
-    scheduler.start()
+    scheduler.add_job(storage_stats.reconcile, "interval", minutes=STATS_RECONCILE_MINUTES)
+    if STORAGE != "memory" and BACKUP_INTERVAL_MINUTES:
+        scheduler.add_job(backup_database, "interval", minutes=BACKUP_INTERVAL_MINUTES)
+    if STORAGE != "memory" and ATTEMPTS_DURABILITY != "sync":
+        scheduler.add_job(attempt_counter.flush, "interval", seconds=ATTEMPTS_FLUSH_SECONDS)
+    app[SCHEDULER_KEY] = scheduler
+    app.cleanup_ctx.append(background_jobs)
 
     return app
 
 
-if __name__ == "__main__":
-    import asyncio
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="sharepass server")
+    commands = parser.add_subparsers(dest="command")
+    commands.add_parser("serve", help="Run the server (default)")
+    commands.add_parser("backup", help="Back up the database to BACKUP_DIR and exit")
+    restore = commands.add_parser(
+        "restore", help="Replace the database with a backup (stop the server first)"
+    )
+    restore.add_argument("backup_file")
+    args = parser.parse_args()
+
+    if args.command == "backup":
+        if STORAGE == "memory":
+            parser.exit(1, "Nothing to back up with STORAGE=memory.\n")
+        try:
+            result = asyncio.run(backup_database())
+        except BackupRestarted as e:
+            parser.exit(1, f"{e} Try again when the server is less busy.\n")
+        print(json.dumps(result))
+        return
+    if args.command == "restore":
+        try:
+            previous_path = restore_database(args.backup_file)
+        except ValueError as e:
+            parser.exit(1, f"{e}\n")
+        print(f"Restored {DATABASE_PATH} from {args.backup_file}")
+        if previous_path:
+            print(f"The replaced database was kept as {previous_path}")
+        return
 
     app = asyncio.run(create_app())
     # Binding to 0.0.0.0 is required for container deployment
-    web.run_app(app, host="0.0.0.0", port=8080)  # nosec B104
+    web.run_app(
+        app,
+        host="0.0.0.0",  # nosec B104
+        port=8080,
+        access_log_class=BufferedAccessLogger,
+        access_log=aiohttp_access_logger if ACCESS_LOG else None,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+// build-assets.js
+//
+// Writes content-hashed copies of the static assets to app/static/dist, together
+// with precompressed .gz and .br variants for text assets and a manifest.json
+// that maps the original path (e.g. "css/main.css") to the hashed one.
+// The app resolves asset URLs through the manifest and serves the hashed files
+// with immutable caching.
+
+const crypto = require('crypto');
+const fs = require('fs');
+const path = require('path');
+const zlib = require('zlib');
+
+const STATIC_DIR = path.resolve(__dirname, './app/static');
+const DIST_DIR = path.join(STATIC_DIR, 'dist');
+const COMPRESSIBLE = new Set(['.js', '.css', '.svg', '.json', '.txt']);
+
+function listFiles(dir) {
+  return fs.readdirSync(dir, { withFileTypes: true }).flatMap((entry) => {
+    const fullPath = path.join(dir, entry.name);
+    if (entry.isDirectory()) {
+      return fullPath === DIST_DIR ? [] : listFiles(fullPath);
+    }
+    return [fullPath];
+  });
+}
+
+fs.rmSync(DIST_DIR, { recursive: true, force: true });
+
+const manifest = {};
+for (const file of listFiles(STATIC_DIR)) {
+  const relPath = path.relative(STATIC_DIR, file).split(path.sep).join('/');
+  const content = fs.readFileSync(file);
+  const hash = crypto.createHash('sha256').update(content).digest('hex').slice(0, 12);
+  const ext = path.extname(relPath);
+  const hashedRelPath = `dist/${relPath.slice(0, -ext.length || undefined)}.${hash}${ext}`;
+  const target = path.join(STATIC_DIR, hashedRelPath);
+
+  fs.mkdirSync(path.dirname(target), { recursive: true });
+  fs.writeFileSync(target, content);
+  if (COMPRESSIBLE.has(ext)) {
+    fs.writeFileSync(`${target}.gz`, zlib.gzipSync(content, { level: 9 }));
+    fs.writeFileSync(
+      `${target}.br`,
+      zlib.brotliCompressSync(content, {
+        params: { [zlib.constants.BROTLI_PARAM_QUALITY]: zlib.constants.BROTLI_MAX_QUALITY },
+      })
+    );
+  }
+  manifest[relPath] = hashedRelPath;
+}
+
+fs.writeFileSync(path.join(DIST_DIR, 'manifest.json'), JSON.stringify(manifest, null, 2));
+console.log(`Wrote ${Object.keys(manifest).length} hashed assets to ${DIST_DIR}`);
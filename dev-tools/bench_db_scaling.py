@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Database scaling benchmark.
+Bulk-populates a scratch secrets.db with N secrets (upload times spread over
+1.5x the expiry window, so about a third are expired) and M ip_usage rows, then
+times the app's own code paths at each size: landing page lookups, unknown-code
+probes (download code filter, then lookup) next to the raw database miss, wrong
+and correct unlocks, quota checks and a full purge_expired run. Reports latency and
+database file size as a function of N.
+
+Correct unlocks include the 100k-iteration PBKDF2, so compare them with the
+wrong-key unlocks (same query path, one fewer DELETE) for the database share.
+
+Usage:
+    python dev-tools/bench_db_scaling.py --sizes 10000,100000,1000000 --ip-rows 50000 \\
+        [--samples 200] [--secret-size 300] [--dir /tmp/sharepass-bench] [--output report.json]
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import string
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+# Make the app importable as app.app, and sharepass_cli, from the project root
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import app.app as sharepass  # noqa: E402
+from sharepass_cli import encrypt_secret  # noqa: E402
+
+CODE_CHARACTERS = string.ascii_letters + string.digits
+KEY = "bench-key"
+BATCH_SIZE = 50000
+
+
+def random_code():
+    return "".join(random.choices(CODE_CHARACTERS, k=12))  # nosec B311
+
+
+def populate(path, secrets_count, ip_rows, secret_size):
+    """Insert the rows with plain sqlite3 and bulk settings; returns some live codes."""
+    now = datetime.now()
+    window = sharepass.SECRET_EXPIRY_MINUTES * 60 * 1.5
+    live_window = sharepass.SECRET_EXPIRY_MINUTES * 60 * 0.9
+    blob = base64.b64encode(os.urandom(max(secret_size * 3 // 4, 16))).decode()
+    envelope = json.dumps({"salt": blob[:24], "iv": blob[:16], "ciphertext": blob})
+
+    live_codes = []
+    db = sqlite3.connect(path)
+    db.execute("PRAGMA journal_mode=OFF")
+    db.execute("PRAGMA synchronous=OFF")
+    remaining = secrets_count
+    while remaining:
+        batch = []
+        for _ in range(min(BATCH_SIZE, remaining)):
+            age = random.uniform(0, window)  # nosec B311
+            code = random_code()
+            if age < live_window and len(live_codes) < 10000:
+                live_codes.append(code)
+            batch.append((str(uuid.uuid4()), envelope, 0, code, now - timedelta(seconds=age)))
+        db.executemany(
+            "INSERT INTO secrets (id, secret, attempts, download_code, upload_time) VALUES (?, ?, ?, ?, ?)",
+            batch,
+        )
+        remaining -= len(batch)
+
+    quota_window = sharepass.QUOTA_RENEWAL_MINUTES * 60 * 1.5
+    ips = [
+        sharepass.hash_ip(f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}") for i in range(ip_rows)
+    ]
+    db.executemany(
+        "INSERT INTO ip_usage (ip, uses, last_access) VALUES (?, ?, ?)",
+        [
+            (
+                ip,
+                random.randint(1, sharepass.MAX_USES_QUOTA),  # nosec B311
+                now - timedelta(seconds=random.uniform(0, quota_window)),  # nosec B311
+            )
+            for ip in ips
+        ],
+    )
+    db.commit()
+    db.execute("ANALYZE")
+    db.close()
+    return live_codes, ips
+
+
+async def time_calls(func, args_list):
+    """Return latency statistics in milliseconds for func(*args) over args_list."""
+    latencies = []
+    for args in args_list:
+        start = time.perf_counter()
+        await func(*args)
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return {
+        "mean_ms": round(statistics.fmean(latencies), 3),
+        "p50_ms": round(latencies[len(latencies) // 2], 3),
+        "p95_ms": round(latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)], 3),
+        "max_ms": round(latencies[-1], 3),
+    }
+
+
+async def probe_unknown_code(code):
+    """What an unknown /unlock/<code> probe costs: the filter, then a lookup if it passes."""
+    if sharepass.code_filter.might_contain(code):
+        await sharepass.get_upload_time(code)
+
+
+async def bench_size(directory, secrets_count, args, envelopes):
+    path = os.path.join(directory, f"secrets-{secrets_count}.db")
+    if os.path.exists(path):
+        os.remove(path)
+    sharepass.DATABASE_PATH = path
+    await sharepass.init_db()
+
+    start = time.perf_counter()
+    live_codes, ips = populate(path, secrets_count, args.ip_rows, args.secret_size)
+    populate_seconds = time.perf_counter() - start
+    size_before = os.path.getsize(path)
+
+    samples = args.samples
+    miss_codes = [(random_code(),) for _ in range(samples)]
+    # The filter is not built for this database yet, so the raw misses go to SQLite
+    # and are not counted as filter false positives
+    db_miss = await time_calls(sharepass.get_upload_time, miss_codes)
+
+    # Secrets with real envelopes for correct unlocks
+    unlock_codes = []
+    for envelope in envelopes:
+        code, error = await sharepass.store_secret(envelope, "bench-ip")
+        if error:
+            raise SystemExit(error)
+        unlock_codes.append(code)
+    await sharepass.code_filter.rebuild()
+    false_positives = sharepass.code_filter.false_positives
+
+    lookup_codes = [(random.choice(live_codes),) for _ in range(samples)]  # nosec B311
+    # Distinct codes, so no sample hits a secret already deleted at MAX_ATTEMPTS
+    wrong_unlocks = [
+        (code, "wrong-key") for code in random.sample(live_codes, min(samples, len(live_codes)))
+    ]
+    quota_ips = [(random.choice(ips),) for _ in range(samples)] if ips else []  # nosec B311
+
+    result = {
+        "secrets": secrets_count,
+        "ip_usage_rows": args.ip_rows,
+        "populate_s": round(populate_seconds, 2),
+        "db_size_mb": round(size_before / 2**20, 2),
+        "landing_lookup": await time_calls(sharepass.get_upload_time, lookup_codes),
+        "unknown_code_db_miss": db_miss,
+        "unknown_code_probe": await time_calls(probe_unknown_code, miss_codes),
+        "unknown_code_false_positives": sharepass.code_filter.false_positives - false_positives,
+        "unlock_wrong_key": await time_calls(sharepass.unlock_secret_logic, wrong_unlocks),
+        "unlock_correct": await time_calls(
+            sharepass.unlock_secret_logic, [(code, KEY) for code in unlock_codes]
+        ),
+    }
+    if quota_ips:
+        result["quota_check"] = await time_calls(sharepass.ip_reached_quota, quota_ips)
+
+    start = time.perf_counter()
+    await sharepass.purge_expired()
+    result["purge_expired_s"] = round(time.perf_counter() - start, 3)
+    result["db_size_after_purge_mb"] = round(os.path.getsize(path) / 2**20, 2)
+
+    if not args.keep:
+        os.remove(path)
+    return result
+
+
+async def main_async(args):
+    envelopes = [encrypt_secret("s" * 32, KEY) for _ in range(args.unlocks)]
+    directory = args.dir or tempfile.mkdtemp(prefix="sharepass-bench-")
+    os.makedirs(directory, exist_ok=True)
+    results = []
+    try:
+        for secrets_count in args.sizes:
+            print(f"Benchmarking {secrets_count} secrets...", file=sys.stderr)
+            results.append(await bench_size(directory, secrets_count, args, envelopes))
+    finally:
+        if not args.dir and not args.keep:
+            shutil.rmtree(directory, ignore_errors=True)
+    return results
+
+
+def print_table(results):
+    columns = [
+        ("secrets", lambda r: r["secrets"]),
+        ("db MB", lambda r: r["db_size_mb"]),
+        ("lookup p50", lambda r: r["landing_lookup"]["p50_ms"]),
+        ("db miss p50", lambda r: r["unknown_code_db_miss"]["p50_ms"]),
+        ("probe p50", lambda r: r["unknown_code_probe"]["p50_ms"]),
+        ("wrong p50", lambda r: r["unlock_wrong_key"]["p50_ms"]),
+        ("unlock p50", lambda r: r["unlock_correct"]["p50_ms"]),
+        ("quota p50", lambda r: r.get("quota_check", {}).get("p50_ms", "-")),
+        ("purge s", lambda r: r["purge_expired_s"]),
+    ]
+    print("".join(f"{name:>12}" for name, _ in columns), file=sys.stderr)
+    for result in results:
+        print("".join(f"{value(result):>12}" for _, value in columns), file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark database costs by table size")
+    parser.add_argument(
+        "--sizes",
+        type=lambda value: [int(size) for size in value.split(",")],
+        default=[10000, 100000, 1000000],
+        help="Comma-separated numbers of secrets",
+    )
+    parser.add_argument("--ip-rows", type=int, default=10000, help="Rows in ip_usage")
+    parser.add_argument("--samples", type=int, default=200, help="Timed calls per operation")
+    parser.add_argument("--unlocks", type=int, default=5, help="Correct unlocks per size")
+    parser.add_argument("--secret-size", type=int, default=300, help="Stored envelope bytes")
+    parser.add_argument("--dir", help="Directory for the scratch databases (default: temp)")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch databases")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    results = asyncio.run(main_async(args))
+    print_table(results)
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as stream:
+            stream.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
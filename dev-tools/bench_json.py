@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the JSON codec used by the app.
+Compares the stdlib json module with orjson (if installed) on realistic
+envelopes: parsing a stored envelope with up to 0.5 MB of ciphertext, parsing an
+/api/lock request body and serializing an /unlock_secret response.
+
+Usage:
+    python dev-tools/bench_json.py [--iterations N]
+"""
+
+import argparse
+import base64
+import json
+import os
+import timeit
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Envelope sizes in bytes, up to MAX_SECRET_SIZE
+SIZES = [1024, 64 * 1024, 512 * 1024]
+
+
+def make_envelope(size):
+    """Return a serialized envelope of roughly `size` bytes, like encrypt_secret() writes."""
+    # base64 inflates by 4/3, so this many raw bytes give a ciphertext of about `size`
+    raw_size = max((size - 100) * 3 // 4, 16)
+    return json.dumps(
+        {
+            "salt": base64.b64encode(os.urandom(16)).decode("utf-8"),
+            "iv": base64.b64encode(os.urandom(12)).decode("utf-8"),
+            "ciphertext": base64.b64encode(os.urandom(raw_size)).decode("utf-8"),
+        }
+    )
+
+
+def codecs():
+    yield "json", json.loads, json.dumps
+    if orjson is not None:
+        yield "orjson", orjson.loads, lambda obj: orjson.dumps(obj).decode()
+
+
+def bench(func, iterations):
+    """Return the mean time per call in microseconds."""
+    return timeit.timeit(func, number=iterations) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the JSON codec")
+    parser.add_argument("--iterations", type=int, default=200, help="Iterations per case")
+    args = parser.parse_args()
+
+    if orjson is None:
+        print("orjson is not installed, only the stdlib json module is measured")
+
+    print(f"{'case':<28}{'size':>10}" + "".join(f"{name:>14}" for name, _, _ in codecs()))
+    for size in SIZES:
+        envelope = make_envelope(size)
+        body = json.dumps({"encrypted_secret": envelope}).encode()
+        plaintext = {"secret": "s" * size}
+        cases = [
+            ("parse stored envelope", lambda loads, dumps: loads(envelope)),
+            ("parse /api/lock body", lambda loads, dumps: loads(body)),
+            ("dump unlock response", lambda loads, dumps: dumps(plaintext)),
+        ]
+        for case_name, case in cases:
+            timings = [
+                bench(lambda: case(loads, dumps), args.iterations)
+                for _, loads, dumps in codecs()
+            ]
+            print(
+                f"{case_name:<28}{size:>10}"
+                + "".join(f"{timing:>11.1f} us" for timing in timings)
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark for the security headers middleware.
+Measures the per-request cost of security_headers_middleware for HTML pages
+(with a CSP nonce), plain responses and JSON responses.
+
+Usage:
+    python dev-tools/bench_middleware.py [--iterations N]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+from aiohttp import web
+from aiohttp.test_utils import make_mocked_request
+
+# Make the app importable as app.app from the project root
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.app import (  # noqa: E402
+    SECURITY_HEADERS_KEY,
+    build_security_headers,
+    security_headers_middleware,
+)
+
+
+async def html_handler(request):
+    request["csp_nonce"] = "bench-nonce-0123456789"
+    return web.Response(text="<html></html>", content_type="text/html")
+
+
+async def text_handler(request):
+    return web.Response(text="plain")
+
+
+async def json_handler(request):
+    return web.json_response({"ok": True})
+
+
+async def measure(app, handler, iterations):
+    """Return the mean time in microseconds for one middleware pass."""
+    request = make_mocked_request("GET", "/", app=app)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        await security_headers_middleware(request, handler)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+async def run(iterations):
+    app = web.Application()
+    app[SECURITY_HEADERS_KEY] = build_security_headers("https://stats.example.com", True)
+
+    print(f"security_headers_middleware, {iterations} iterations per case")
+    for name, handler in (
+        ("html + nonce", html_handler),
+        ("plain text", text_handler),
+        ("json", json_handler),
+    ):
+        # The handler itself builds a response; subtract it to isolate the middleware
+        request = make_mocked_request("GET", "/", app=app)
+        start = time.perf_counter()
+        for _ in range(iterations):
+            await handler(request)
+        baseline = (time.perf_counter() - start) / iterations * 1e6
+        total = await measure(app, handler, iterations)
+        print(f"  {name:<14} {total - baseline:8.2f} us/request (handler {baseline:.2f} us)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the security headers middleware")
+    parser.add_argument("--iterations", type=int, default=20000, help="Iterations per case")
+    args = parser.parse_args()
+    asyncio.run(run(args.iterations))
+
+
+if __name__ == "__main__":
+    main()
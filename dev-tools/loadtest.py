@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+Load generator for a running sharepass instance.
+Drives a configurable mix of /api/lock, correct and wrong /api/unlock, /check-limit,
+/time-left and unlock landing page requests at an open-loop arrival rate (Poisson
+arrivals that do not wait for earlier responses) and reports throughput, latency
+percentiles and an error breakdown per operation as JSON.
+
+Envelopes are encrypted up front with encrypt_secret() from sharepass_cli.py, so the
+generator itself spends no time in PBKDF2 during the run.
+
+The lock quota applies per client IP. Start the server with a large MAX_USES_QUOTA,
+or use --spread-ips to send each request from a random X-Forwarded-For address.
+
+Usage:
+    python dev-tools/loadtest.py --url http://localhost:8080 --rate 50 --duration 30 \\
+        --mix lock=20,unlock=30,unlock_wrong=10,check_limit=20,time_left=10,landing=10 \\
+        --output report.json
+"""
+
+import argparse
+import asyncio
+import collections
+import json
+import os
+import random
+import sys
+import time
+
+import aiohttp
+
+# Make sharepass_cli importable from the project root
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from sharepass_cli import encrypt_secret  # noqa: E402
+
+OPERATIONS = ("lock", "unlock", "unlock_wrong", "check_limit", "time_left", "landing")
+DEFAULT_MIX = "lock=20,unlock=30,unlock_wrong=10,check_limit=20,time_left=10,landing=10"
+KEY = "loadtest-key"
+
+
+def parse_mix(value):
+    """Parse "lock=20,unlock=30" into ([operations], [weights])."""
+    mix = {}
+    for item in value.split(","):
+        name, _, weight = item.partition("=")
+        if name.strip() not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"Unknown operation: {name}")
+        mix[name.strip()] = float(weight)
+    return list(mix), list(mix.values())
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(int(fraction * len(sorted_values)), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+class LoadTest:
+    def __init__(self, session, base_url, envelopes, spread_ips):
+        self.session = session
+        self.base_url = base_url.rstrip("/")
+        self.envelopes = envelopes
+        self.spread_ips = spread_ips
+        # Download codes of locked secrets that have not been claimed yet
+        self.codes = collections.deque()
+        self.latencies = collections.defaultdict(list)
+        self.outcomes = collections.defaultdict(collections.Counter)
+
+    def headers(self):
+        if not self.spread_ips:
+            return {}
+        address = ".".join(str(random.randint(1, 254)) for _ in range(4))  # nosec B311
+        return {"X-Forwarded-For": address}
+
+    def code(self, consume=False):
+        if not self.codes:
+            return None
+        if consume:
+            return self.codes.popleft()
+        return random.choice(self.codes)  # nosec B311
+
+    async def lock(self):
+        payload = {"encrypted_secret": random.choice(self.envelopes)}  # nosec B311
+        async with self.session.post(
+            f"{self.base_url}/api/lock", json=payload, headers=self.headers()
+        ) as resp:
+            data = await resp.json(content_type=None)
+            if resp.status == 200:
+                self.codes.append(data["download_code"])
+            return resp.status
+
+    async def unlock(self):
+        code = self.code(consume=True)
+        if code is None:
+            return "no_code"
+        payload = {"download_code": code, "key": KEY}
+        async with self.session.post(f"{self.base_url}/api/unlock", json=payload) as resp:
+            await resp.read()
+            return resp.status
+
+    async def unlock_wrong(self):
+        code = self.code()
+        if code is None:
+            return "no_code"
+        payload = {"download_code": code, "key": "wrong-" + KEY}
+        async with self.session.post(f"{self.base_url}/api/unlock", json=payload) as resp:
+            await resp.read()
+            return resp.status
+
+    async def check_limit(self):
+        async with self.session.get(f"{self.base_url}/check-limit", headers=self.headers()) as resp:
+            await resp.read()
+            return resp.status
+
+    async def time_left(self):
+        code = self.code() or "000000000000"
+        async with self.session.get(f"{self.base_url}/time-left/{code}") as resp:
+            await resp.read()
+            return resp.status
+
+    async def landing(self):
+        code = self.code() or "000000000000"
+        async with self.session.get(f"{self.base_url}/unlock/{code}") as resp:
+            await resp.read()
+            return resp.status
+
+    async def run_one(self, operation, scheduled):
+        try:
+            outcome = await getattr(self, operation)()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+            outcome = type(exc).__name__
+        # Latency counts from the scheduled arrival, so a backed-up server is not hidden
+        # by requests starting late (coordinated omission).
+        self.latencies[operation].append(time.perf_counter() - scheduled)
+        self.outcomes[operation][str(outcome)] += 1
+
+    async def run(self, mix, rate, duration, max_in_flight):
+        operations, weights = mix
+        in_flight = set()
+        skipped = 0
+        start = time.perf_counter()
+        next_arrival = start
+        while next_arrival - start < duration:
+            delay = next_arrival - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if len(in_flight) >= max_in_flight:
+                skipped += 1
+            else:
+                operation = random.choices(operations, weights)[0]  # nosec B311
+                task = asyncio.create_task(self.run_one(operation, next_arrival))
+                in_flight.add(task)
+                task.add_done_callback(in_flight.discard)
+            next_arrival += random.expovariate(rate)  # nosec B311
+        if in_flight:
+            await asyncio.wait(in_flight)
+        return time.perf_counter() - start, skipped
+
+    def report(self, elapsed, skipped, args):
+        operations = {}
+        total = 0
+        for operation, latencies in sorted(self.latencies.items()):
+            latencies.sort()
+            total += len(latencies)
+            operations[operation] = {
+                "requests": len(latencies),
+                "throughput_rps": round(len(latencies) / elapsed, 2),
+                "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+                "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+                "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+                "max_ms": round(latencies[-1] * 1000, 2),
+                "outcomes": dict(self.outcomes[operation]),
+            }
+        return {
+            "url": self.base_url,
+            "target_rate_rps": args.rate,
+            "duration_s": round(elapsed, 2),
+            "requests": total,
+            "throughput_rps": round(total / elapsed, 2),
+            "skipped_over_max_in_flight": skipped,
+            "operations": operations,
+        }
+
+
+async def main_async(args):
+    print(f"Encrypting {args.envelopes} envelopes of {args.secret_size} bytes...", file=sys.stderr)
+    envelopes = [encrypt_secret("x" * args.secret_size, KEY) for _ in range(args.envelopes)]
+
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+    connector = aiohttp.TCPConnector(limit=args.max_in_flight)
+    async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+        load_test = LoadTest(session, args.url, envelopes, args.spread_ips)
+        # Lock some secrets first so unlocks and lookups have codes to use
+        for _ in range(args.seed):
+            await load_test.lock()
+        load_test.latencies.clear()
+        load_test.outcomes.clear()
+
+        print(f"Running {args.rate} req/s for {args.duration} s...", file=sys.stderr)
+        elapsed, skipped = await load_test.run(
+            args.mix, args.rate, args.duration, args.max_in_flight
+        )
+    return load_test.report(elapsed, skipped, args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Open-loop load test for sharepass")
+    parser.add_argument("--url", default="http://localhost:8080", help="Server base URL")
+    parser.add_argument("--rate", type=float, default=20, help="Arrivals per second")
+    parser.add_argument("--duration", type=float, default=30, help="Run time in seconds")
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX, help="Operation weights")
+    parser.add_argument("--secret-size", type=int, default=200, help="Plaintext size in bytes")
+    parser.add_argument("--envelopes", type=int, default=20, help="Distinct envelopes to reuse")
+    parser.add_argument("--seed", type=int, default=20, help="Secrets locked before the run")
+    parser.add_argument("--max-in-flight", type=int, default=500, help="Concurrent request cap")
+    parser.add_argument("--timeout", type=float, default=30, help="Per-request timeout")
+    parser.add_argument(
+        "--spread-ips", action="store_true", help="Send random X-Forwarded-For addresses"
+    )
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    report = asyncio.run(main_async(args))
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as stream:
+            stream.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -9,13 +9,9 @@ import os
 import json
 import base64
 import sys
+import uuid
 import argparse
 
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
-from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.backends import default_backend
-from cryptography.hazmat.primitives.ciphers.aead import AESGCM
-
 
 def encrypt_secret(secret: str, key: str) -> str:
     """
@@ -29,6 +25,12 @@ def encrypt_secret(secret: str, key: str) -> str:
     Returns:
         JSON string containing encrypted data (salt, iv, ciphertext)
     """
+    # Imported here so that --help and argument errors don't pay for loading cryptography
+    from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.backends import default_backend
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
     # Generate random salt and IV
     salt = os.urandom(16)
     iv = os.urandom(12)
@@ -111,6 +113,8 @@ def main():
         print(f"# Encrypt and create secret:")
         print(f"curl -X POST {args.url}/api/lock \\")
         print(f"  -H 'Content-Type: application/json' \\")
+        # Running the command again (e.g. after a timeout) returns the same download code
+        print(f"  -H 'Idempotency-Key: {uuid.uuid4()}' \\")
         print(f"  -d '{json_payload}'")
         print()
         print("# To retrieve the secret:")
@@ -0,0 +1,89 @@
+import os
+import base64
+
+import pytest
+from aiohttp.test_utils import make_mocked_request
+
+from app.app import (
+    generate_download_code,
+    validate_download_code,
+    get_client_ip,
+    hash_ip,
+    validate_json_content_type,
+    json_dumps,
+    parse_envelope,
+    decrypt_envelope,
+)
+
+from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+pytestmark = pytest.mark.bench
+
+# Plaintext sizes in bytes, up to about MAX_SECRET_SIZE once encrypted and encoded
+ENVELOPE_SIZES = [1024, 64 * 1024, 384 * 1024]
+
+
+def make_envelope(size, key="benchmark-key"):
+    """Return a serialized envelope of a `size` byte plaintext, encrypted like the client does."""
+    salt = os.urandom(16)
+    iv = os.urandom(12)
+    kdf = PBKDF2HMAC(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=salt,
+        iterations=100000,
+        backend=default_backend(),
+    )
+    ciphertext = AESGCM(kdf.derive(key.encode())).encrypt(iv, b"x" * size, None)
+    return json_dumps(
+        {
+            "salt": base64.b64encode(salt).decode("utf-8"),
+            "iv": base64.b64encode(iv).decode("utf-8"),
+            "ciphertext": base64.b64encode(ciphertext).decode("utf-8"),
+        }
+    )
+
+
+def test_generate_download_code(benchmark):
+    code = benchmark(generate_download_code)
+    assert len(code) == 12
+
+
+@pytest.mark.parametrize("code", ["abcdefabcdef", "not-a-valid-code!"])
+def test_validate_download_code(benchmark, code):
+    benchmark(validate_download_code, code)
+
+
+def test_hash_ip(benchmark):
+    assert len(benchmark(hash_ip, "203.0.113.7")) == 64
+
+
+def test_get_client_ip_forwarded(benchmark):
+    request = make_mocked_request(
+        "GET", "/check-limit", headers={"X-Forwarded-For": "203.0.113.7, 10.0.0.1"}
+    )
+    benchmark(get_client_ip, request)
+
+
+def test_validate_json_content_type(benchmark):
+    request = make_mocked_request(
+        "POST", "/api/lock", headers={"Content-Type": "application/json; charset=utf-8"}
+    )
+    assert benchmark(validate_json_content_type, request)
+
+
+@pytest.mark.parametrize("size", ENVELOPE_SIZES)
+def test_parse_envelope(benchmark, size):
+    envelope = make_envelope(size)
+    _, _, ciphertext = benchmark(parse_envelope, envelope)
+    assert len(ciphertext) == size + 16
+
+
+@pytest.mark.parametrize("size", ENVELOPE_SIZES)
+def test_decrypt_envelope(benchmark, size):
+    # Includes the PBKDF2 key derivation, which dominates for small secrets
+    envelope = make_envelope(size)
+    assert len(benchmark(decrypt_envelope, envelope, "benchmark-key")) == size
@@ -0,0 +1,87 @@
+import functools
+import os
+
+import jinja2
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import make_mocked_request
+
+from app.app import (
+    APP_KEY,
+    NOT_FOUND_KEY,
+    PAGE_CACHE_KEY,
+    SECURITY_HEADERS_KEY,
+    asset_url,
+    NotFoundResponses,
+    build_security_headers,
+    handle_404,
+    render_page,
+    security_headers_middleware,
+)
+
+pytestmark = pytest.mark.bench
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "app", "templates")
+
+
+def run(coro):
+    """Run a coroutine that never suspends, without the overhead of an event loop."""
+    try:
+        coro.send(None)
+    except StopIteration as stop:
+        return stop.value
+    raise RuntimeError("coroutine suspended")
+
+
+def make_app(page_cache=None):
+    app = web.Application()
+    app[SECURITY_HEADERS_KEY] = build_security_headers()
+    env = jinja2.Environment(loader=jinja2.FileSystemLoader(TEMPLATES_DIR), autoescape=True)
+    env.globals["asset_url"] = functools.partial(asset_url, {})
+    app[APP_KEY] = env
+    if page_cache is not None:
+        app[PAGE_CACHE_KEY] = page_cache
+    return app
+
+
+async def html_handler(request):
+    request["csp_nonce"] = "bench-nonce-0123456789"
+    return web.Response(text="<html></html>", content_type="text/html")
+
+
+async def json_handler(request):
+    return web.json_response({"ok": True})
+
+
+@pytest.mark.parametrize("kind", ["html", "json"])
+def test_security_headers_middleware(benchmark, kind):
+    handler = html_handler if kind == "html" else json_handler
+    request = make_mocked_request("GET", "/", app=make_app())
+    response = benchmark(lambda: run(security_headers_middleware(request, handler)))
+    assert "X-Content-Type-Options" in response.headers
+
+
+@pytest.mark.parametrize("cache", ["uncached", "cached"])
+def test_render_download_page(benchmark, cache):
+    page_cache = {} if cache == "cached" else None
+    request = make_mocked_request("GET", "/unlock/abcdefabcdef", app=make_app(page_cache))
+    context = {"max_attempts": 3}
+    per_request = {"download_code": "abcdefabcdef", "base_url": "https://example.com"}
+
+    response = benchmark(
+        lambda: run(render_page(request, "download.html", context, per_request=per_request))
+    )
+    assert response.status == 200
+
+
+@pytest.mark.parametrize("kind", ["rendered", "browser", "plain"])
+def test_not_found(benchmark, kind):
+    app = make_app({})
+    if kind != "rendered":
+        app[NOT_FOUND_KEY] = NotFoundResponses.render(app[APP_KEY], app[SECURITY_HEADERS_KEY])
+    accept = "*/*" if kind == "plain" else "text/html"
+    request = make_mocked_request(
+        "GET", "/wp-login.php", headers={"Accept": accept, "Accept-Encoding": "gzip"}, app=app
+    )
+    response = benchmark(lambda: run(security_headers_middleware(request, handle_404)))
+    assert response.status == 404
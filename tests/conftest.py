@@ -8,6 +8,17 @@ if project_root not in sys.path:
     sys.path.insert(0, project_root)
 
 
+def pytest_collection_modifyitems(config, items):
+    # Microbenchmarks are slow and only meaningful on a quiet machine, so they only
+    # run when selected explicitly with -m bench
+    if "bench" in (config.getoption("markexpr") or ""):
+        return
+    skip_bench = pytest.mark.skip(reason="microbenchmark, select with -m bench")
+    for item in items:
+        if "bench" in item.keywords:
+            item.add_marker(skip_bench)
+
+
 @pytest.fixture(scope="session")
 def base_url():
     # Default to 127.0.0.1:8080 for plain server runs (windows, linux)
@@ -0,0 +1,75 @@
+import io
+import json
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import make_mocked_request
+
+from app.app import hash_ip, AccessLogBuffer, BufferedAccessLogger, parse_sample_rates, route_name
+
+
+def test_parse_sample_rates():
+    rates = parse_sample_rates("/static=0.01, /check-limit=0.5,/static/js=1")
+    # Longer prefixes are matched first.
+    assert rates.index(("/static/js", 1.0)) < rates.index(("/static", 0.01))
+    assert ("/check-limit", 0.5) in rates
+    assert parse_sample_rates("") == []
+
+
+def test_sampling_and_errors():
+    buffer = AccessLogBuffer(sample_rates="/static=0")
+    assert not buffer.should_log("/static/{filename}", 200)
+    assert buffer.sampled_out == 1
+    # Server errors are always logged.
+    assert buffer.should_log("/static/{filename}", 500)
+    assert buffer.should_log("/api/lock", 200)
+
+
+def test_queue_overflow_drops_and_counts():
+    buffer = AccessLogBuffer(max_size=2)
+    for i in range(5):
+        buffer.append({"i": i})
+    assert len(buffer.records) == 2
+    assert buffer.dropped == 3
+
+
+def test_flush_writes_json_lines():
+    buffer = AccessLogBuffer()
+    buffer._stream = io.StringIO()
+    buffer.append({"route": "/", "status": 200})
+    buffer.append({"route": "/api/lock", "status": 429})
+    buffer.flush()
+    lines = buffer._stream.getvalue().splitlines()
+    assert [json.loads(line)["status"] for line in lines] == [200, 429]
+    assert buffer.written == 2
+    assert not buffer.records
+
+
+@pytest.mark.asyncio
+async def test_access_logger_records_route_not_path(monkeypatch):
+    buffer = AccessLogBuffer()
+    monkeypatch.setattr("app.app.access_log_buffer", buffer)
+
+    async def handler(request):
+        return web.Response(text="ok")
+
+    app = web.Application()
+    app.router.add_get("/unlock/{download_code}", handler)
+    request = make_mocked_request(
+        "GET", "/unlock/abcdefabcdef", headers={"X-Forwarded-For": "10.0.0.1"}, app=app
+    )
+    match_info = await app.router.resolve(request)
+    match_info.add_app(app)
+    request._match_info = match_info
+
+    assert route_name(request) == "/unlock/{download_code}"
+    BufferedAccessLogger(None, "").log(request, web.Response(text="ok"), 0.0123)
+    record = buffer.records[0]
+    assert record["route"] == "/unlock/{download_code}"
+    assert record["status"] == 200
+    assert record["latency_ms"] == 12.3
+    assert "abcdefabcdef" not in json.dumps(record)
+    # Clients are pseudonymised with a per-process key, not an unkeyed hash of the IP.
+    assert record["client"] == buffer.client_id(hash_ip("10.0.0.1"))
+    assert record["client"] not in hash_ip("10.0.0.1")
+    assert AccessLogBuffer().client_id(hash_ip("10.0.0.1")) != record["client"]
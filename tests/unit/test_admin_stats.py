@@ -0,0 +1,139 @@
+import contextlib
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+import pytest_asyncio
+import aiosqlite
+from aiohttp import web
+
+import app.app
+from app.app import (
+    AttemptCounter,
+    StorageStats,
+    admin_stats,
+    init_db,
+    purge_expired,
+    render_metrics,
+    store_secret,
+    unlock_secret_logic,
+    SECRET_EXPIRY_MINUTES,
+    STATS_BUCKET_SECONDS,
+)
+
+
+# Fixture to set up a temporary database and fresh counters.
+@pytest_asyncio.fixture
+async def test_db(tmp_path, monkeypatch):
+    db_file = tmp_path / "test.db"
+    monkeypatch.setattr("app.app.DATABASE_PATH", str(db_file))
+    monkeypatch.setattr("app.app.storage_stats", StorageStats())
+    monkeypatch.setattr("app.app.attempt_counter", AttemptCounter())
+    await init_db()
+    # Startup counts the stored secrets once
+    await app.app.storage_stats.reconcile()
+    yield str(db_file)
+
+
+@pytest.mark.asyncio
+async def test_counters_follow_store_unlock_and_purge(test_db, monkeypatch):
+    monkeypatch.setattr("app.app.MAX_ATTEMPTS", 1)
+    stats = app.app.storage_stats
+    envelope = '{"dummy": "secret"}'
+
+    first, _ = await store_secret(envelope, "ip_one")
+    await store_secret(envelope, "ip_one")
+    await store_secret(envelope, "ip_two")
+    assert stats.live_secrets == 3
+    assert stats.stored_bytes == 3 * len(envelope)
+    assert stats.ip_usage_rows == 2
+    assert sum(entry["secrets"] for entry in stats.expiry_histogram()) == 3
+
+    # The dummy envelope never decrypts, so with MAX_ATTEMPTS=1 it is deleted.
+    await unlock_secret_logic(first, "wrong")
+    assert stats.deleted["max_attempts"] == 1
+    assert stats.live_secrets == 2
+
+    expired_time = datetime.now() - timedelta(minutes=SECRET_EXPIRY_MINUTES + 1)
+    async with aiosqlite.connect(test_db, detect_types=sqlite3.PARSE_DECLTYPES) as db:
+        await db.execute(
+            "INSERT INTO secrets (id, secret, attempts, download_code, upload_time) VALUES (?, ?, ?, ?, ?)",
+            ("expired_id", "expired", 0, "expired12345", expired_time),
+        )
+        await db.commit()
+    await stats.reconcile()
+    assert stats.live_secrets == 3
+    assert stats.drift["live_secrets"] == 1
+
+    await purge_expired()
+    assert stats.deleted["expired"] == 1
+    assert stats.live_secrets == 2
+
+    # The maintained counters agree with a full recount.
+    await stats.reconcile()
+    assert stats.drift == {"live_secrets": 0, "stored_bytes": 0, "ip_usage_rows": 0}
+
+
+@pytest.mark.asyncio
+async def test_changes_during_reconcile_are_kept(test_db, monkeypatch):
+    stats = app.app.storage_stats
+    envelope = '{"dummy": "secret"}'
+    await store_secret(envelope, "ip_one")
+    connect_db = app.app.connect_db
+
+    @contextlib.asynccontextmanager
+    async def store_during_reconcile():
+        async with connect_db() as db:
+            yield db
+        # The reconcile queries have run; store another secret before they are applied
+        monkeypatch.setattr("app.app.connect_db", connect_db)
+        await store_secret(envelope, "ip_two")
+
+    monkeypatch.setattr("app.app.connect_db", store_during_reconcile)
+    await stats.reconcile()
+    assert stats.live_secrets == 2
+    assert stats.stored_bytes == 2 * len(envelope)
+    assert stats.ip_usage_rows == 2
+    assert sum(entry["secrets"] for entry in stats.expiry_histogram()) == 2
+    assert stats.drift == {"live_secrets": 0, "stored_bytes": 0, "ip_usage_rows": 0}
+
+    await stats.reconcile()
+    assert stats.drift == {"live_secrets": 0, "stored_bytes": 0, "ip_usage_rows": 0}
+
+
+def test_expiry_histogram_buckets_by_remaining_time():
+    stats = StorageStats()
+    now = datetime.now()
+    stats.added(10, now, True)
+    stats.added(10, now - timedelta(minutes=SECRET_EXPIRY_MINUTES / 2), False)
+    histogram = stats.expiry_histogram(now)
+    assert [entry["secrets"] for entry in histogram] == [1, 1]
+    # Bucket bounds are rounded up to the end of the bucket
+    bucket_minutes = STATS_BUCKET_SECONDS / 60
+    assert histogram[0]["expires_within_minutes"] <= SECRET_EXPIRY_MINUTES / 2 + bucket_minutes
+    assert histogram[1]["expires_within_minutes"] >= SECRET_EXPIRY_MINUTES
+
+
+@pytest.mark.asyncio
+async def test_admin_stats_endpoint(aiohttp_client, test_db, monkeypatch):
+    async def not_found(request):
+        return web.Response(status=404)
+
+    monkeypatch.setattr("app.app.handle_404", not_found)
+    await store_secret('{"dummy": "secret"}', "ip_one")
+    application = web.Application()
+    application.router.add_get("/admin/stats", admin_stats)
+    client = await aiohttp_client(application)
+
+    resp = await client.get("/admin/stats")
+    assert resp.status == 200
+    data = await resp.json()
+    assert data["live_secrets"] == 1
+    # /metrics reads the same counter, whether or not the code filter is built.
+    assert not app.app.code_filter.is_ready()
+    assert "sharepass_live_secrets 1\n" in render_metrics()
+    assert set(data["deleted"]) == {"claimed", "max_attempts", "expired", "evicted"}
+    assert data["code_filter"]["false_positives"] == 0
+
+    resp = await client.get("/admin/stats", headers={"X-Forwarded-For": "127.0.0.1"})
+    assert resp.status == 404
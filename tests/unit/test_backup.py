@@ -0,0 +1,184 @@
+import asyncio
+import os
+import sqlite3
+import time
+
+import pytest
+import pytest_asyncio
+
+import app.app
+from app.app import (
+    BackupRestarted,
+    backup_database,
+    copy_database,
+    init_db,
+    restore_database,
+    rotate_backups,
+    store_secret,
+    SCHEMA_VERSION,
+)
+
+
+# Fixture to set up a temporary database and backup directory.
+@pytest_asyncio.fixture
+async def test_db(tmp_path, monkeypatch):
+    db_file = tmp_path / "database" / "test.db"
+    monkeypatch.setattr("app.app.DATABASE_PATH", str(db_file))
+    monkeypatch.setattr("app.app.BACKUP_DIR", str(tmp_path / "backups"))
+    await init_db()
+    yield str(db_file)
+
+
+def count_secrets(path):
+    db = sqlite3.connect(path)
+    try:
+        return db.execute("SELECT COUNT(*) FROM secrets").fetchone()[0]
+    finally:
+        db.close()
+
+
+@pytest.mark.asyncio
+async def test_backup_runs_alongside_writes(test_db, monkeypatch):
+    monkeypatch.setattr("app.app.BACKUP_PAGES_PER_STEP", 1)
+    monkeypatch.setattr("app.app.BACKUP_STEP_SLEEP", 0.01)
+    for _ in range(20):
+        await store_secret("x" * 5000, "ip_hash")
+
+    result, *codes = await asyncio.gather(
+        backup_database(), *(store_secret("y" * 100, "ip_hash") for _ in range(5))
+    )
+
+    assert all(error is None for _, error in codes)
+    assert result["bytes"] == os.path.getsize(result["path"])
+    assert result["seconds"] >= 0
+    assert 20 <= count_secrets(result["path"]) <= 25
+    assert not os.path.exists(result["path"] + ".partial")
+
+
+@pytest.mark.asyncio
+async def test_writes_commit_between_backup_steps(test_db, tmp_path, monkeypatch):
+    monkeypatch.setattr("app.app.BACKUP_PAGES_PER_STEP", 1)
+    monkeypatch.setattr("app.app.BACKUP_STEP_SLEEP", 0.001)
+    monkeypatch.setattr("app.app.BACKUP_MAX_RESTARTS", 100)
+    for _ in range(10):
+        await store_secret("x" * 5000, "ip_hash")
+
+    writes = []
+    sleep = time.sleep
+
+    def pause(seconds):
+        # Runs in the pause after a step: with timeout=0 the commit fails if any lock is held
+        if len(writes) < 3:
+            writer = sqlite3.connect(test_db, timeout=0)
+            try:
+                writer.execute("UPDATE secrets SET attempts = attempts + 1")
+                writer.commit()
+            finally:
+                writer.close()
+            writes.append(seconds)
+        sleep(seconds)
+
+    monkeypatch.setattr(time, "sleep", pause)
+    restarts = copy_database(test_db, str(tmp_path / "copy.db"))
+
+    assert writes == [0.001] * 3
+    assert restarts >= 1
+    assert count_secrets(str(tmp_path / "copy.db")) == 10
+
+
+@pytest.mark.asyncio
+async def test_restarted_backup_is_retried_later(test_db, monkeypatch):
+    monkeypatch.setattr("app.app.BACKUP_RETRY_SECONDS", 0)
+    attempts = []
+
+    def restarted_once(source_path, target_path):
+        attempts.append(target_path)
+        if len(attempts) == 1:
+            raise BackupRestarted("Backup restarted 6 times by writes.")
+        return copy_database(source_path, target_path)
+
+    monkeypatch.setattr("app.app.copy_database", restarted_once)
+    result = await backup_database()
+    assert len(attempts) == 2
+    assert count_secrets(result["path"]) == 0
+
+    # A backup that keeps being restarted fails instead of copying in one step.
+    def always_restarted(source_path, target_path):
+        attempts.append(target_path)
+        raise BackupRestarted("Backup restarted 6 times by writes.")
+
+    attempts.clear()
+    monkeypatch.setattr("app.app.copy_database", always_restarted)
+    with pytest.raises(BackupRestarted):
+        await backup_database()
+    assert len(attempts) == app.app.BACKUP_MAX_ATTEMPTS
+
+
+@pytest.mark.asyncio
+async def test_too_many_restarts_abandon_the_copy(test_db, tmp_path, monkeypatch):
+    monkeypatch.setattr("app.app.BACKUP_PAGES_PER_STEP", 1)
+    monkeypatch.setattr("app.app.BACKUP_MAX_RESTARTS", 0)
+    for _ in range(10):
+        await store_secret("x" * 5000, "ip_hash")
+    sleep = time.sleep
+
+    def pause(seconds):
+        writer = sqlite3.connect(test_db, timeout=0)
+        writer.execute("UPDATE secrets SET attempts = attempts + 1")
+        writer.commit()
+        writer.close()
+        sleep(seconds)
+
+    monkeypatch.setattr(time, "sleep", pause)
+    target = tmp_path / "copy.db"
+    with pytest.raises(BackupRestarted):
+        copy_database(test_db, str(target))
+    assert not os.path.exists(str(target) + ".partial")
+    assert not target.exists()
+
+
+def test_rotate_backups_keeps_newest(tmp_path):
+    names = [f"secrets-2026010{day}-120000.db" for day in range(1, 6)]
+    for name in names + ["unrelated.db"]:
+        (tmp_path / name).write_bytes(b"")
+    assert rotate_backups(str(tmp_path), 2) == names[:3]
+    assert sorted(os.listdir(tmp_path)) == names[3:] + ["unrelated.db"]
+
+
+@pytest.mark.asyncio
+async def test_restore_swaps_database(test_db):
+    await store_secret('{"dummy": "secret"}', "ip_hash")
+    backup = await backup_database()
+    await store_secret('{"dummy": "secret"}', "ip_hash")
+
+    previous_path = restore_database(backup["path"])
+
+    assert count_secrets(test_db) == 1
+    assert count_secrets(previous_path) == 2
+
+
+@pytest.mark.asyncio
+async def test_restore_rejects_other_schema_versions(test_db, tmp_path):
+    backup = await backup_database()
+    db = sqlite3.connect(backup["path"])
+    db.execute(f"PRAGMA user_version = {SCHEMA_VERSION + 1}")
+    db.commit()
+    db.close()
+
+    with pytest.raises(ValueError, match="schema version"):
+        restore_database(backup["path"])
+    not_a_database = tmp_path / "garbage.db"
+    not_a_database.write_bytes(b"not a database" * 100)
+    with pytest.raises(ValueError, match="not a readable database"):
+        restore_database(str(not_a_database))
+    # The live database was not touched.
+    assert not os.path.exists(test_db + ".pre-restore")
+
+
+@pytest.mark.asyncio
+async def test_restore_refuses_with_hot_journal(test_db):
+    backup = await backup_database()
+    with open(test_db + "-journal", "wb"):
+        pass
+    with pytest.raises(ValueError, match="stop the server"):
+        restore_database(backup["path"])
@@ -0,0 +1,121 @@
+import json
+
+import pytest
+import pytest_asyncio
+from aiohttp import web, FormData
+
+from app.app import (
+    api_lock_secret,
+    api_unlock_secret,
+    body_limit,
+    body_limit_middleware,
+    init_db,
+    unlock_secret,
+    upload_secret,
+    MAX_UNLOCK_BODY_SIZE,
+)
+
+
+# Fixture to set up a temporary database.
+@pytest_asyncio.fixture
+async def test_db(tmp_path, monkeypatch):
+    db_file = tmp_path / "test.db"
+    monkeypatch.setattr("app.app.DATABASE_PATH", str(db_file))
+    await init_db()
+    yield str(db_file)
+
+
+@pytest.fixture
+def limited_app():
+    calls = []
+
+    @body_limit(MAX_UNLOCK_BODY_SIZE)
+    async def unlock(request):
+        calls.append(request)
+        body = await request.read()
+        return web.json_response({"size": len(body)})
+
+    app = web.Application(middlewares=[body_limit_middleware])
+    app.router.add_post("/api/unlock", unlock)
+    app.router.add_post("/lock", upload_secret)
+    app["calls"] = calls
+    return app
+
+
+@pytest.mark.asyncio
+async def test_small_body_passes(aiohttp_client, limited_app):
+    client = await aiohttp_client(limited_app)
+    resp = await client.post("/api/unlock", json={"download_code": "abcdefabcdef", "key": "k"})
+    assert resp.status == 200
+
+
+@pytest.mark.asyncio
+async def test_content_length_over_limit_is_rejected_before_the_handler(
+    aiohttp_client, limited_app
+):
+    client = await aiohttp_client(limited_app)
+    body = json.dumps({"key": "k" * MAX_UNLOCK_BODY_SIZE})
+    resp = await client.post(
+        "/api/unlock", data=body, headers={"Content-Type": "application/json"}
+    )
+    assert resp.status == 413
+    assert "too large" in (await resp.json())["error"]
+    assert limited_app["calls"] == []
+
+
+@pytest.mark.asyncio
+async def test_chunked_body_over_limit_is_cut_off(aiohttp_client, limited_app):
+    client = await aiohttp_client(limited_app)
+
+    async def chunks():
+        for _ in range(10):
+            yield b"x" * (MAX_UNLOCK_BODY_SIZE // 4)
+
+    resp = await client.post("/api/unlock", data=chunks())
+    assert resp.status == 413
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "path, handler",
+    [
+        ("/api/unlock", api_unlock_secret),
+        ("/unlock_secret", unlock_secret),
+        ("/api/lock", api_lock_secret),
+    ],
+)
+async def test_chunked_json_over_limit_is_413(aiohttp_client, test_db, path, handler):
+    # The JSON handlers must not turn the cut-off body into "Invalid JSON."
+    app = web.Application(middlewares=[body_limit_middleware])
+    app.router.add_post(path, handler)
+    client = await aiohttp_client(app)
+
+    async def chunks():
+        yield b'{"key": "'
+        for _ in range(handler.max_body_size // 65536 + 2):
+            yield b"k" * 65536
+        yield b'"}'
+
+    resp = await client.post(path, data=chunks(), headers={"Content-Type": "application/json"})
+    assert resp.status == 413
+    assert "too large" in (await resp.json())["error"]
+
+
+@pytest.mark.asyncio
+async def test_multipart_field_is_read_incrementally(
+    aiohttp_client, limited_app, test_db, monkeypatch
+):
+    monkeypatch.setattr("app.app.MAX_SECRET_SIZE", 1000)
+    client = await aiohttp_client(limited_app)
+
+    form = FormData(default_to_multipart=True)
+    form.add_field("encryptedsecret", "s" * 2000)
+    resp = await client.post("/lock", data=form)
+    assert resp.status == 413
+    assert "Secret too large" in await resp.text()
+
+    form = FormData(default_to_multipart=True)
+    form.add_field("encryptedsecret", '{"salt": "", "iv": "", "ciphertext": ""}')
+    resp = await client.post("/lock", data=form)
+    assert resp.status == 200
+    assert (await resp.text()).startswith("/unlock/")
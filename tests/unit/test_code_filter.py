@@ -0,0 +1,125 @@
+import asyncio
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+import pytest_asyncio
+import aiosqlite
+
+from app.app import (
+    CodeFilter,
+    code_filter,
+    init_db,
+    purge_expired,
+    store_secret,
+    time_left,
+    SECRET_EXPIRY_MINUTES,
+)
+
+
+# Fixture to set up a temporary database and a filter built from it.
+@pytest_asyncio.fixture
+async def test_db(tmp_path, monkeypatch):
+    db_file = tmp_path / "test.db"
+    monkeypatch.setattr("app.app.DATABASE_PATH", str(db_file))
+    await init_db()
+    yield str(db_file)
+    # Leave the shared filter detached so other tests hit the database.
+    code_filter.database_path = None
+
+
+class DummyRequest:
+    def __init__(self, download_code):
+        self.match_info = {"download_code": download_code}
+        self.remote = "127.0.0.1"
+
+
+@pytest.mark.asyncio
+async def test_filter_add_remove(test_db):
+    code_set = CodeFilter()
+    await code_set.rebuild()
+    assert not code_set.might_contain("abcdefabcdef")
+    code_set.add("abcdefabcdef")
+    assert code_set.might_contain("abcdefabcdef")
+    code_set.remove("abcdefabcdef")
+    assert not code_set.might_contain("abcdefabcdef")
+    assert code_set.hits == 2
+    assert code_set.passes == 1
+
+
+@pytest.mark.asyncio
+async def test_changes_during_rebuild_are_kept(test_db):
+    stored, _ = await store_secret('{"dummy": "secret"}', "ip_hash")
+    code_set = CodeFilter()
+    rebuild = asyncio.ensure_future(code_set.rebuild())
+    await asyncio.sleep(0)
+    assert code_set.pending is not None
+    # Lookups pass through to the database while the filter is being built.
+    assert code_set.might_contain("abcdefabcdef")
+    code_set.add("abcdefabcdef")
+    code_set.remove(stored)
+    await rebuild
+
+    assert code_set.is_ready()
+    assert code_set.might_contain("abcdefabcdef")
+    assert not code_set.might_contain(stored)
+    assert code_set.count == 1
+
+
+@pytest.mark.asyncio
+async def test_filter_not_ready_passes_everything(test_db):
+    # A filter that was never built for this database never rejects codes.
+    assert CodeFilter().might_contain("abcdefabcdef")
+
+
+@pytest.mark.asyncio
+async def test_filter_rebuild_and_maintenance(test_db):
+    expired_time = datetime.now() - timedelta(minutes=SECRET_EXPIRY_MINUTES + 1)
+    async with aiosqlite.connect(test_db, detect_types=sqlite3.PARSE_DECLTYPES) as db:
+        await db.execute(
+            "INSERT INTO secrets (id, secret, attempts, download_code, upload_time) VALUES (?, ?, ?, ?, ?)",
+            ("expired_id", "dummy secret", 0, "expired12345", expired_time),
+        )
+        await db.commit()
+
+    await code_filter.rebuild()
+    assert code_filter.might_contain("expired12345")
+
+    # New secrets are added on insert.
+    download_code, error = await store_secret('{"dummy": "secret"}', "ip_hash")
+    assert error is None
+    assert code_filter.might_contain(download_code)
+
+    # Purged secrets are removed again.
+    await purge_expired()
+    assert not code_filter.might_contain("expired12345")
+    assert code_filter.might_contain(download_code)
+
+
+@pytest.mark.asyncio
+async def test_unknown_code_skips_database(test_db, monkeypatch):
+    await code_filter.rebuild()
+    hits = code_filter.hits
+
+    async def fail_lookup(download_code):
+        raise AssertionError("database should not be queried")
+
+    monkeypatch.setattr("app.app.get_upload_time", fail_lookup)
+    response = await time_left(DummyRequest("nonexistent1"))
+    assert response.status == 404
+    assert code_filter.hits == hits + 1
+
+
+@pytest.mark.asyncio
+async def test_false_positives_are_counted(test_db):
+    await code_filter.rebuild()
+    hits = code_filter.hits
+    # Saturate the filter so every unknown code gets through to the database.
+    code_filter.counters = bytearray(b"\x01" * code_filter.size)
+    response = await time_left(DummyRequest("nonexistent1"))
+    assert response.status == 404
+
+    stats = code_filter.as_dict()
+    assert stats["hits"] == hits
+    assert stats["false_positives"] == 1
+    assert stats["false_positive_rate"] == 1 / (hits + 1)
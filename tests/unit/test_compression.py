@@ -0,0 +1,76 @@
+import gzip
+
+import pytest
+from aiohttp import web
+
+from app.app import (
+    compression_middleware,
+    negotiate_encoding,
+    no_compression,
+    security_headers_middleware,
+    COMPRESSION_MIN_SIZE,
+)
+
+LARGE_TEXT = "<p>compress me</p>" * (COMPRESSION_MIN_SIZE // 10)
+
+
+@pytest.fixture
+def compression_app():
+    app = web.Application(middlewares=[security_headers_middleware, compression_middleware])
+
+    async def page(request):
+        return web.Response(text=LARGE_TEXT, content_type="text/html")
+
+    async def small(request):
+        return web.json_response({"ok": True})
+
+    @no_compression
+    async def secret(request):
+        return web.Response(text=LARGE_TEXT, content_type="text/plain")
+
+    app.router.add_get("/page", page)
+    app.router.add_get("/small", small)
+    app.router.add_get("/secret", secret)
+    return app
+
+
+def test_negotiate_encoding():
+    assert negotiate_encoding("gzip, deflate") == "gzip"
+    assert negotiate_encoding("deflate") is None
+    assert negotiate_encoding("gzip;q=0, deflate") is None
+    assert negotiate_encoding("") is None
+
+
+@pytest.mark.asyncio
+async def test_large_page_is_gzipped(aiohttp_client, compression_app, monkeypatch):
+    # Pin gzip so the test does not depend on the optional brotli package.
+    monkeypatch.setattr("app.app.brotli", None)
+    client = await aiohttp_client(compression_app)
+    resp = await client.get(
+        "/page", headers={"Accept-Encoding": "gzip, br"}, auto_decompress=False
+    )
+    assert resp.status == 200
+    assert resp.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in resp.headers["Vary"]
+    # Security headers are still applied to compressed responses.
+    assert "Content-Security-Policy" in resp.headers
+    assert gzip.decompress(await resp.read()).decode() == LARGE_TEXT
+
+
+@pytest.mark.asyncio
+async def test_identity_when_not_accepted(aiohttp_client, compression_app):
+    client = await aiohttp_client(compression_app)
+    resp = await client.get("/page", headers={"Accept-Encoding": "identity"})
+    assert "Content-Encoding" not in resp.headers
+    assert await resp.text() == LARGE_TEXT
+
+
+@pytest.mark.asyncio
+async def test_small_and_opted_out_responses_are_not_compressed(aiohttp_client, compression_app):
+    client = await aiohttp_client(compression_app)
+    for path in ("/small", "/secret"):
+        resp = await client.get(
+            path, headers={"Accept-Encoding": "gzip"}, auto_decompress=False
+        )
+        assert resp.status == 200
+        assert "Content-Encoding" not in resp.headers, path
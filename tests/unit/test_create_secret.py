@@ -26,6 +26,13 @@ class DummyField:
     async def text(self):
         return self._text
 
+    async def read_chunk(self, size):
+        chunk, self._text = self._text[:size], self._text[size:]
+        return chunk.encode()
+
+    def get_charset(self, default):
+        return default
+
 
 class DummyMultipart:
     def __init__(self, field):
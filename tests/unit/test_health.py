@@ -0,0 +1,52 @@
+import pytest
+from aiohttp import web
+
+from app.app import healthz, readyz, init_db, SCHEDULER_KEY
+
+
+class DummyScheduler:
+    def __init__(self, running):
+        self.running = running
+
+
+@pytest.fixture
+def health_app(tmp_path, monkeypatch):
+    monkeypatch.setattr("app.app.DATABASE_PATH", str(tmp_path / "test.db"))
+    app = web.Application()
+    app.router.add_get("/healthz", healthz)
+    app.router.add_get("/readyz", readyz)
+    return app
+
+
+@pytest.mark.asyncio
+async def test_healthz(aiohttp_client, health_app):
+    client = await aiohttp_client(health_app)
+    resp = await client.get("/healthz")
+    assert resp.status == 200
+    assert await resp.text() == "ok"
+
+
+@pytest.mark.asyncio
+async def test_readyz_ok(aiohttp_client, health_app):
+    await init_db()
+    health_app[SCHEDULER_KEY] = DummyScheduler(running=True)
+    client = await aiohttp_client(health_app)
+    resp = await client.get("/readyz")
+    assert resp.status == 200
+    assert await resp.json() == {
+        "status": "ok",
+        "checks": {"database": "ok", "scheduler": "ok"},
+    }
+
+
+@pytest.mark.asyncio
+async def test_readyz_reports_failed_checks(aiohttp_client, health_app, monkeypatch):
+    monkeypatch.setattr("app.app.DATABASE_PATH", "/nonexistent/dir/test.db")
+    health_app[SCHEDULER_KEY] = DummyScheduler(running=False)
+    client = await aiohttp_client(health_app)
+    resp = await client.get("/readyz")
+    assert resp.status == 503
+    data = await resp.json()
+    assert data["status"] == "unavailable"
+    assert data["checks"]["database"].startswith("error")
+    assert data["checks"]["scheduler"] == "stopped"
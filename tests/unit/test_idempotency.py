@@ -0,0 +1,111 @@
+import asyncio
+import json
+import sqlite3
+
+import pytest
+import pytest_asyncio
+import aiosqlite
+
+import app.app
+from app.app import IdempotencyCache, api_lock_secret, init_db, MAX_USES_QUOTA
+
+
+# Fixture to set up a temporary database and an empty key cache.
+@pytest_asyncio.fixture
+async def test_db(tmp_path, monkeypatch):
+    db_file = tmp_path / "test.db"
+    monkeypatch.setattr("app.app.DATABASE_PATH", str(db_file))
+    monkeypatch.setattr("app.app.idempotency_cache", IdempotencyCache(ttl=60, max_keys=3))
+    await init_db()
+    yield str(db_file)
+
+
+# Dummy request class to simulate a JSON POST to /api/lock.
+class DummyJSONRequest:
+    def __init__(self, data, key=None, remote="127.0.0.1"):
+        self._data = data
+        self.remote = remote
+        self.headers = {"Content-Type": "application/json"}
+        if key is not None:
+            self.headers["Idempotency-Key"] = key
+
+    async def json(self, loads=None):
+        return self._data
+
+
+async def lock(secret, key=None, remote="127.0.0.1"):
+    response = await api_lock_secret(DummyJSONRequest({"encrypted_secret": secret}, key, remote))
+    return response.status, json.loads(response.text)
+
+
+async def table_counts(test_db):
+    async with aiosqlite.connect(test_db, detect_types=sqlite3.PARSE_DECLTYPES) as db:
+        async with db.execute("SELECT COUNT(*) FROM secrets") as cursor:
+            (secrets,) = await cursor.fetchone()
+        async with db.execute("SELECT uses FROM ip_usage") as cursor:
+            uses = [row[0] for row in await cursor.fetchall()]
+    return secrets, uses
+
+
+@pytest.mark.asyncio
+async def test_replay_returns_original_code_without_charge(test_db):
+    status, first = await lock('{"dummy": "secret"}', key="retry-1")
+    assert status == 200
+    status, second = await lock('{"dummy": "secret"}', key="retry-1")
+    assert status == 200
+    assert second == first
+    assert await table_counts(test_db) == (1, [1])
+    assert app.app.idempotency_cache.replays == 1
+
+    # Without a key (or with another one) every request stores a new secret.
+    await lock('{"dummy": "secret"}')
+    await lock('{"dummy": "secret"}', key="retry-2")
+    assert await table_counts(test_db) == (3, [3])
+
+
+@pytest.mark.asyncio
+async def test_replay_is_not_refused_by_quota(test_db):
+    codes = [(await lock('{"dummy": "secret"}', key=f"key-{i}"))[1] for i in range(MAX_USES_QUOTA)]
+    status, _ = await lock('{"dummy": "secret"}', key="new-key")
+    assert status == 429
+    status, replay = await lock('{"dummy": "secret"}', key=f"key-{MAX_USES_QUOTA - 1}")
+    assert status == 200
+    assert replay == codes[-1]
+
+
+@pytest.mark.asyncio
+async def test_key_is_bound_to_client_and_secret(test_db):
+    _, first = await lock('{"dummy": "secret"}', key="shared")
+    status, other_client = await lock('{"dummy": "secret"}', key="shared", remote="10.0.0.1")
+    assert status == 200
+    assert other_client != first
+
+    status, result = await lock('{"dummy": "other"}', key="shared")
+    assert status == 422
+    assert "different secret" in result["error"]
+
+    status, result = await lock('{"dummy": "secret"}', key="no spaces allowed")
+    assert status == 400
+
+
+@pytest.mark.asyncio
+async def test_concurrent_retries_store_once(test_db):
+    results = await asyncio.gather(*(lock('{"dummy": "secret"}', key="burst") for _ in range(5)))
+    assert len({result["download_code"] for _, result in results}) == 1
+    assert await table_counts(test_db) == (1, [1])
+
+
+@pytest.mark.asyncio
+async def test_keys_expire_and_are_bounded(test_db, monkeypatch):
+    monkeypatch.setattr("app.app.MAX_USES_QUOTA", 10)
+    cache = app.app.idempotency_cache
+    for i in range(5):
+        await lock('{"dummy": "secret"}', key=f"key-{i}")
+    assert len(cache.entries) == 3
+
+    cache.entries.clear()
+    await lock('{"dummy": "secret"}', key="expiring")
+    ip = app.app.hash_ip("127.0.0.1")
+    assert cache.lookup(ip, "expiring") is not None
+    cache.entries[(ip, "expiring")][2] -= 61
+    assert cache.lookup(ip, "expiring") is None
@@ -0,0 +1,25 @@
+import json
+
+import pytest
+
+from app.app import json_dumps, json_loads, json_response, JSON_CODEC
+
+
+def test_codec_round_trip():
+    envelope = {"salt": "c2FsdA==", "iv": "aXY=", "ciphertext": "Y2lwaGVy" * 100}
+    assert json_loads(json_dumps(envelope)) == envelope
+    # Bytes and str input are both accepted, like request bodies and stored envelopes.
+    assert json_loads(json.dumps(envelope).encode()) == envelope
+    assert JSON_CODEC in ("orjson", "json")
+
+
+def test_codec_rejects_invalid_json():
+    with pytest.raises(ValueError):
+        json_loads("{not json")
+
+
+def test_json_response_uses_codec():
+    response = json_response({"secret": "æøå"}, status=201)
+    assert response.status == 201
+    assert response.content_type == "application/json"
+    assert json.loads(response.text) == {"secret": "æøå"}
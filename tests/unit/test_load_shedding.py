@@ -0,0 +1,139 @@
+import asyncio
+import json
+
+import pytest
+import pytest_asyncio
+from aiohttp import web
+
+import app.app
+from app.app import (
+    LoadShedder,
+    api_unlock_secret,
+    init_db,
+    load_shedding_middleware,
+    parse_priority_limits,
+    priority,
+)
+
+
+# Fixture to set up a temporary database.
+@pytest_asyncio.fixture
+async def test_db(tmp_path, monkeypatch):
+    db_file = tmp_path / "test.db"
+    monkeypatch.setattr("app.app.DATABASE_PATH", str(db_file))
+    await init_db()
+    yield str(db_file)
+
+
+def start(shedder, name):
+    shedder.started(name)
+    shedder.processing()
+
+
+def test_parse_priority_limits():
+    assert parse_priority_limits("low=8, normal=32,bogus=1") == {
+        "critical": 0,
+        "normal": 32,
+        "low": 8,
+    }
+
+
+def test_queue_depth_sheds_low_then_normal():
+    shedder = LoadShedder(limits="", latency_ms=1000, queue_depth=4)
+    for _ in range(4):
+        start(shedder, "critical")
+    # Requests still receiving their body do not count as load.
+    shedder.started("critical")
+    assert not shedder.admit("low")
+    assert shedder.admit("normal")
+    for _ in range(4):
+        start(shedder, "critical")
+    assert not shedder.admit("normal")
+    assert shedder.admit("critical")
+
+
+def test_latency_sheds_and_decays():
+    shedder = LoadShedder(limits="", latency_ms=100, queue_depth=0)
+    start(shedder, "critical")
+    shedder.average_latency = 0.15
+    assert not shedder.admit("low")
+    assert shedder.admit("normal")
+
+    # Without completed requests the average decays, so shedding stops on its own.
+    shedder.updated -= 10
+    assert shedder.admit("low")
+    shedder.finished("critical", 0.01)
+    assert shedder.average_latency < 0.01
+
+
+def test_per_class_limit():
+    shedder = LoadShedder(limits="low=1,critical=2", latency_ms=0, queue_depth=0)
+    start(shedder, "low")
+    assert not shedder.admit("low")
+    assert shedder.admit("normal")
+    start(shedder, "critical")
+    start(shedder, "critical")
+    assert not shedder.admit("critical")
+    shedder.finished("critical", 0.01)
+    assert shedder.admit("critical")
+
+
+@pytest.mark.asyncio
+async def test_middleware_sheds_with_fast_503(aiohttp_client, monkeypatch):
+    monkeypatch.setattr("app.app.load_shedder", LoadShedder(limits="low=1"))
+    release = asyncio.Event()
+
+    @priority("low")
+    async def poll(request):
+        await release.wait()
+        return web.Response(text="ok")
+
+    async def healthz(request):
+        return web.Response(text="ok")
+
+    application = web.Application(middlewares=[load_shedding_middleware])
+    application.router.add_get("/poll", poll)
+    application.router.add_get("/healthz", healthz)
+    client = await aiohttp_client(application)
+
+    first = asyncio.ensure_future(client.get("/poll"))
+    while app.app.load_shedder.in_flight["low"] == 0:
+        await asyncio.sleep(0.01)
+
+    resp = await client.get("/poll")
+    assert resp.status == 503
+    assert resp.headers["Retry-After"] == "1"
+    resp = await client.get("/poll", headers={"Content-Type": "application/json"})
+    assert (await resp.json())["error"].startswith("Server busy")
+    # Unclassified routes are never shed.
+    resp = await client.get("/healthz")
+    assert resp.status == 200
+
+    release.set()
+    assert (await first).status == 200
+
+
+@pytest.mark.asyncio
+async def test_slow_request_body_is_not_load(aiohttp_client, test_db, monkeypatch):
+    shedder = LoadShedder(limits="", latency_ms=100, queue_depth=4)
+    monkeypatch.setattr("app.app.load_shedder", shedder)
+    application = web.Application(middlewares=[load_shedding_middleware])
+    application.router.add_post("/api/unlock", api_unlock_secret)
+    client = await aiohttp_client(application)
+
+    body = json.dumps({"download_code": "abcdefabcdef", "key": "bogus"}).encode()
+
+    async def slow_body():
+        for byte in body:
+            await asyncio.sleep(0.01)
+            yield bytes([byte])
+
+    headers = {"Content-Type": "application/json"}
+    responses = await asyncio.gather(
+        *(client.post("/api/unlock", data=slow_body(), headers=headers) for _ in range(8))
+    )
+    assert [resp.status for resp in responses] == [404] * 8
+    # The requests took far longer than the threshold, but the server did not.
+    assert shedder.average_latency < 0.1
+    assert shedder.total_in_flight == 0
+    assert shedder.admit("low")
@@ -0,0 +1,40 @@
+import asyncio
+import logging
+import time
+
+import pytest
+
+from app.app import LoopMonitor, LOOP_LAG_SECONDS
+
+
+def block_the_loop(seconds):
+    time.sleep(seconds)
+
+
+@pytest.mark.asyncio
+async def test_blocking_call_is_reported_with_its_stack(caplog):
+    monitor = LoopMonitor(interval_ms=10, threshold_ms=50)
+    lag_samples = sum(LOOP_LAG_SECONDS.values.get((), [0])[:-1])
+    with caplog.at_level(logging.WARNING, logger="sharepass.loop"):
+        monitor.start()
+        try:
+            await asyncio.sleep(0.05)
+            block_the_loop(0.3)
+            await asyncio.sleep(0.05)
+        finally:
+            await monitor.stop()
+
+    # One report per stall, naming the blocking function.
+    assert monitor.blocked == 1
+    assert "Event loop blocked" in caplog.text
+    assert "block_the_loop" in caplog.text
+    assert sum(LOOP_LAG_SECONDS.values[()][:-1]) > lag_samples
+
+
+@pytest.mark.asyncio
+async def test_idle_loop_is_not_reported(caplog):
+    monitor = LoopMonitor(interval_ms=10, threshold_ms=100)
+    monitor.start()
+    await asyncio.sleep(0.2)
+    await monitor.stop()
+    assert monitor.blocked == 0
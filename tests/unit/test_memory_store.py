@@ -0,0 +1,134 @@
+import os
+import json
+import base64
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.app import (
+    MemoryStore,
+    StorageStats,
+    ip_reached_quota,
+    purge_expired,
+    store_secret,
+    unlock_secret_logic,
+    get_upload_time,
+    STORAGE_FULL_ERROR,
+    MAX_ATTEMPTS,
+    MAX_USES_QUOTA,
+    SECRET_EXPIRY_MINUTES,
+)
+
+from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+
+# Fixture to switch the app to a fresh memory store; no database is created.
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    memory_store = MemoryStore(max_bytes=10000, when_full="reject")
+    monkeypatch.setattr("app.app.STORAGE", "memory")
+    monkeypatch.setattr("app.app.memory_store", memory_store)
+    monkeypatch.setattr("app.app.storage_stats", StorageStats())
+    monkeypatch.setattr("app.app.DATABASE_PATH", str(tmp_path / "unused.db"))
+    yield memory_store
+    assert not (tmp_path / "unused.db").exists()
+
+
+def encrypt_secret_for_test(secret: str, key: str) -> str:
+    salt = os.urandom(16)
+    iv = os.urandom(12)
+    kdf = PBKDF2HMAC(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=salt,
+        iterations=100000,
+        backend=default_backend(),
+    )
+    aesgcm = AESGCM(kdf.derive(key.encode()))
+    ciphertext = aesgcm.encrypt(iv, secret.encode(), None)
+    return json.dumps(
+        {
+            "salt": base64.b64encode(salt).decode("utf-8"),
+            "iv": base64.b64encode(iv).decode("utf-8"),
+            "ciphertext": base64.b64encode(ciphertext).decode("utf-8"),
+        }
+    )
+
+
+@pytest.mark.asyncio
+async def test_unlock_is_one_time(store):
+    download_code, error = await store_secret(encrypt_secret_for_test("hello", "key"), "ip_hash")
+    assert error is None
+    assert await get_upload_time(download_code) is not None
+
+    success, result = await unlock_secret_logic(download_code, "key")
+    assert success
+    assert result == {"secret": "hello"}
+    assert store.secrets == {}
+    assert store.bytes == 0
+
+    success, result = await unlock_secret_logic(download_code, "key")
+    assert not success
+    assert result["status"] == 404
+
+
+@pytest.mark.asyncio
+async def test_wrong_key_counts_attempts(store):
+    download_code, _ = await store_secret(encrypt_secret_for_test("hello", "key"), "ip_hash")
+
+    for attempt in range(1, MAX_ATTEMPTS):
+        success, result = await unlock_secret_logic(download_code, "wrong")
+        assert not success
+        assert result["attempts_remaining"] == MAX_ATTEMPTS - attempt
+
+    success, result = await unlock_secret_logic(download_code, "wrong")
+    assert "Maximum attempts reached" in result["error"]
+    assert download_code not in store.secrets
+
+
+@pytest.mark.asyncio
+async def test_quota_is_counted_in_memory(store):
+    for _ in range(MAX_USES_QUOTA):
+        assert not await ip_reached_quota("ip_hash")
+        _, error = await store_secret('{"dummy": "secret"}', "ip_hash")
+        assert error is None
+    assert await ip_reached_quota("ip_hash")
+    assert not await ip_reached_quota("other_ip")
+
+
+@pytest.mark.asyncio
+async def test_purge_expired_removes_old_entries(store):
+    old = datetime.now() - timedelta(minutes=SECRET_EXPIRY_MINUTES + 1)
+    store.insert('{"dummy": "old"}', "oldcode12345", old, "old_ip")
+    download_code, _ = await store_secret('{"dummy": "new"}', "new_ip")
+
+    await purge_expired()
+
+    assert list(store.secrets) == [download_code]
+    assert list(store.ip_usage) == ["new_ip"]
+    assert store.bytes == store.entry_size('{"dummy": "new"}')
+
+
+@pytest.mark.asyncio
+async def test_full_store_rejects(store):
+    secret = "x" * 4000
+    assert (await store_secret(secret, "ip_hash"))[1] is None
+    assert (await store_secret(secret, "ip_hash"))[1] is None
+    download_code, error = await store_secret(secret, "ip_hash")
+    assert download_code is None
+    assert error == STORAGE_FULL_ERROR
+    assert store.rejected == 1
+    assert len(store.secrets) == 2
+
+
+def test_full_store_evicts_oldest():
+    store = MemoryStore(max_bytes=10000, when_full="evict")
+    now = datetime.now()
+    for index in range(3):
+        assert store.insert("x" * 4000, f"code{index:08d}", now, "ip_hash")
+    assert list(store.secrets) == ["code00000001", "code00000002"]
+    assert store.evicted == 1
+    assert store.bytes <= store.max_bytes
@@ -0,0 +1,106 @@
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import make_mocked_request
+
+from app.app import (
+    CallbackCounter,
+    Counter,
+    Histogram,
+    HTTP_REQUESTS,
+    DB_QUERY_SECONDS,
+    PURGED_ROWS,
+    connect_db,
+    init_db,
+    metrics,
+    client_allowed,
+    metrics_middleware,
+    parse_allowed_networks,
+    purge_expired,
+    render_metrics,
+)
+
+
+@pytest.fixture
+def test_db(tmp_path, monkeypatch):
+    db_file = tmp_path / "test.db"
+    monkeypatch.setattr("app.app.DATABASE_PATH", str(db_file))
+    return str(db_file)
+
+
+def test_counter_and_histogram_text_format():
+    counter = Counter("test_events_total", "Test events.", ("kind",))
+    counter.inc('a"b')
+    counter.inc('a"b', amount=2)
+    CallbackCounter("test_dropped_total", "Test drops.", lambda: 7)
+    histogram = Histogram("test_seconds", "Test latency.", buckets=(0.1, 1))
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+    histogram.observe(5)
+
+    text = render_metrics()
+    assert "# TYPE test_events_total counter" in text
+    assert 'test_events_total{kind="a\\"b"} 3' in text
+    assert "# TYPE test_dropped_total counter" in text
+    assert "test_dropped_total 7" in text
+    assert 'test_seconds_bucket{le="0.1"} 1' in text
+    assert 'test_seconds_bucket{le="1"} 2' in text
+    assert 'test_seconds_bucket{le="+Inf"} 3' in text
+    assert "test_seconds_count 3" in text
+    assert "test_seconds_sum 5.55" in text
+
+
+def test_client_allowed_only_direct_loopback():
+    networks = parse_allowed_networks("127.0.0.1,10.0.0.0/8")
+
+    local = make_mocked_request("GET", "/metrics").clone(remote="127.0.0.1")
+    assert client_allowed(local, networks)
+
+    proxied = make_mocked_request(
+        "GET", "/metrics", headers={"X-Forwarded-For": "127.0.0.1"}
+    ).clone(remote="127.0.0.1")
+    assert not client_allowed(proxied, networks)
+
+    remote = make_mocked_request("GET", "/metrics").clone(remote="192.0.2.1")
+    assert not client_allowed(remote, networks)
+
+
+@pytest.mark.asyncio
+async def test_middleware_records_route_pattern_and_status(aiohttp_client):
+    async def handler(request):
+        raise web.HTTPNotFound()
+
+    app = web.Application(middlewares=[metrics_middleware])
+    app.router.add_get("/unlock/{download_code}", handler)
+    app.router.add_get("/metrics", metrics)
+    client = await aiohttp_client(app)
+
+    before = HTTP_REQUESTS.values[("/unlock/{download_code}", "GET", 404)]
+    resp = await client.get("/unlock/abcdefabcdef")
+    assert resp.status == 404
+    assert HTTP_REQUESTS.values[("/unlock/{download_code}", "GET", 404)] == before + 1
+
+    resp = await client.get("/metrics")
+    assert resp.status == 200
+    text = await resp.text()
+    assert 'sharepass_http_requests_total{route="/unlock/{download_code}"' in text
+    # Download codes never end up in label values.
+    assert "abcdefabcdef" not in text
+
+
+@pytest.mark.asyncio
+async def test_database_and_purge_metrics(test_db):
+    await init_db()
+    selects = DB_QUERY_SECONDS.values.get(("select",), [0])[-2:]
+    async with connect_db() as db:
+        async with db.execute("SELECT 1") as cursor:
+            assert await cursor.fetchone() == (1,)
+        # Statements can also be awaited directly, as with aiosqlite.
+        cursor = await db.execute("SELECT 2")
+        assert await cursor.fetchone() == (2,)
+        await cursor.close()
+    assert DB_QUERY_SECONDS.values[("select",)][-2:] != selects
+
+    purged = PURGED_ROWS.values[("secrets",)]
+    await purge_expired()
+    assert PURGED_ROWS.values[("secrets",)] == purged
+    assert "sharepass_purge_duration_seconds_count" in render_metrics()
@@ -1,7 +1,15 @@
 import pytest
 from aiohttp import web
 
-from app.app import security_headers_middleware, HTTPS_ONLY, ANALYTICS_SCRIPT_CSP
+from app.app import (
+    security_headers_middleware,
+    build_security_headers,
+    HTTPS_ONLY,
+    ANALYTICS_SCRIPT_CSP,
+    CSP_NONCE_MARKER,
+    PERMISSIONS_POLICY,
+    SECURITY_HEADERS_KEY,
+)
 
 
 @pytest.fixture
@@ -77,3 +85,48 @@ async def test_security_headers(aiohttp_client, minimal_app):
     assert "X-AspNet-Version" not in resp.headers, "X-AspNet-Version header should be removed"
     assert "X-Runtime" not in resp.headers, "X-Runtime header should be removed"
     assert "X-Version" not in resp.headers, "X-Version header should be removed"
+
+
+@pytest.mark.asyncio
+async def test_security_headers_nonce_substitution(aiohttp_client):
+    # A handler that sets a nonce the way the context processor does.
+    async def handler(request):
+        request["csp_nonce"] = "abc123"
+        return web.Response(text="<html></html>", content_type="text/html")
+
+    app = web.Application(middlewares=[security_headers_middleware])
+    app[SECURITY_HEADERS_KEY] = build_security_headers("https://stats.example.com", True)
+    app.router.add_get("/", handler)
+    client = await aiohttp_client(app)
+    resp = await client.get("/")
+
+    csp = resp.headers["Content-Security-Policy"]
+    assert "script-src 'self' 'nonce-abc123' https://stats.example.com;" in csp
+    assert CSP_NONCE_MARKER not in csp
+    assert resp.headers["Permissions-Policy"] == PERMISSIONS_POLICY
+    assert "Strict-Transport-Security" in resp.headers
+
+
+@pytest.mark.asyncio
+async def test_security_headers_json_gets_slim_set(aiohttp_client):
+    async def handler(request):
+        return web.json_response({"ok": True})
+
+    app = web.Application(middlewares=[security_headers_middleware])
+    app.router.add_get("/json", handler)
+    client = await aiohttp_client(app)
+    resp = await client.get("/json")
+
+    assert resp.headers["Content-Security-Policy"].startswith("default-src 'none'")
+    assert resp.headers["X-Content-Type-Options"] == "nosniff"
+    assert resp.headers["Referrer-Policy"] == "same-origin"
+    assert "Permissions-Policy" not in resp.headers
+
+
+def test_build_security_headers_without_nonce():
+    headers = build_security_headers()
+    assert headers["csp"] == (
+        "default-src 'self'; script-src 'self'; style-src 'self' 'unsafe-inline'; "
+        "font-src 'self'; img-src 'self' data:;"
+    )
+    assert "Strict-Transport-Security" not in headers["page"]
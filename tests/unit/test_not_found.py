@@ -0,0 +1,86 @@
+import base64
+import gzip
+import hashlib
+
+import jinja2
+import pytest
+from aiohttp import web
+
+from app.app import (
+    NOT_FOUND_KEY,
+    NotFoundResponses,
+    build_security_headers,
+    compression_middleware,
+    handle_404,
+    security_headers_middleware,
+)
+
+SCRIPT = "document.body.classList.add('dark');"
+
+
+def make_app(mode):
+    env = jinja2.Environment(
+        loader=jinja2.DictLoader(
+            {
+                "404.html": (
+                    "<html><body><p>Page not found</p>" + "<!-- padding -->" * 100
+                    + '<script nonce="{{ CSP_NONCE }}">' + SCRIPT + "</script></body></html>"
+                )
+            }
+        ),
+        autoescape=True,
+    )
+    app = web.Application(middlewares=[security_headers_middleware, compression_middleware])
+    app[NOT_FOUND_KEY] = NotFoundResponses.render(env, build_security_headers(), mode)
+    app.router.add_get("/{tail:.*}", handle_404)
+    return app
+
+
+@pytest.mark.asyncio
+async def test_browsers_get_prebuilt_page(aiohttp_client):
+    client = await aiohttp_client(make_app("auto"))
+    resp = await client.get(
+        "/wp-login.php", headers={"Accept": "text/html", "Accept-Encoding": "identity"}
+    )
+    assert resp.status == 404
+    body = await resp.text()
+    assert "Page not found" in body
+    assert "nonce" not in body
+    # The inline script is allowed by its hash instead of a nonce.
+    digest = base64.b64encode(hashlib.sha256(SCRIPT.encode()).digest()).decode()
+    assert f"'sha256-{digest}'" in resp.headers["Content-Security-Policy"]
+    assert resp.headers["X-Content-Type-Options"] == "nosniff"
+    assert resp.headers["Vary"] == "Accept, Accept-Encoding"
+
+
+@pytest.mark.asyncio
+async def test_page_is_precompressed(aiohttp_client):
+    client = await aiohttp_client(make_app("html"))
+    resp = await client.get("/.env", headers={"Accept-Encoding": "gzip"}, auto_decompress=False)
+    assert resp.status == 404
+    assert resp.headers["Content-Encoding"] == "gzip"
+    assert resp.headers.getall("Vary") == ["Accept-Encoding"]
+    assert b"Page not found" in gzip.decompress(await resp.read())
+
+
+@pytest.mark.asyncio
+async def test_other_clients_get_plain_text(aiohttp_client):
+    client = await aiohttp_client(make_app("auto"))
+    resp = await client.get("/.env", headers={"Accept": "*/*"})
+    assert resp.status == 404
+    assert await resp.text() == "404 Not Found\n"
+    assert resp.content_type == "text/plain"
+    assert resp.headers["Content-Security-Policy"] == "default-src 'none'; frame-ancestors 'self';"
+
+    client = await aiohttp_client(make_app("plain"))
+    resp = await client.get("/.env", headers={"Accept": "text/html"})
+    assert await resp.text() == "404 Not Found\n"
+
+
+@pytest.mark.asyncio
+async def test_head_has_no_body(aiohttp_client):
+    client = await aiohttp_client(make_app("auto"))
+    resp = await client.head("/wp-login.php", headers={"Accept": "text/html"})
+    assert resp.status == 404
+    assert int(resp.headers["Content-Length"]) > 0
+    assert await resp.read() == b""
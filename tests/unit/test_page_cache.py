@@ -0,0 +1,82 @@
+import pytest
+import jinja2
+
+from app.app import render_page, APP_KEY, PAGE_CACHE_KEY
+
+
+class CountingLoader(jinja2.DictLoader):
+    """DictLoader that counts how often templates are loaded."""
+
+    def __init__(self, mapping):
+        super().__init__(mapping)
+        self.loads = 0
+
+    def get_source(self, environment, template):
+        self.loads += 1
+        return super().get_source(environment, template)
+
+
+# Dummy request with a page cache, the way create_app configures it.
+class DummyRequest(dict):
+    def __init__(self, env, cache):
+        super().__init__()
+        self.config_dict = {APP_KEY: env, PAGE_CACHE_KEY: cache}
+
+
+@pytest.fixture
+def env():
+    loader = CountingLoader(
+        {
+            "page.html": (
+                "<p>{{ greeting }} {{ name }}</p>"
+                '<script nonce="{{ CSP_NONCE }}"></script>'
+            )
+        }
+    )
+    # cache_size=0 makes every get_template() call hit the loader
+    return jinja2.Environment(loader=loader, autoescape=True, cache_size=0)
+
+
+@pytest.mark.asyncio
+async def test_render_page_is_cached_with_fresh_nonce(env):
+    cache = {}
+    first = DummyRequest(env, cache)
+    second = DummyRequest(env, cache)
+
+    resp1 = await render_page(first, "page.html", {"greeting": "Hi"}, per_request={"name": "a"})
+    resp2 = await render_page(second, "page.html", {"greeting": "Hi"}, per_request={"name": "b"})
+
+    # The template is only rendered once for the same context.
+    assert env.loader.loads == 1
+    assert len(cache) == 1
+    assert f'nonce="{first["csp_nonce"]}"' in resp1.text
+    assert f'nonce="{second["csp_nonce"]}"' in resp2.text
+    assert first["csp_nonce"] != second["csp_nonce"]
+    assert "<p>Hi a</p>" in resp1.text
+    assert "<p>Hi b</p>" in resp2.text
+    assert resp1.content_type == "text/html"
+
+
+@pytest.mark.asyncio
+async def test_render_page_escapes_per_request_values(env):
+    request = DummyRequest(env, {})
+    response = await render_page(
+        request,
+        "page.html",
+        {"greeting": "Hi"},
+        status=404,
+        per_request={"name": "<script>[[sharepass:CSP_NONCE]]"},
+    )
+    assert response.status == 404
+    assert "&lt;script&gt;" in response.text
+    # Substituted values are never scanned for placeholders again.
+    assert "[[sharepass:CSP_NONCE]]" in response.text
+
+
+@pytest.mark.asyncio
+async def test_render_page_new_context_renders_again(env):
+    cache = {}
+    await render_page(DummyRequest(env, cache), "page.html", {"greeting": "Hi"})
+    await render_page(DummyRequest(env, cache), "page.html", {"greeting": "Hello"})
+    assert env.loader.loads == 2
+    assert len(cache) == 2
@@ -0,0 +1,67 @@
+import pstats
+
+import pytest
+from aiohttp import web
+
+from app.app import admin_profile, profile_on_signal, profiler, PROFILE_MAX_SECONDS
+
+
+@pytest.fixture
+def profile_app(tmp_path, monkeypatch):
+    monkeypatch.setattr("app.app.PROFILE_DIR", str(tmp_path / "profiles"))
+
+    async def not_found(request):
+        return web.Response(status=404)
+
+    monkeypatch.setattr("app.app.handle_404", not_found)
+    app = web.Application()
+    app.router.add_post("/admin/profile", admin_profile)
+    return app
+
+
+@pytest.mark.asyncio
+async def test_cpu_profile_is_written(aiohttp_client, profile_app):
+    client = await aiohttp_client(profile_app)
+    resp = await client.post("/admin/profile?kind=cpu&seconds=1")
+    assert resp.status == 202
+    data = await resp.json()
+
+    # Only one profile runs at a time.
+    resp = await client.post("/admin/profile?kind=memory&seconds=1")
+    assert resp.status == 409
+
+    await profiler.task
+    assert pstats.Stats(data["file"]).total_calls > 0
+
+
+@pytest.mark.asyncio
+async def test_memory_snapshot_is_written(aiohttp_client, profile_app):
+    client = await aiohttp_client(profile_app)
+    resp = await client.post("/admin/profile?kind=memory&seconds=1")
+    assert resp.status == 202
+    data = await resp.json()
+    await profiler.task
+    with open(data["file"]) as stream:
+        assert stream.readline().startswith("Total traced:")
+
+
+@pytest.mark.asyncio
+async def test_profile_rejects_bad_input_and_proxied_clients(aiohttp_client, profile_app):
+    client = await aiohttp_client(profile_app)
+    resp = await client.post("/admin/profile?kind=disk")
+    assert resp.status == 400
+    resp = await client.post("/admin/profile?seconds=100000")
+    assert resp.status == 400
+    resp = await client.post("/admin/profile", headers={"X-Forwarded-For": "127.0.0.1"})
+    assert resp.status == 404
+
+
+def test_signal_profile_duration_is_clamped(monkeypatch):
+    started = []
+    monkeypatch.setattr(profiler, "start", lambda kind, seconds: started.append(seconds))
+    monkeypatch.setattr(profiler, "task", None)
+    monkeypatch.setattr("app.app.PROFILE_SECONDS", 100000)
+    profile_on_signal("cpu")
+    monkeypatch.setattr("app.app.PROFILE_SECONDS", 0)
+    profile_on_signal("memory")
+    assert started == [PROFILE_MAX_SECONDS, 1]
@@ -0,0 +1,64 @@
+import os
+import json
+import subprocess
+import sys
+
+import pytest
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+# Generous cumulative import time budgets in milliseconds; override on slow machines
+APP_IMPORT_BUDGET_MS = float(os.getenv("APP_IMPORT_BUDGET_MS", 1500))
+CLI_IMPORT_BUDGET_MS = float(os.getenv("CLI_IMPORT_BUDGET_MS", 300))
+
+# Only needed once a request is served, so they must not load at import
+DEFERRED_MODULES = ("cryptography", "jinja2", "aiohttp_jinja2", "apscheduler")
+
+
+def import_times(module):
+    """Import `module` in a fresh interpreter with -X importtime; returns {name: cumulative ms}."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=PROJECT_ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(cumulative) / 1000
+    return times
+
+
+@pytest.mark.parametrize(
+    "module, budget_ms",
+    [("app.app", APP_IMPORT_BUDGET_MS), ("sharepass_cli", CLI_IMPORT_BUDGET_MS)],
+)
+def test_import_time_budget(module, budget_ms):
+    times = import_times(module)
+    loaded = [name for name in times if name.split(".")[0] in DEFERRED_MODULES]
+    assert not loaded, f"{module} imports {loaded} at import time"
+    assert times[module] < budget_ms, f"importing {module} took {times[module]:.0f} ms"
+
+
+def test_app_import_has_no_side_effects():
+    # Record file opens and directory creation while importing the app. Libraries may
+    # read system files (aiohttp loads /etc/mime.types), but nothing of the app's own.
+    script = (
+        "import builtins, json, os\n"
+        "opened, created = [], []\n"
+        "real_open, real_makedirs = builtins.open, os.makedirs\n"
+        "builtins.open = lambda file, *a, **k: opened.append(str(file)) or real_open(file, *a, **k)\n"
+        "os.makedirs = lambda name, *a, **k: created.append(name) or real_makedirs(name, *a, **k)\n"
+        "import app.app\n"
+        "print(json.dumps([opened, created]))\n"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", script], cwd=PROJECT_ROOT, capture_output=True, text=True, check=True
+    )
+    opened, created = json.loads(result.stdout)
+    assert [path for path in opened if path.startswith(PROJECT_ROOT) or "VERSION" in path] == []
+    assert created == []
@@ -0,0 +1,85 @@
+import gzip
+import json
+
+import pytest
+from aiohttp import web
+
+from app.app import (
+    asset_url,
+    load_asset_manifest,
+    setup_static_assets,
+    IMMUTABLE_CACHE_CONTROL,
+    REVALIDATE_CACHE_CONTROL,
+)
+
+
+@pytest.fixture
+def static_dir(tmp_path):
+    # Lay out a static folder the way build-assets.js leaves it.
+    static = tmp_path / "static"
+    (static / "css").mkdir(parents=True)
+    (static / "dist" / "css").mkdir(parents=True)
+    css = b"body { color: black; }" * 50
+    (static / "css" / "main.css").write_bytes(css)
+    (static / "dist" / "css" / "main.0123456789ab.css").write_bytes(css)
+    (static / "dist" / "css" / "main.0123456789ab.css.gz").write_bytes(gzip.compress(css))
+    (static / "dist" / "manifest.json").write_text(
+        json.dumps({"css/main.css": "dist/css/main.0123456789ab.css"})
+    )
+    return str(static)
+
+
+@pytest.fixture
+def static_app(static_dir):
+    app = web.Application()
+    setup_static_assets(app, static_dir)
+    return app
+
+
+def test_asset_url_resolves_through_manifest(static_dir):
+    manifest = load_asset_manifest(static_dir)
+    assert asset_url(manifest, "css/main.css") == "/static/dist/css/main.0123456789ab.css"
+    # Assets missing from the manifest fall back to their plain path.
+    assert asset_url(manifest, "favicon.png") == "/static/favicon.png"
+
+
+def test_missing_manifest_is_empty(tmp_path):
+    assert load_asset_manifest(str(tmp_path)) == {}
+
+
+@pytest.mark.asyncio
+async def test_hashed_asset_is_immutable_and_precompressed(aiohttp_client, static_app):
+    client = await aiohttp_client(static_app)
+    resp = await client.get(
+        "/static/dist/css/main.0123456789ab.css",
+        headers={"Accept-Encoding": "gzip"},
+        auto_decompress=False,
+    )
+    assert resp.status == 200
+    assert resp.headers["Cache-Control"] == IMMUTABLE_CACHE_CONTROL
+    assert resp.headers["Content-Encoding"] == "gzip"
+    assert resp.headers["Content-Type"] == "text/css"
+    assert "ETag" in resp.headers
+
+
+@pytest.mark.asyncio
+async def test_unhashed_asset_revalidates(aiohttp_client, static_app):
+    client = await aiohttp_client(static_app)
+    resp = await client.get("/static/css/main.css")
+    assert resp.status == 200
+    assert resp.headers["Cache-Control"] == REVALIDATE_CACHE_CONTROL
+
+    # A matching ETag gives a 304 without a body.
+    resp = await client.get(
+        "/static/css/main.css", headers={"If-None-Match": resp.headers["ETag"]}
+    )
+    assert resp.status == 304
+
+
+@pytest.mark.asyncio
+async def test_unknown_static_file_is_404(aiohttp_client, static_app):
+    client = await aiohttp_client(static_app)
+    resp = await client.get("/static/../app.py")
+    assert resp.status == 404
+    resp = await client.get("/static/css/missing.css")
+    assert resp.status == 404
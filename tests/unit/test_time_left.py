@@ -47,6 +47,12 @@ async def test_time_left_available(test_db):
     assert "hours_left" in data, "Expected 'hours_left' in response"
     assert "minutes_left" in data, "Expected 'minutes_left' in response"
     assert data.get("message") == "The secret is available", "Unexpected message returned"
+    expected_expiry = now + timedelta(minutes=SECRET_EXPIRY_MINUTES)
+    assert data.get("expires_at") == int(expected_expiry.timestamp())
+    # The answer is cacheable until the minute rolls over.
+    cache_control = response.headers.get("Cache-Control", "")
+    assert cache_control.startswith("private, max-age=")
+    assert 1 <= int(cache_control.split("=")[1]) <= 60
 
 
 @pytest.mark.asyncio
@@ -69,6 +75,7 @@ async def test_time_left_expired(test_db):
     assert response.status == 410, f"Expected 410 for expired secret, got {response.status}"
     data = json.loads(response.text)
     assert data.get("message") == "The secret has already expired.", "Unexpected expiry message"
+    assert "max-age" in response.headers.get("Cache-Control", "")
 
 
 @pytest.mark.asyncio
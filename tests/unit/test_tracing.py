@@ -0,0 +1,96 @@
+import os
+import json
+import base64
+import logging
+
+import pytest
+
+from app.app import (
+    current_span,
+    init_db,
+    span,
+    store_secret,
+    trace,
+    unlock_secret_logic,
+)
+
+from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+
+@pytest.fixture
+def test_db(tmp_path, monkeypatch):
+    db_file = tmp_path / "test.db"
+    monkeypatch.setattr("app.app.DATABASE_PATH", str(db_file))
+    return str(db_file)
+
+
+# Helper function to mimic the encryption logic.
+def encrypt_secret_for_test(secret: str, key: str) -> str:
+    salt = os.urandom(16)
+    iv = os.urandom(12)
+    kdf = PBKDF2HMAC(
+        algorithm=hashes.SHA256(), length=32, salt=salt, iterations=100000, backend=default_backend()
+    )
+    ciphertext = AESGCM(kdf.derive(key.encode())).encrypt(iv, secret.encode(), None)
+    return json.dumps(
+        {
+            "salt": base64.b64encode(salt).decode(),
+            "iv": base64.b64encode(iv).decode(),
+            "ciphertext": base64.b64encode(ciphertext).decode(),
+        }
+    )
+
+
+def test_span_without_trace_is_noop():
+    with span("orphan") as orphan:
+        assert orphan is None
+    assert current_span.get() is None
+
+
+def test_slow_trace_is_logged(monkeypatch, caplog):
+    monkeypatch.setattr("app.app.TRACE_SLOW_REQUEST_MS", 0.000001)
+    with caplog.at_level(logging.WARNING, logger="sharepass.trace"):
+        with trace("GET /", route="/") as root:
+            with span("outer"):
+                with span("inner", rows=3):
+                    pass
+    assert current_span.get() is None
+    assert [child.name for child in root.children] == ["outer"]
+    assert root.children[0].children[0].attributes == {"rows": 3}
+    assert "Slow GET /" in caplog.text
+    assert "    inner" in caplog.text
+
+
+def test_fast_trace_is_exported_when_sampled(monkeypatch, tmp_path, caplog):
+    export_file = tmp_path / "traces.jsonl"
+    monkeypatch.setattr("app.app.TRACE_SLOW_REQUEST_MS", 60000)
+    monkeypatch.setattr("app.app.TRACE_EXPORT_FILE", str(export_file))
+    monkeypatch.setattr("app.app.TRACE_EXPORT_SAMPLE_RATE", 1.0)
+    with trace("purge_expired"):
+        with span("db.delete"):
+            pass
+    assert "Slow" not in caplog.text
+
+    exported = json.loads(export_file.read_text())
+    spans = exported["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    assert [s["name"] for s in spans] == ["purge_expired", "db.delete"]
+    assert spans[1]["parentSpanId"] == spans[0]["spanId"]
+    assert spans[0]["traceId"] == spans[1]["traceId"]
+
+
+@pytest.mark.asyncio
+async def test_unlock_phases_are_traced(test_db):
+    await init_db()
+    download_code, error = await store_secret(encrypt_secret_for_test("hello", "key"), "ip_hash")
+    assert error is None
+
+    with trace("POST /api/unlock") as root:
+        success, result = await unlock_secret_logic(download_code, "key")
+    assert success
+    names = [node.name for _, node in root.iter_spans()]
+    assert names[1] == "unlock_secret_logic"
+    for phase in ("db.connect", "db.select", "kdf", "decrypt", "db.delete", "db.commit"):
+        assert phase in names
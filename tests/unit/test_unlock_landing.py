@@ -1,11 +1,11 @@
 import pytest
 import sqlite3
-from datetime import datetime
+from datetime import datetime, timedelta
 import pytest_asyncio
 import aiosqlite
 import jinja2
 
-from app.app import unlock_secret_landing, init_db, APP_KEY
+from app.app import unlock_secret_landing, init_db, APP_KEY, SECRET_EXPIRY_MINUTES
 
 
 # Dummy request class that provides the minimal attributes required by aiohttp_jinja2.
@@ -21,7 +21,10 @@ class DummyRequest:
         env = jinja2.Environment(
             loader=jinja2.DictLoader(
                 {
-                    "download.html": "<html><body>Download Page: {{ download_code }}</body></html>",
+                    "download.html": (
+                        "<html><body>Download Page: {{ download_code }} "
+                        "expires_at={{ expires_at }}</body></html>"
+                    ),
                     "404.html": "<html><body>404 Not Found</body></html>",
                 }
             )
@@ -61,6 +64,9 @@ async def test_unlock_secret_landing_found(test_db):
     content = response.text
     assert "Download Page:" in content, "Expected the download page to be rendered."
     assert download_code in content, "The download code should appear in the rendered page."
+    # The absolute expiry time is embedded for the client-side countdown.
+    expires_at = int((now + timedelta(minutes=SECRET_EXPIRY_MINUTES)).timestamp() * 1000)
+    assert f"expires_at={expires_at}" in content
 
 
 @pytest.mark.asyncio
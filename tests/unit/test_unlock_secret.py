@@ -8,7 +8,8 @@ import pytest
 import pytest_asyncio
 import aiosqlite
 
-from app.app import unlock_secret, init_db, MAX_ATTEMPTS
+import app.app
+from app.app import unlock_secret, unlock_secret_logic, init_db, AttemptCounter, MAX_ATTEMPTS
 
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 from cryptography.hazmat.primitives import hashes
@@ -21,6 +22,7 @@ from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 async def test_db(tmp_path, monkeypatch):
     db_file = tmp_path / "test.db"
     monkeypatch.setattr("app.app.DATABASE_PATH", str(db_file))
+    monkeypatch.setattr("app.app.attempt_counter", AttemptCounter())
     await init_db()
     yield str(db_file)
 
@@ -54,7 +56,7 @@ class DummyJSONRequest:
         self.remote = "127.0.0.1"  # Provide a dummy IP.
         self.headers = {"Content-Type": "application/json"}  # Required for Content-Type validation
 
-    async def json(self):
+    async def json(self, loads=None):
         return self._data
 
 
@@ -141,7 +143,8 @@ async def test_unlock_secret_wrong_key(test_db):
         result.get("attempts_remaining") == expected_remaining
     ), f"Expected remaining attempts {expected_remaining}, got {result.get('attempts_remaining')}"
 
-    # Verify that the attempts count was updated in the database.
+    # Verify that the attempts count is written to the database on the next flush.
+    await app.app.attempt_counter.flush()
     async with aiosqlite.connect(test_db, detect_types=sqlite3.PARSE_DECLTYPES) as db:
         async with db.execute(
             "SELECT attempts FROM secrets WHERE download_code=?", (download_code,)
@@ -150,3 +153,61 @@ async def test_unlock_secret_wrong_key(test_db):
     assert row is not None, "Secret record should still exist after wrong attempt."
     attempts_in_db = row[0]
     assert attempts_in_db == 1, f"Expected attempts count 1, got {attempts_in_db}"
+
+
+async def insert_secret(test_db, download_code, key):
+    async with aiosqlite.connect(test_db, detect_types=sqlite3.PARSE_DECLTYPES) as db:
+        await db.execute(
+            "INSERT INTO secrets (id, secret, attempts, download_code, upload_time) VALUES (?, ?, ?, ?, ?)",
+            (download_code, encrypt_secret_for_test("secret", key), 0, download_code, datetime.now()),
+        )
+        await db.commit()
+
+
+async def stored_attempts(test_db, download_code):
+    async with aiosqlite.connect(test_db) as db:
+        async with db.execute(
+            "SELECT attempts FROM secrets WHERE download_code=?", (download_code,)
+        ) as cursor:
+            row = await cursor.fetchone()
+    return row and row[0]
+
+
+@pytest.mark.asyncio
+async def test_failed_attempts_are_written_behind(test_db):
+    await insert_secret(test_db, "batchcode123", "key")
+
+    for attempt in range(1, MAX_ATTEMPTS):
+        success, result = await unlock_secret_logic("batchcode123", "wrong")
+        assert result["attempts_remaining"] == MAX_ATTEMPTS - attempt
+    # Counted in memory only, until the next flush
+    assert await stored_attempts(test_db, "batchcode123") == 0
+    await app.app.attempt_counter.flush()
+    assert await stored_attempts(test_db, "batchcode123") == MAX_ATTEMPTS - 1
+    assert app.app.attempt_counter.counts == {}
+
+    # The last attempt deletes the secret right away.
+    success, result = await unlock_secret_logic("batchcode123", "wrong")
+    assert "Maximum attempts reached" in result["error"]
+    assert await stored_attempts(test_db, "batchcode123") is None
+
+
+@pytest.mark.asyncio
+async def test_failed_attempts_sync_mode(test_db, monkeypatch):
+    monkeypatch.setattr("app.app.ATTEMPTS_DURABILITY", "sync")
+    await insert_secret(test_db, "synccode1234", "key")
+
+    await unlock_secret_logic("synccode1234", "wrong")
+    assert await stored_attempts(test_db, "synccode1234") == 1
+    assert not app.app.attempt_counter.dirty
+
+
+@pytest.mark.asyncio
+async def test_failed_flush_stays_pending(test_db, monkeypatch):
+    await insert_secret(test_db, "failcode1234", "key")
+    await unlock_secret_logic("failcode1234", "wrong")
+    monkeypatch.setattr("app.app.DATABASE_PATH", "/nonexistent/dir/test.db")
+
+    with pytest.raises(sqlite3.OperationalError):
+        await app.app.attempt_counter.flush()
+    assert app.app.attempt_counter.dirty == {"failcode1234"}